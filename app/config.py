@@ -1,17 +1,23 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
 import json
 
 class Settings(BaseSettings):
     # Database settings
-    DATABASE_URL: str = "sqlite:///./license_system.db"
+    DATABASE_URL: str = "sqlite:///./license_system.db"  # postgresql://... for multi-node deployments
+    DATABASE_POOL_MIN_SIZE: int = 1  # Postgres only; per worker process
+    DATABASE_POOL_MAX_SIZE: int = 10
     
     # Supabase settings
-    SUPABASE_URL: str
-    SUPABASE_KEY: str
+    SUPABASE_URL: str = ""  # Unused; kept so existing .env files still load
+    SUPABASE_KEY: str = ""
     
     # Shopify settings
     SHOPIFY_WEBHOOK_SECRET: str
     SHOPIFY_SHOP_DOMAIN: str
+    WEBHOOK_MAX_BODY_BYTES: int = 1048576  # Larger webhook bodies are rejected with 413
+    WEBHOOK_RECENT_IDS_CACHE_SIZE: int = 100000  # Webhook ids remembered in memory to answer replays
+    WEBHOOK_RECENT_IDS_TTL_SECONDS: float = 172800.0  # Shopify retries a delivery for up to 48 hours
     
     # Email settings
     SMTP_HOST: str
@@ -19,7 +25,76 @@ class Settings(BaseSettings):
     SMTP_USERNAME: str
     SMTP_PASSWORD: str
     SMTP_FROM_EMAIL: str
+    SMTP_POOL_MAX_CONNECTIONS: int = 4
+    SMTP_POOL_MAX_MESSAGES_PER_CONNECTION: int = 100
+    SMTP_POOL_KEEPALIVE_SECONDS: float = 30  # NOOP-check sessions idle longer than this
+    EMAIL_MAX_ATTEMPTS: int = 3
+    EMAIL_RETRY_BASE_DELAY: float = 1.0
+    EMAIL_RETRY_MAX_DELAY: float = 30.0
+    EMAIL_SEND_TIMEOUT: float = 30.0  # Deadline for a single send attempt
+    EMAIL_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    EMAIL_CIRCUIT_RESET_SECONDS: float = 60.0
+
+    # Email outbox
+    OUTBOX_CONCURRENCY: int = 4
+    OUTBOX_POLL_SECONDS: float = 1.0
+    OUTBOX_LEASE_SECONDS: float = 300.0  # A 'sending' row is retried after this
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_RETRY_BASE_DELAY: float = 30.0
+    OUTBOX_RETRY_MAX_DELAY: float = 3600.0
     
+    # Order processing
+    ORDER_CATEGORY_CONCURRENCY: int = 4  # Categories of one order notified in parallel
+
+    # Key reservations (the TTL must outlast the in-progress and backorder notify leases)
+    KEY_RESERVATION_TTL_SECONDS: float = 1800.0  # Claimed keys are held until their email is sent
+    RESERVATION_SWEEP_INTERVAL_SECONDS: float = 60.0
+    RESERVATION_SWEEP_BATCH_SIZE: int = 500  # Expired reservations settled per batch
+
+    # Backorders
+    BACKORDERS_ENABLED: bool = True  # Queue out-of-stock order lines and fill them on restock
+    BACKORDER_BATCH_SIZE: int = 100  # Backorders fulfilled per transaction
+    BACKORDER_POLL_SECONDS: float = 30.0  # Also picks up keys added by other workers
+    BACKORDER_NOTIFY_LEASE_SECONDS: float = 300.0  # Re-queue emails for fills a dead worker never sent
+
+    # Bulk resend of past license emails
+    RESEND_BATCH_SIZE: int = 200  # Ledger rows read per page
+    RESEND_RATE_PER_SECOND: float = 10.0  # Shared by all running resend jobs
+    RESEND_MAX_OUTBOX_DEPTH: int = 50  # Resends pause while this many emails are waiting to send
+    RESEND_MAX_JOBS: int = 20  # Finished jobs kept for status queries
+
+    # Order idempotency
+    IDEMPOTENCY_IN_PROGRESS_TTL_SECONDS: float = 300.0  # Stale in-progress claims can be taken over
+    IDEMPOTENCY_RETENTION_DAYS: float = 90.0
+    IDEMPOTENCY_COMPACT_INTERVAL_SECONDS: float = 3600.0
+
+    # License verification cache
+    VERIFY_CACHE_SIZE: int = 100000
+    VERIFY_CACHE_TTL_SECONDS: float = 300.0
+    VERIFY_NEGATIVE_CACHE_TTL_SECONDS: float = 30.0
+
+    # Inventory monitoring
+    LICENSE_LOW_WATERMARK: int = 10  # Default; a category may set "low_watermark" in LICENSE_CATEGORIES
+    LICENSE_CONSUMPTION_WINDOW_DAYS: int = 7  # Days averaged for the daily consumption rate
+    INVENTORY_CHECK_INTERVAL_SECONDS: float = 300.0
+    ADMIN_ALERT_EMAIL: str = ""  # Low-stock alerts are only logged when unset
+
+    # Signed (offline-verifiable) license keys
+    LICENSE_SIGNING_KEY: str = ""  # base64 Ed25519 seed; see app.utils.signed_keys.generate_signing_key
+    SIGNED_KEY_CATEGORIES: list = []  # Categories whose keys are minted at delivery instead of drawn from stock
+    REVOCATION_LIST_MAX_AGE_SECONDS: int = 300
+
+    # Bulk license import
+    LICENSE_IMPORT_BATCH_SIZE: int = 5000  # Keys committed per transaction
+    LICENSE_IMPORT_MAX_KEY_LENGTH: int = 256
+    LICENSE_IMPORT_MAX_REJECT_SAMPLES: int = 100
+    LICENSE_IMPORT_MAX_BYTES: int = 1073741824  # Uploads larger than this once inflated are rejected with 413
+
+    # Email templates
+    TEMPLATES_DIR: str = ""  # Defaults to app/templates
+    TEMPLATE_BYTECODE_CACHE_DIR: str = ""  # Defaults to the system temp dir
+    TEMPLATE_AUTO_RELOAD: bool = False  # Pick up template edits without a restart (dev)
+
     # License categories
     LICENSE_CATEGORIES: dict = {
         "basic": {"prefix": "BSC", "validity_days": 365},
@@ -29,7 +104,14 @@ class Settings(BaseSettings):
     
     # Product category mapping
     PRODUCT_CATEGORY_MAP: dict = {}
+    PRODUCT_CATEGORY_FILE: str = ""  # JSON mapping with variant/SKU/product/pattern rules; see app.services.category_resolver
+    PRODUCT_CATEGORY_RELOAD_SECONDS: float = 10.0  # How often the file is checked for changes
     
+    # Logging and tracing
+    LOG_FORMAT: str = "json"  # "json" (python-json-logger) or "text"
+    LOG_LEVEL: str = "INFO"
+    REQUEST_LOG_MIN_SECONDS: float = 0.25  # Only log the span breakdown of requests at least this slow (0 logs every request)
+
     # Admin API key
     ADMIN_API_KEY: str = "changeme"
     
@@ -44,3 +126,9 @@ class Settings(BaseSettings):
     
     class Config:
         env_file = ".env"
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """The process-wide Settings, so .env is parsed once per process."""
+    return Settings()
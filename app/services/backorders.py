@@ -0,0 +1,125 @@
+from typing import Optional, Dict
+import asyncio
+import logging
+from app.config import get_settings
+from app.services import email_service, outbox
+from app.services.verification import get_verifier
+from app.storage.idempotency_store import get_idempotency_store, BACKORDERED, DELIVERED
+from app.storage.key_store import get_key_store
+
+settings = get_settings()
+
+
+class BackorderDrainer:
+    """Fulfils queued backorders, oldest first, as stock arrives.
+
+    Woken by `notify` after keys are added in this process and polled every
+    `poll_seconds` for keys added by other workers. Claiming keys and
+    advancing the queue happen in one store transaction, so concurrent
+    drainers and imports cannot fill the same backorder twice. Once the
+    license email is queued the entry is marked notified; one claimed but
+    never notified (crash in between) is picked up again after
+    `notify_lease_seconds`.
+    """
+
+    def __init__(self, batch_size: int, poll_seconds: float, notify_lease_seconds: float):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.notify_lease_seconds = notify_lease_seconds
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.fulfilled = 0
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                logging.error(f"Backorder drain failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain(self) -> int:
+        """Fill every backorder current stock allows. Returns how many were filled."""
+        store = get_key_store()
+        for backorder in await store.unnotified_backorders(self.notify_lease_seconds):
+            await self._deliver(backorder)
+        filled = 0
+        for category in await store.backordered_categories():
+            while True:
+                batch = await store.fulfil_backorders(category, self.batch_size)
+                for backorder in batch:
+                    await self._deliver(backorder)
+                filled += len(batch)
+                if len(batch) < self.batch_size:
+                    break
+        if filled:
+            outbox.get_dispatcher().notify()
+            logging.info(f"Fulfilled {filled} backorder(s)")
+        self.fulfilled += filled
+        return filled
+
+    async def _deliver(self, backorder: Dict) -> None:
+        keys = backorder["license_keys"]
+        verifier = get_verifier()
+        for key in keys:
+            verifier.cache.invalidate(key)
+        await email_service.queue_license_email(
+            customer_email=backorder["customer_email"],
+            order_number=backorder["order_number"],
+            product_name=backorder["product_name"],
+            license_key=keys if len(keys) > 1 else keys[0],
+            category=backorder["category"]
+        )
+        store = get_key_store()
+        await store.mark_backorder_notified(backorder["id"])
+        waiting = await store.pending_backorders(backorder["order_number"])
+        await get_idempotency_store().add_keys(
+            backorder["order_number"],
+            {backorder["category"]: keys},
+            BACKORDERED if waiting else DELIVERED
+        )
+
+
+_drainer: Optional[BackorderDrainer] = None
+
+
+def get_drainer() -> BackorderDrainer:
+    global _drainer
+    if _drainer is None:
+        _drainer = BackorderDrainer(
+            batch_size=settings.BACKORDER_BATCH_SIZE,
+            poll_seconds=settings.BACKORDER_POLL_SECONDS,
+            notify_lease_seconds=settings.BACKORDER_NOTIFY_LEASE_SECONDS
+        )
+    return _drainer
+
+
+async def start_backorders() -> None:
+    get_drainer().start()
+
+
+async def stop_backorders() -> None:
+    global _drainer
+    if _drainer is not None:
+        await _drainer.stop()
+        _drainer = None
@@ -0,0 +1,152 @@
+from typing import Optional, List, Dict, Tuple, Pattern
+import fnmatch
+import json
+import logging
+import os
+import re
+from app.config import get_settings
+
+settings = get_settings()
+
+PATTERN_FIELDS = ("sku", "title", "product_id", "variant_id")
+
+
+class CategoryMap:
+    """One immutable, precomputed snapshot of the product -> category rules.
+
+    Rules are checked most specific first: variant id, SKU, product id, then
+    patterns in file order. A mapping file looks like::
+
+        {
+          "variants": {"4455": "enterprise"},
+          "skus": {"PRO-1Y": "pro"},
+          "products": {"1001": "basic"},
+          "patterns": [
+            {"field": "sku", "glob": "ENT-*", "category": "enterprise"},
+            {"field": "title", "regex": "(?i)pro", "category": "pro"}
+          ]
+        }
+    """
+
+    def __init__(self, data: Dict, version: str = ""):
+        self.version = version
+        self.variants = {str(k): v for k, v in data.get("variants", {}).items()}
+        self.skus = {str(k): v for k, v in data.get("skus", {}).items()}
+        self.products = {str(k): v for k, v in data.get("products", {}).items()}
+        self.patterns: List[Tuple[str, Pattern, str]] = []
+        for rule in data.get("patterns", []):
+            field = rule.get("field", "sku")
+            if field not in PATTERN_FIELDS:
+                raise ValueError(f"Unknown pattern field: {field}")
+            if "regex" in rule:
+                compiled = re.compile(rule["regex"])
+            else:
+                compiled = re.compile(fnmatch.translate(rule["glob"]))
+            self.patterns.append((field, compiled, rule["category"]))
+
+    def categories(self) -> set:
+        categories = {*self.variants.values(), *self.skus.values(), *self.products.values()}
+        categories.update(category for _, _, category in self.patterns)
+        return categories
+
+    def lookup(self, item: Dict) -> Optional[str]:
+        variant_id = item.get("variant_id")
+        if variant_id is not None and str(variant_id) in self.variants:
+            return self.variants[str(variant_id)]
+        sku = item.get("sku")
+        if sku and sku in self.skus:
+            return self.skus[sku]
+        product_id = str(item.get("product_id"))
+        if product_id in self.products:
+            return self.products[product_id]
+        for field, pattern, category in self.patterns:
+            value = item.get(field)
+            if value is not None and pattern.match(str(value)):
+                return category
+        return None
+
+
+def _fallback_category(product_id: str) -> str:
+    # Last-digit heuristic for products with no mapping.
+    if product_id.endswith('1'):
+        return "basic"
+    if product_id.endswith('2'):
+        return "pro"
+    return "enterprise"
+
+
+class CategoryResolver:
+    """Resolves Shopify line items to license categories.
+
+    The mapping is Settings.PRODUCT_CATEGORY_MAP (as product rules) overlaid
+    with PRODUCT_CATEGORY_FILE. `reload` builds a new CategoryMap and swaps
+    it in with a single assignment, so resolution never sees a half-loaded
+    mapping; a file that fails to parse leaves the current one in place.
+    """
+
+    def __init__(self, path: str = "", base_products: Optional[Dict] = None):
+        self.path = path
+        self.base_products = base_products or {}
+        self._map = CategoryMap({"products": self.base_products})
+        self._file_stamp = None
+        self.stats = {"resolved": 0, "fallback": 0, "reloads": 0, "reload_errors": 0}
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-read the mapping file if it changed. Returns True if swapped."""
+        if not self.path:
+            return False
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            if stamp == self._file_stamp and not force:
+                return False
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            data["products"] = {**self.base_products, **data.get("products", {})}
+            new_map = CategoryMap(data, version=f"{stamp[0]}")
+            unknown = new_map.categories() - set(settings.LICENSE_CATEGORIES) - set(self.base_products.values())
+            if unknown:
+                raise ValueError(f"Unknown categories: {', '.join(sorted(unknown))}")
+        except Exception as e:
+            self.stats["reload_errors"] += 1
+            logging.error(f"Category mapping reload from {self.path} failed: {str(e)}")
+            return False
+        self._map = new_map
+        self._file_stamp = stamp
+        self.stats["reloads"] += 1
+        return True
+
+    def resolve(self, item: Dict) -> str:
+        return self.resolve_order([item])[0]
+
+    def resolve_order(self, line_items: List[Dict]) -> List[str]:
+        """Categories for every line item, all from the same mapping snapshot."""
+        mapping = self._map
+        categories = []
+        for item in line_items:
+            category = mapping.lookup(item)
+            if category is None:
+                self.stats["fallback"] += 1
+                category = _fallback_category(str(item.get("product_id")))
+            categories.append(category)
+        self.stats["resolved"] += len(line_items)
+        return categories
+
+    def get_stats(self) -> Dict:
+        mapping = self._map
+        return {
+            **self.stats,
+            "version": mapping.version,
+            "rules": len(mapping.variants) + len(mapping.skus) + len(mapping.products) + len(mapping.patterns)
+        }
+
+
+_resolver: Optional[CategoryResolver] = None
+
+
+def get_category_resolver() -> CategoryResolver:
+    global _resolver
+    if _resolver is None:
+        _resolver = CategoryResolver(settings.PRODUCT_CATEGORY_FILE, settings.PRODUCT_CATEGORY_MAP)
+        _resolver.reload()
+    return _resolver
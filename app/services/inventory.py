@@ -0,0 +1,93 @@
+from typing import Optional, List, Dict, Iterable
+import logging
+from app.config import get_settings
+from app.services import email_service, outbox
+from app.storage.key_store import get_key_store
+
+settings = get_settings()
+
+
+def low_watermark(category: str) -> int:
+    return settings.LICENSE_CATEGORIES.get(category, {}).get("low_watermark", settings.LICENSE_LOW_WATERMARK)
+
+
+async def stock_report() -> Dict[str, Dict]:
+    """Stock, consumption rate and days-until-empty for every category.
+
+    Reads only the maintained counters, never the key table itself. Signed
+    categories (minted, not stocked) and categories never stocked have no
+    watermark or projection and are never low.
+    """
+    store = get_key_store()
+    stock = await store.stock()
+    window = settings.LICENSE_CONSUMPTION_WINDOW_DAYS
+    consumed = await store.consumption(window)
+    report = {}
+    for category in sorted({*settings.LICENSE_CATEGORIES, *stock}):
+        counts = stock.get(category, {"available": 0, "claimed": 0})
+        daily_rate = consumed.get(category, 0) / window
+        stocked = category in stock and category not in settings.SIGNED_KEY_CATEGORIES
+        report[category] = {
+            "available": counts["available"],
+            "claimed": counts["claimed"],
+            "low_watermark": low_watermark(category) if stocked else None,
+            "low": stocked and counts["available"] <= low_watermark(category),
+            "daily_rate": daily_rate,
+            "days_until_empty": counts["available"] / daily_rate if stocked and daily_rate else None
+        }
+    return report
+
+
+async def check_stock(categories: Optional[Iterable[str]] = None) -> List[str]:
+    """Alert once for each category that has dropped to its low watermark.
+
+    The alert re-arms when the category is restocked above the watermark.
+    Returns the categories alerted on by this call.
+    """
+    store = get_key_store()
+    report = await stock_report()
+    alerted = []
+    for category in (report if categories is None else categories):
+        stock = report.get(category)
+        if stock is None:
+            continue
+        if not stock["low"]:
+            await store.clear_low(category)
+            continue
+        if not await store.mark_low(category):
+            continue
+        alerted.append(category)
+        logging.warning(
+            f"License stock low for {category}: {stock['available']} left "
+            f"(watermark {stock['low_watermark']}, ~{stock['daily_rate']:.1f}/day)"
+        )
+        if settings.ADMIN_ALERT_EMAIL:
+            await email_service.queue_low_stock_email(settings.ADMIN_ALERT_EMAIL, category, stock)
+            outbox.get_dispatcher().notify()
+    return alerted
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+async def prometheus_metrics() -> str:
+    """Inventory gauges in the Prometheus text exposition format."""
+    report = await stock_report()
+    gauges = [
+        ("license_keys_available", "Unclaimed keys in inventory", "available"),
+        ("license_keys_claimed", "Keys issued to orders", "claimed"),
+        ("license_keys_low_watermark", "Stock level that triggers a low-stock alert", "low_watermark"),
+        ("license_keys_daily_consumption", "Keys claimed per day, averaged over the consumption window", "daily_rate"),
+        ("license_keys_days_until_empty", "Projected days until the category runs out", "days_until_empty")
+    ]
+    lines = []
+    for name, help_text, field in gauges:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for category, stock in report.items():
+            value = stock[field]
+            if value is None:
+                continue
+            lines.append(f'{name}{{category="{_label(category)}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -1,151 +1,184 @@
-from typing import Optional, List, Dict
-import os
-import json
-from app.config import Settings
+from typing import AsyncIterator, Optional, List, Dict
+import asyncio
+import hashlib
+import logging
+import time
+from app.config import get_settings
+from app.services.category_resolver import get_category_resolver
+from app.services.verification import get_verifier
+from app.storage.key_store import get_key_store
+from app.utils.concurrency import gather_bounded
+from app.utils.tracing import span
 
-settings = Settings()
-
-LICENSES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), '../licenses.json')
+settings = get_settings()
 
 async def get_product_category(product_id: str) -> str:
     """Determine license category based on product ID"""
-    category_map = settings.PRODUCT_CATEGORY_MAP
-    if not category_map or product_id not in category_map:
-        # Use simple product ID based logic as fallback
-        if product_id.endswith('1'):
-            category = "basic"
-        elif product_id.endswith('2'):
-            category = "pro"
-        else:
-            category = "enterprise"
-        return category
-    
-    category = category_map.get(product_id, "basic")
-    return category
+    return get_category_resolver().resolve({"product_id": product_id})
+
+async def resolve_order_categories(line_items: List[Dict]) -> List[str]:
+    """License category for each line item of an order, in one call."""
+    return get_category_resolver().resolve_order(line_items)
 
 async def generate_license_key(category: str, order_id: str, product_id: str) -> str:
-    """Pop and return the next license key from licenses.json for the given category."""
-    try:
-        if not os.path.exists(LICENSES_FILE):
-            raise Exception("License key file missing. Please contact support.")
-        with open(LICENSES_FILE, 'r+', encoding='utf-8') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                raise Exception("License key file is corrupted. Please contact support.")
-            keys = data.get(category, [])
-            if not keys:
-                raise Exception(f"No license keys left for category: {category}")
-            license_key = keys.pop(0)
-            data[category] = keys
-            f.seek(0)
-            f.truncate()
-            json.dump(data, f, indent=2)
-        return license_key
-    except Exception as e:
-        raise
-        
-    with open(get_license_file(category), 'w') as f:
-        json.dump(keys, f, indent=2)
-
-async def get_and_remove_license_key(product_id: str) -> Optional[str]:
-    """Get and remove a license key for a product"""
-    category = get_product_category(product_id)
-    
-    if IS_VERCEL:
-        # In Vercel, generate a key instead of loading from file
-        order_id = "VERCEL"  # This would normally come from the order
-        return f"{category.upper()}-{order_id}-{product_id[-4:]}"
-
-    keys = load_licenses(category)
-    
-    if not keys:
-        raise Exception(f"No license keys available for category: {category}")
-    
-    # Get and remove first available key
-    key = keys.pop(0)
-    save_licenses(category, keys)
-    return key
-
-def import_keys(category: str, new_keys: List[str]) -> None:
-    """Import new license keys for a category"""
-    if IS_VERCEL:
-        logger.info(f"Running in Vercel, skipping import for {category}")
-        return
-        
-    keys = load_licenses(category)
-    # Add only unique keys
-    keys.extend([key for key in new_keys if key not in keys])
-    save_licenses(category, keys)
-
-def get_available_count(category: str) -> int:
+    """Claim the next license key for the given category for an order."""
+    return await pop_license_key(category, order_id)
+
+async def get_available_count(category: str) -> int:
     """Get count of available licenses for a category"""
-    if IS_VERCEL:
-        return 999  # Mock unlimited keys in Vercel
-        
-    return len(load_licenses(category))
-
-def list_available_keys(category: str) -> List[str]:
-    """List all available license keys for a category"""
-    return load_licenses(category)
-
-def remove_key(key: str) -> bool:
-    """Remove a specific license key from all categories"""
-    if IS_VERCEL:
-        logger.info(f"Running in Vercel, skipping key removal for {key}")
-        return True
-        
-    for category in ["basic", "pro", "enterprise"]:
-        keys = load_licenses(category)
-        if key in keys:
-            keys.remove(key)
-            save_licenses(category, keys)
-            return True
-    return False
-
-async def pop_license_key(category: str) -> str:
-    try:
-        if not os.path.exists(LICENSES_FILE):
-            raise Exception("License key file missing. Please contact support.")
-        with open(LICENSES_FILE, 'r+', encoding='utf-8') as f:
-            try:
-                data = json.load(f)
-            except json.JSONDecodeError:
-                raise Exception("License key file is corrupted. Please contact support.")
-            keys = data.get(category, [])
-            if not keys:
-                raise Exception(f"No license keys left for category: {category}")
-            license_key = keys.pop(0)
-            data[category] = keys
-            f.seek(0)
-            f.truncate()
-            json.dump(data, f, indent=2)
-        return license_key
-    except Exception as e:
-        raise
-
-async def add_licenses(category: str, new_keys: list[str]):
-    """Add new license keys to a category in licenses.json."""
-    try:
-        if not os.path.exists(LICENSES_FILE):
-            data = {}
-        else:
-            with open(LICENSES_FILE, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    data = {}
-        keys = data.get(category, [])
-        # Add only unique keys
-        keys.extend([key for key in new_keys if key not in keys])
-        data[category] = keys
-        with open(LICENSES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
-        raise
+    return await get_key_store().count(category)
+
+async def pop_license_key(category: str, order_number: Optional[str] = None) -> str:
+    """Claim the oldest available license key for the given category."""
+    return await get_key_store().pop(category, order_number)
+
+async def claim_keys(order_number: str, quantities: Dict[str, int]) -> Dict[str, List[str]]:
+    """Claim every key an order needs in one batch.
+
+    Each category is all-or-nothing: it is either present in the result with
+    exactly the requested number of keys, or absent because stock ran short.
+    """
+    signed = {c: q for c, q in quantities.items() if c in settings.SIGNED_KEY_CATEGORIES}
+    stocked = {c: q for c, q in quantities.items() if c not in signed}
+    with span("license.claim_stock"):
+        claimed = await get_key_store().claim(order_number, stocked) if stocked else {}
+    minted = await gather_bounded(
+        (lambda c=category, q=quantity: issue_signed_keys(c, order_number, q) for category, quantity in signed.items()),
+        settings.ORDER_CATEGORY_CONCURRENCY
+    )
+    for category, keys in zip(signed, minted):
+        if isinstance(keys, Exception):
+            raise keys
+        claimed[category] = keys
+    verifier = get_verifier()
+    for keys in claimed.values():
+        for key in keys:
+            # Drop any negative cache entry from before the key was issued.
+            verifier.cache.invalidate(key)
+    return claimed
+
+_signer = None
+_revocation_list = None
+
+def get_signer():
+    global _signer
+    if _signer is None:
+        if not settings.LICENSE_SIGNING_KEY:
+            raise Exception("LICENSE_SIGNING_KEY is not configured")
+        from app.utils.signed_keys import LicenseSigner
+        _signer = LicenseSigner(settings.LICENSE_SIGNING_KEY)
+    return _signer
+
+def _category_prefix(category: str) -> str:
+    if category not in settings.LICENSE_CATEGORIES:
+        raise Exception(f"Unknown license category: {category}")
+    return settings.LICENSE_CATEGORIES[category]["prefix"]
+
+async def issue_signed_keys(category: str, order_number: str, quantity: int) -> List[str]:
+    """Mint signed keys for an order, embedding its id and expiry, and index them."""
+    validity_days = settings.LICENSE_CATEGORIES.get(category, {}).get("validity_days")
+    expires_at = time.time() + validity_days * 86400 if validity_days else None
+    with span("license.sign_keys"):
+        keys = get_signer().sign_batch(_category_prefix(category), quantity, order_number, expires_at)
+    with span("license.record_issued"):
+        await get_key_store().record_issued(category, keys, order_number)
+    return keys
+
+async def generate_signed_licenses(category: str, count: int) -> int:
+    """Pre-generate signed keys (no order id or expiry) into a category's inventory."""
+    prefix = _category_prefix(category)
+    added = 0
+    for start in range(0, count, 10000):
+        keys = await asyncio.to_thread(get_signer().sign_batch, prefix, min(10000, count - start))
+        added += await add_licenses(category, keys)
+    return added
+
+async def get_revocation_list() -> Dict:
+    """Sorted serials of revoked signed keys.
+
+    Rebuilt after a local revocation, and at least every
+    REVOCATION_LIST_MAX_AGE_SECONDS to pick up other workers' revocations.
+    """
+    global _revocation_list
+    if _revocation_list is None or time.time() - _revocation_list["generated_at"] > settings.REVOCATION_LIST_MAX_AGE_SECONDS:
+        from app.utils.signed_keys import build_revocation_list, decode_signed_key
+        decoded = (decode_signed_key(key) for key in await get_key_store().revoked_keys())
+        blob = build_revocation_list(d["serial"] for d in decoded if d is not None)
+        _revocation_list = {
+            "blob": blob,
+            "etag": hashlib.sha256(blob).hexdigest()[:32],
+            "generated_at": time.time()
+        }
+    return _revocation_list
+
+async def add_licenses(category: str, new_keys: list[str]) -> int:
+    """Add new license keys to a category, skipping keys already in the store."""
+    return await get_key_store().add(category, new_keys)
+
+async def import_licenses(
+    category: str,
+    chunks: AsyncIterator[bytes],
+    fmt: str = "lines",
+    column: str = "0",
+    gzipped: Optional[bool] = None
+) -> Dict:
+    """Stream an upload into a category's inventory, committing every
+    LICENSE_IMPORT_BATCH_SIZE keys.
+
+    Duplicates (of stored keys or earlier lines) are skipped by the store's
+    unique license_key index. Batches already committed stay committed if a
+    later part of the upload turns out to be malformed or too large.
+    """
+    from app.utils.key_import import KeyParser, iter_lines
+    parser = KeyParser(fmt, column, settings.LICENSE_IMPORT_MAX_KEY_LENGTH)
+    result = {"added": 0, "duplicates": 0, "rejected": 0, "batches": [], "rejects": []}
+
+    async def commit(batch: List[str]) -> None:
+        with span("license.import_batch"):
+            added = await add_licenses(category, batch)
+        result["added"] += added
+        result["duplicates"] += len(batch) - added
+        result["batches"].append({"batch": len(result["batches"]) + 1, "keys": len(batch), "added": added})
+        logging.info(f"License import {category}: batch {len(result['batches'])}, {result['added']} added so far")
+
+    batch = []
+    lines = iter_lines(
+        chunks, gzipped,
+        max_line_length=settings.LICENSE_IMPORT_MAX_KEY_LENGTH * 16,
+        max_bytes=settings.LICENSE_IMPORT_MAX_BYTES
+    )
+    async for line_no, line in lines:
+        try:
+            key = parser.parse(line)
+        except ValueError as e:
+            result["rejected"] += 1
+            if len(result["rejects"]) < settings.LICENSE_IMPORT_MAX_REJECT_SAMPLES:
+                result["rejects"].append({"line": line_no, "reason": str(e)})
+            continue
+        if key is None:
+            continue
+        batch.append(key)
+        if len(batch) >= settings.LICENSE_IMPORT_BATCH_SIZE:
+            await commit(batch)
+            batch = []
+    if batch:
+        await commit(batch)
+    return result
+
+async def add_backorder(order_number: str, category: str, quantity: int, customer_email: str, product_name: str) -> bool:
+    """Queue an order line that could not be filled; see app.services.backorders."""
+    return await get_key_store().add_backorder(order_number, category, quantity, customer_email, product_name)
 
 async def store_license_key(*args, **kwargs):
     return {"success": True}
 
 async def verify_license_key(license_key: str) -> Dict:
-    return {"success": True, "is_valid": True, "data": {"license_key": license_key}}
+    with span("license.verify"):
+        return await get_verifier().verify(license_key)
+
+async def revoke_license_key(license_key: str) -> bool:
+    global _revocation_list
+    revoked = await get_verifier().revoke(license_key)
+    if revoked:
+        _revocation_list = None
+    return revoked
@@ -0,0 +1,134 @@
+from typing import Optional, Set
+import asyncio
+import email
+import logging
+import time
+from app.config import get_settings
+from app.services import email_service, reservations
+from app.storage.outbox_store import get_outbox_store
+from app.utils.retry import backoff_delay
+
+settings = get_settings()
+
+
+class OutboxDispatcher:
+    """Drains the email outbox with at most `concurrency` sends in flight."""
+
+    def __init__(
+        self,
+        concurrency: int,
+        poll_seconds: float,
+        lease_seconds: float,
+        max_attempts: int,
+        retry_base_delay: float,
+        retry_max_delay: float
+    ):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._slots = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._in_flight: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        """Wake the dispatcher early, e.g. right after an enqueue."""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Let sends already handed to SMTP finish; anything cut short is
+        # still 'sending' in the store and is retried after its lease.
+        if self._in_flight:
+            await asyncio.wait(self._in_flight, timeout=self.lease_seconds)
+
+    async def _run(self) -> None:
+        store = get_outbox_store()
+        while True:
+            free = self.concurrency - len(self._in_flight)
+            batch = []
+            if free > 0:
+                try:
+                    batch = await store.claim_due(free, self.lease_seconds)
+                except Exception as e:
+                    logging.error(f"Outbox poll failed: {str(e)}")
+            for row in batch:
+                await self._slots.acquire()
+                task = asyncio.create_task(self._deliver(row))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+            if len(batch) < free:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            elif free <= 0:
+                # Wait for a send to finish. (Acquiring the semaphore does not
+                # yield when a slot is already free, which would spin here
+                # before the finished task's done-callback has run.)
+                await asyncio.wait(set(self._in_flight), return_when=asyncio.FIRST_COMPLETED)
+
+    async def _deliver(self, row: dict) -> None:
+        store = get_outbox_store()
+        try:
+            message = email.message_from_string(row["message"])
+            await email_service.send_email_with_retry(message, max_retries=1)
+        except Exception as e:
+            if row["attempts"] >= self.max_attempts:
+                retry_at = None
+                logging.error(f"Outbox message {row['id']} dead after {row['attempts']} attempts: {str(e)}")
+            else:
+                retry_at = time.time() + backoff_delay(row["attempts"], self.retry_base_delay, self.retry_max_delay)
+            await store.mark_failed(row["id"], str(e), retry_at)
+        else:
+            await store.mark_sent(row["id"])
+            if row["kind"] in reservations.LICENSE_KINDS:
+                try:
+                    await reservations.commit_delivery(row["id"])
+                except Exception as e:
+                    # The reservation sweeper commits it once the lease runs out.
+                    logging.error(f"Committing keys of outbox message {row['id']} failed: {str(e)}")
+        finally:
+            self._slots.release()
+
+
+_dispatcher: Optional[OutboxDispatcher] = None
+
+
+def get_dispatcher() -> OutboxDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = OutboxDispatcher(
+            concurrency=settings.OUTBOX_CONCURRENCY,
+            poll_seconds=settings.OUTBOX_POLL_SECONDS,
+            lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+            max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+            retry_base_delay=settings.OUTBOX_RETRY_BASE_DELAY,
+            retry_max_delay=settings.OUTBOX_RETRY_MAX_DELAY
+        )
+    return _dispatcher
+
+
+async def start_outbox() -> None:
+    get_dispatcher().start()
+
+
+async def stop_outbox() -> None:
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.stop()
+        _dispatcher = None
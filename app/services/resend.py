@@ -0,0 +1,193 @@
+from typing import Optional, List, Dict
+import asyncio
+import logging
+import time
+import uuid
+from app.config import get_settings
+from app.services import email_service, outbox
+from app.storage.ledger_store import get_ledger_store, EMAIL_STATUSES
+from app.storage.outbox_store import get_outbox_store
+from app.utils.concurrency import RateLimiter
+
+settings = get_settings()
+
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+class ResendJob:
+    """One bulk resend: its filters, progress counters and outcome."""
+
+    def __init__(self, filters: Dict, dry_run: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.filters = filters
+        self.dry_run = dry_run
+        self.state = RUNNING
+        self.cursor = 0  # Last ledger id handled
+        self.matched = 0
+        self.queued = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "filters": self.filters,
+            "dry_run": self.dry_run,
+            "matched": self.matched,
+            "queued": self.queued,
+            "failed": self.failed,
+            "cursor": self.cursor,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class ResendEngine:
+    """Re-delivers license emails for past orders, selected from the ledger.
+
+    A job streams matching issuances page by page, re-renders each page in
+    a worker thread and enqueues it in one transaction (skipping issuances
+    whose keys went back to stock meanwhile); the outbox dispatcher then
+    sends it with its usual retries. Live traffic is protected two ways:
+    all jobs share one `rate_per_second` budget, and a job pauses while the
+    outbox already holds `max_outbox_depth` unsent messages, so a fresh
+    order's email never queues behind more than that.
+    """
+
+    def __init__(self, batch_size: int, rate_per_second: float, max_outbox_depth: int, poll_seconds: float, max_jobs: int):
+        self.batch_size = batch_size
+        self.max_outbox_depth = max_outbox_depth
+        self.poll_seconds = poll_seconds
+        self.max_jobs = max_jobs
+        self._limiter = RateLimiter(rate_per_second)
+        # Enqueue at most about a second's worth at a time.
+        self._chunk = max(1, min(batch_size, int(rate_per_second) or batch_size))
+        self.jobs: Dict[str, ResendJob] = {}
+
+    def start(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        category: Optional[str] = None,
+        statuses: Optional[List[str]] = None,
+        dry_run: bool = False
+    ) -> ResendJob:
+        unknown = set(statuses or ()) - set(EMAIL_STATUSES)
+        if unknown:
+            raise ValueError(f"Unknown email status: {', '.join(sorted(unknown))}")
+        job = ResendJob(
+            {"since": since, "until": until, "category": category, "statuses": statuses or None}, dry_run
+        )
+        self._forget_finished()
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str) -> Optional[ResendJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.state != RUNNING:
+            return False
+        job.task.cancel()
+        return True
+
+    async def stop(self) -> None:
+        tasks = [job.task for job in self.jobs.values() if job.state == RUNNING]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _forget_finished(self) -> None:
+        finished = [job for job in self.jobs.values() if job.state != RUNNING]
+        for job in sorted(finished, key=lambda j: j.started_at)[:max(0, len(self.jobs) - self.max_jobs + 1)]:
+            del self.jobs[job.id]
+
+    async def _run(self, job: ResendJob) -> None:
+        ledger = get_ledger_store()
+        try:
+            while True:
+                page = await ledger.scan(job.cursor, self.batch_size, **job.filters)
+                if not page:
+                    break
+                job.matched += len(page)
+                if not job.dry_run:
+                    for start in range(0, len(page), self._chunk):
+                        await self._resend(job, page[start:start + self._chunk])
+                job.cursor = page[-1]["id"]
+            job.state = DONE
+        except asyncio.CancelledError:
+            job.state = CANCELLED
+            raise
+        except Exception as e:
+            job.state = FAILED
+            job.error = str(e)
+            logging.error(f"Resend job {job.id} failed: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            logging.info(f"Resend job {job.id} {job.state}: {job.matched} matched, {job.queued} queued, {job.failed} failed")
+
+    async def _resend(self, job: ResendJob, issuances: List[Dict]) -> None:
+        store = get_outbox_store()
+        while await store.depth() >= self.max_outbox_depth:
+            await asyncio.sleep(self.poll_seconds)
+        await self._limiter.wait(len(issuances))
+        # Rendering a page is CPU work; keep it off the event loop.
+        rendered = await asyncio.to_thread(_render, issuances)
+        job.failed += len(issuances) - len(rendered)
+        if not rendered:
+            return
+        queued = await get_ledger_store().enqueue_resends("license_resend", rendered)
+        job.queued += len(queued)
+        outbox.get_dispatcher().notify()
+
+
+def _render(issuances: List[Dict]) -> List[tuple]:
+    rendered = []
+    for issuance in issuances:
+        keys = issuance["license_keys"]
+        try:
+            message = email_service.build_license_email(
+                issuance["customer_email"],
+                issuance["order_number"],
+                issuance["product_name"],
+                keys if len(keys) > 1 else keys[0]
+            )
+        except Exception as e:
+            logging.error(f"Resend of issuance {issuance['id']} (order {issuance['order_number']}) failed to render: {str(e)}")
+            continue
+        rendered.append((issuance["id"], issuance["customer_email"], message.as_string()))
+    return rendered
+
+
+_engine: Optional[ResendEngine] = None
+
+
+def get_resend_engine() -> ResendEngine:
+    global _engine
+    if _engine is None:
+        _engine = ResendEngine(
+            batch_size=settings.RESEND_BATCH_SIZE,
+            rate_per_second=settings.RESEND_RATE_PER_SECOND,
+            max_outbox_depth=settings.RESEND_MAX_OUTBOX_DEPTH,
+            poll_seconds=settings.OUTBOX_POLL_SECONDS,
+            max_jobs=settings.RESEND_MAX_JOBS
+        )
+    return _engine
+
+
+async def stop_resends() -> None:
+    global _engine
+    if _engine is not None:
+        await _engine.stop()
+        _engine = None
@@ -0,0 +1,125 @@
+"""Key reservations: claimed keys stay leased to their order until the email
+carrying them is sent; the sweep settles leases that ran out."""
+from typing import Dict, List
+import logging
+from collections import defaultdict
+from app.config import get_settings
+from app.services import backorders
+from app.services.verification import get_verifier
+from app.storage.idempotency_store import get_idempotency_store, BACKORDERED, UNDELIVERED
+from app.storage.key_store import get_key_store
+from app.storage.ledger_store import get_ledger_store
+from app.storage.outbox_store import get_outbox_store
+
+settings = get_settings()
+
+# Outbox kinds whose delivery commits the keys they carry.
+LICENSE_KINDS = ("license", "license_resend")
+
+
+async def commit_delivery(outbox_id: int) -> int:
+    """Commit the reserved keys delivered by outbox message `outbox_id`."""
+    keys = [key for issuance in await get_ledger_store().for_outbox(outbox_id) for key in issuance["license_keys"]]
+    return await get_key_store().commit(keys) if keys else 0
+
+
+async def sweep() -> Dict[str, int]:
+    """Settle every expired reservation. Returns counts per outcome."""
+    store = get_key_store()
+    totals = {"committed": 0, "extended": 0, "released": 0}
+    while True:
+        expired = await store.expired_reservations(settings.RESERVATION_SWEEP_BATCH_SIZE)
+        if not expired:
+            break
+        for outcome, count in (await _settle(expired)).items():
+            totals[outcome] += count
+        if len(expired) < settings.RESERVATION_SWEEP_BATCH_SIZE:
+            break
+    if totals["released"]:
+        logging.warning(f"Returned {totals['released']} undelivered reserved key(s) to stock")
+    return totals
+
+
+async def _settle(expired: List[Dict]) -> Dict[str, int]:
+    """Commit sent, extend pending, and release and backorder undelivered reservations."""
+    store = get_key_store()
+    issuances = await get_ledger_store().for_orders({row["order_number"] for row in expired if row["order_number"]})
+    by_key = {
+        (issuance["order_number"], key): issuance
+        for issuance in issuances
+        for key in issuance["license_keys"]
+    }
+    commit, extend, undelivered = [], [], []
+    dead = set()  # Outbox ids of dead license emails
+    for row in expired:
+        issuance = by_key.get((row["order_number"], row["license_key"]))
+        status = issuance["email_status"] if issuance else None
+        if status == "sent":
+            commit.append(row["license_key"])
+        elif status in ("pending", "sending"):
+            extend.append(row["license_key"])
+        else:
+            if status == "dead":
+                dead.add(issuance["outbox_id"])
+            undelivered.append((row, issuance))
+
+    # Cancel dead letters before their keys go back, so a requeue cannot
+    # deliver stock keys. An email requeued or re-sent meanwhile keeps its keys.
+    cancelled = set(await get_outbox_store().cancel_dead(list(dead))) if dead else set()
+    expected = {}  # Issuance id -> outbox id
+    for row, issuance in undelivered:
+        if issuance is not None and not (issuance["outbox_id"] in dead and issuance["outbox_id"] not in cancelled):
+            expected[issuance["id"]] = issuance["outbox_id"]
+    released_issuances = set(await get_ledger_store().mark_released(expected)) if expected else set()
+    release: Dict[str, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))  # order -> category -> keys
+    requeue = {}  # Issuance id -> released issuance
+    for row, issuance in undelivered:
+        if issuance is None:
+            release[row["order_number"]][row["category"]].append(row["license_key"])
+        elif issuance["id"] in released_issuances:
+            requeue[issuance["id"]] = issuance
+        else:
+            extend.append(row["license_key"])
+
+    if commit:
+        await store.commit(commit)
+    if extend:
+        await store.extend_reservations(extend, settings.KEY_RESERVATION_TTL_SECONDS)
+    # Keys come off the order records before they return to stock, so keys
+    # a requeued backorder takes again are not removed once re-added.
+    removed = defaultdict(lambda: defaultdict(list))
+    for order_number, categories in release.items():
+        for category, keys in categories.items():
+            removed[order_number][category].extend(keys)
+    for issuance in requeue.values():
+        removed[issuance["order_number"]][issuance["category"]].extend(issuance["license_keys"])
+    orders = get_idempotency_store()
+    for order_number, categories in removed.items():
+        if order_number:
+            await orders.remove_keys(order_number, categories)
+
+    keys = [key for categories in release.values() for category_keys in categories.values() for key in category_keys]
+    released = await store.release(keys) if keys else 0
+    requeued = set()
+    for issuance in requeue.values():
+        keys.extend(issuance["license_keys"])
+        released += len(issuance["license_keys"])
+        if await store.requeue(
+            issuance["order_number"], issuance["category"], issuance["license_keys"],
+            issuance["customer_email"], issuance["product_name"]
+        ):
+            requeued.add(issuance["order_number"])
+    for order_number in requeued:
+        if await store.pending_backorders(order_number):
+            await orders.add_keys(order_number, {}, BACKORDERED)
+    if requeued:
+        backorders.get_drainer().notify()
+    for order_number in removed:
+        if order_number in requeued:
+            logging.warning(f"Order {order_number}: license email undelivered, keys returned to stock and the order backordered")
+        elif order_number:
+            logging.warning(f"Order {order_number}: license email undelivered, keys returned to stock; listed by GET /orders?status={UNDELIVERED}")
+    verifier = get_verifier()
+    for key in keys:
+        verifier.cache.invalidate(key)
+    return {"committed": len(commit), "extended": len(extend), "released": released}
@@ -0,0 +1,139 @@
+from typing import Optional, List
+import asyncio
+import ssl
+import time
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class _PooledConnection:
+    def __init__(self, smtp: "aiosmtplib.SMTP"):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """Bounded pool of logged-in SMTP sessions.
+
+    Sessions are reused across messages, health-checked with NOOP when they
+    have sat idle, and recycled after max_messages sends.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        password: str,
+        max_connections: int = 4,
+        max_messages: int = 100,
+        keepalive_seconds: float = 30,
+        timeout: float = 30
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_connections = max_connections
+        self.max_messages = max_messages
+        self.keepalive_seconds = keepalive_seconds
+        self.timeout = timeout
+        self._idle: List[_PooledConnection] = []
+        self._slots = asyncio.Semaphore(max_connections)
+        self._closed = False
+
+    async def _open(self) -> _PooledConnection:
+        import aiosmtplib  # Deferred so importing the app does not load the SMTP stack
+        use_tls = self.port == 465
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=use_tls,
+            tls_context=ssl.create_default_context(),
+            timeout=self.timeout
+        )
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password)
+        return _PooledConnection(smtp)
+
+    async def _discard(self, conn: _PooledConnection) -> None:
+        try:
+            if conn.smtp.is_connected:
+                await conn.smtp.quit()
+        except Exception:
+            conn.smtp.close()
+
+    async def _healthy(self, conn: _PooledConnection) -> bool:
+        if not conn.smtp.is_connected:
+            return False
+        if time.monotonic() - conn.last_used < self.keepalive_seconds:
+            return True
+        try:
+            await conn.smtp.noop()
+            return True
+        except Exception:
+            return False
+
+    async def _acquire(self) -> _PooledConnection:
+        while self._idle:
+            conn = self._idle.pop()
+            if await self._healthy(conn):
+                return conn
+            await self._discard(conn)
+        return await self._open()
+
+    async def _release(self, conn: _PooledConnection, broken: bool = False) -> None:
+        conn.last_used = time.monotonic()
+        if broken or self._closed or conn.sent >= self.max_messages:
+            await self._discard(conn)
+        else:
+            self._idle.append(conn)
+
+    async def send_message(self, message) -> None:
+        if self._closed:
+            raise Exception("SMTP pool is closed")
+        async with self._slots:
+            conn = await self._acquire()
+            try:
+                await conn.smtp.send_message(message)
+            except BaseException:
+                # Includes cancellation by a per-attempt deadline: the session
+                # is mid-transaction and cannot be reused.
+                conn.smtp.close()
+                raise
+            conn.sent += 1
+            await self._release(conn)
+
+    async def close(self) -> None:
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._discard(conn)
+
+
+_pool: Optional[SMTPPool] = None
+
+
+def get_smtp_pool() -> SMTPPool:
+    global _pool
+    if _pool is None:
+        _pool = SMTPPool(
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            username=settings.SMTP_USERNAME,
+            password=settings.SMTP_PASSWORD,
+            max_connections=settings.SMTP_POOL_MAX_CONNECTIONS,
+            max_messages=settings.SMTP_POOL_MAX_MESSAGES_PER_CONNECTION,
+            keepalive_seconds=settings.SMTP_POOL_KEEPALIVE_SECONDS
+        )
+    return _pool
+
+
+async def close_smtp_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,135 @@
+from typing import Optional, Dict, Tuple
+from collections import OrderedDict
+from datetime import datetime, timezone
+import time
+from app.config import get_settings
+from app.storage.key_store import get_key_store
+
+settings = get_settings()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a per-entry TTL."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_MISSING = object()
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+class LicenseVerifier:
+    """Answers /verify-license from the key store's license_key index.
+
+    Only issued keys verify (claimed, or reserved while their email is in
+    flight); keys still in inventory are reported as unknown. Known
+    records are cached for `ttl` seconds and unknown keys for
+    `negative_ttl`. Validity is re-evaluated against the clock on every
+    call, so a cached key still expires on time. Revocations made through
+    this verifier invalidate the cache immediately; ones made by another
+    worker are picked up within `ttl`.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(max_size)
+
+    async def _record(self, license_key: str) -> Optional[Dict]:
+        record = self.cache.get(license_key, _MISSING)
+        if record is not _MISSING:
+            return record
+        record = await get_key_store().lookup(license_key)
+        if record is None or record["status"] not in ("claimed", "reserved"):
+            self.cache.set(license_key, None, self.negative_ttl)
+            return None
+        validity_days = settings.LICENSE_CATEGORIES.get(record["category"], {}).get("validity_days")
+        issued_at = record["claimed_at"]
+        record = {
+            "license_key": license_key,
+            "category": record["category"],
+            "order_number": record["order_number"],
+            "issued_at": issued_at,
+            "expires_at": issued_at + validity_days * 86400 if validity_days else None,
+            "revoked_at": record["revoked_at"]
+        }
+        self.cache.set(license_key, record, self.ttl)
+        return record
+
+    async def verify(self, license_key: str) -> Dict:
+        record = await self._record(license_key)
+        if record is None:
+            return {"success": False, "is_valid": False, "data": {"license_key": license_key}}
+        expired = record["expires_at"] is not None and record["expires_at"] < time.time()
+        revoked = record["revoked_at"] is not None
+        return {
+            "success": True,
+            "is_valid": not expired and not revoked,
+            "data": {
+                "license_key": license_key,
+                "category": record["category"],
+                "order_number": record["order_number"],
+                "issued_at": _isoformat(record["issued_at"]),
+                "expires_at": _isoformat(record["expires_at"]),
+                "expired": expired,
+                "revoked": revoked,
+                "revoked_at": _isoformat(record["revoked_at"])
+            }
+        }
+
+    async def revoke(self, license_key: str) -> bool:
+        revoked = await get_key_store().revoke(license_key)
+        self.cache.invalidate(license_key)
+        return revoked
+
+    def stats(self) -> Dict:
+        return {"size": len(self.cache), "hits": self.cache.hits, "misses": self.cache.misses}
+
+
+_verifier: Optional[LicenseVerifier] = None
+
+
+def get_verifier() -> LicenseVerifier:
+    global _verifier
+    if _verifier is None:
+        _verifier = LicenseVerifier(
+            max_size=settings.VERIFY_CACHE_SIZE,
+            ttl=settings.VERIFY_CACHE_TTL_SECONDS,
+            negative_ttl=settings.VERIFY_NEGATIVE_CACHE_TTL_SECONDS
+        )
+    return _verifier
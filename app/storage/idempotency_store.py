@@ -0,0 +1,426 @@
+from typing import Optional, List, Dict, Iterable, Tuple, Union
+import asyncio
+import json
+import time
+from app.config import get_settings
+from app.storage.postgres_base import PostgresBase, is_postgres_url
+from app.storage.sqlite_base import SQLiteBase, sqlite_path
+
+settings = get_settings()
+
+IN_PROGRESS = "in_progress"
+DELIVERED = "delivered"
+PARTIAL = "partial"
+OUT_OF_STOCK = "out_of_stock"
+BACKORDERED = "backordered"  # Waiting on stock; completed by the backorder drainer
+UNDELIVERED = "undelivered"  # License email failed for good; its keys went back to stock
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_orders (
+    order_number TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    license_keys TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_processed_orders_updated ON processed_orders (updated_at);
+CREATE INDEX IF NOT EXISTS idx_processed_orders_status ON processed_orders (status, updated_at);
+CREATE TABLE IF NOT EXISTS processed_webhooks (
+    webhook_id TEXT PRIMARY KEY,
+    order_number TEXT NOT NULL,
+    received_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_processed_webhooks_received ON processed_webhooks (received_at);
+"""
+
+
+def _record(row) -> Dict:
+    return {
+        "order_number": row[0],
+        "status": row[1],
+        "license_keys": json.loads(row[2]),
+        "created_at": row[3],
+        "updated_at": row[4]
+    }
+
+
+def _without(record: Dict, license_keys: Dict[str, List[str]]):
+    """The record's keys minus `license_keys`, and the order's resulting status."""
+    remaining = {}
+    for category, keys in record["license_keys"].items():
+        removed = set(license_keys.get(category, ()))
+        kept = [key for key in keys if key not in removed]
+        if kept:
+            remaining[category] = kept
+    return remaining, (PARTIAL if remaining else UNDELIVERED)
+
+
+def _finished(
+    existing: Optional[Dict], status: str, license_keys: Dict[str, List[str]]
+) -> Tuple[Dict[str, List[str]], str]:
+    """The record's keys plus `license_keys`, and the status to finish with: keys
+    and a DELIVERED set by the backorder drainer meanwhile are kept."""
+    merged = {category: list(keys) for category, keys in (existing or {}).get("license_keys", {}).items()}
+    for category, keys in license_keys.items():
+        recorded = merged.setdefault(category, [])
+        recorded.extend(key for key in keys if key not in recorded)
+    if existing and existing["status"] == DELIVERED and status == BACKORDERED:
+        status = DELIVERED
+    return merged, status
+
+
+class SQLiteIdempotencyStore(SQLiteBase):
+    """Which orders and Shopify webhook deliveries have already been handled.
+
+    `begin` atomically marks an order in progress, so of two concurrent
+    deliveries of the same order only one gets to process it. An in-progress
+    marker older than `in_progress_ttl` is treated as abandoned (crashed
+    worker) and may be taken over.
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, path: str, in_progress_ttl: float = 300):
+        super().__init__(path)
+        self.in_progress_ttl = in_progress_ttl
+
+    def _get(self, conn, order_number: str) -> Optional[Dict]:
+        row = conn.execute(
+            "SELECT order_number, status, license_keys, created_at, updated_at "
+            "FROM processed_orders WHERE order_number = ?",
+            (order_number,)
+        ).fetchone()
+        return _record(row) if row else None
+
+    def _begin(self, order_number: str, webhook_id: Optional[str]) -> Optional[Dict]:
+        now = time.time()
+        with self._transaction() as conn:
+            if webhook_id:
+                row = conn.execute(
+                    "SELECT order_number FROM processed_webhooks WHERE webhook_id = ?",
+                    (webhook_id,)
+                ).fetchone()
+                if row:
+                    return self._get(conn, row[0]) or {"order_number": row[0], "status": IN_PROGRESS}
+            existing = self._get(conn, order_number)
+            if existing and not (existing["status"] == IN_PROGRESS and now - existing["updated_at"] > self.in_progress_ttl):
+                return existing
+            conn.execute(
+                "INSERT OR REPLACE INTO processed_orders (order_number, status, license_keys, created_at, updated_at) "
+                "VALUES (?, ?, '{}', ?, ?)",
+                (order_number, IN_PROGRESS, now, now)
+            )
+            if webhook_id:
+                conn.execute(
+                    "INSERT OR IGNORE INTO processed_webhooks (webhook_id, order_number, received_at) VALUES (?, ?, ?)",
+                    (webhook_id, order_number, now)
+                )
+        return None
+
+    def _finish(self, order_number: str, status: str, license_keys: Dict[str, List[str]]) -> None:
+        with self._transaction() as conn:
+            license_keys, status = _finished(self._get(conn, order_number), status, license_keys)
+            conn.execute(
+                "UPDATE processed_orders SET status = ?, license_keys = ?, updated_at = ? WHERE order_number = ?",
+                (status, json.dumps(license_keys), time.time(), order_number)
+            )
+
+    def _add_keys(self, order_number: str, license_keys: Dict[str, List[str]], status: str) -> None:
+        with self._transaction() as conn:
+            existing = self._get(conn, order_number)
+            if existing is None:
+                return
+            merged = existing["license_keys"]
+            for category, keys in license_keys.items():
+                merged[category] = merged.get(category, []) + keys
+            conn.execute(
+                "UPDATE processed_orders SET status = ?, license_keys = ?, updated_at = ? WHERE order_number = ?",
+                (status, json.dumps(merged), time.time(), order_number)
+            )
+
+    def _remove_keys(self, order_number: str, license_keys: Dict[str, List[str]]) -> None:
+        with self._transaction() as conn:
+            existing = self._get(conn, order_number)
+            if existing is None:
+                return
+            remaining, status = _without(existing, license_keys)
+            if remaining == existing["license_keys"]:
+                return
+            conn.execute(
+                "UPDATE processed_orders SET status = ?, license_keys = ?, updated_at = ? WHERE order_number = ?",
+                (status, json.dumps(remaining), time.time(), order_number)
+            )
+
+    def _release(self, order_number: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM processed_orders WHERE order_number = ? AND status = ?",
+                (order_number, IN_PROGRESS)
+            )
+            conn.execute("DELETE FROM processed_webhooks WHERE order_number = ?", (order_number,))
+
+    def _lookup(self, order_number: str) -> Optional[Dict]:
+        return self._get(self._connect(), order_number)
+
+    def _by_status(self, status: str, limit: int) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT order_number, status, license_keys, created_at, updated_at FROM processed_orders "
+            "WHERE status = ? ORDER BY updated_at DESC LIMIT ?",
+            (status, limit)
+        ).fetchall()
+        return [_record(row) for row in rows]
+
+    def _webhook_status(self, webhook_id: str) -> Optional[str]:
+        row = self._connect().execute(
+            "SELECT o.status FROM processed_webhooks w "
+            "LEFT JOIN processed_orders o ON o.order_number = w.order_number WHERE w.webhook_id = ?",
+            (webhook_id,)
+        ).fetchone()
+        return (row[0] or IN_PROGRESS) if row else None
+
+    def _import_delivered(self, order_numbers: List[str]) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO processed_orders (order_number, status, license_keys, created_at, updated_at) "
+                "VALUES (?, ?, '{}', ?, ?)",
+                ((str(order_number), DELIVERED, now, now) for order_number in order_numbers)
+            )
+            return conn.total_changes - before
+
+    def _compact(self, max_age_seconds: float) -> int:
+        cutoff = time.time() - max_age_seconds
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.execute(
+                "DELETE FROM processed_orders WHERE updated_at < ? AND status != ?",
+                (cutoff, IN_PROGRESS)
+            )
+            conn.execute("DELETE FROM processed_webhooks WHERE received_at < ?", (cutoff,))
+            return conn.total_changes - before
+
+    async def begin(self, order_number: str, webhook_id: Optional[str] = None) -> Optional[Dict]:
+        """Claim the order for processing.
+
+        Returns None when the caller now owns it, otherwise the existing record.
+        """
+        return await asyncio.to_thread(self._begin, order_number, webhook_id)
+
+    async def finish(self, order_number: str, status: str, license_keys: Dict[str, List[str]]) -> None:
+        """Record the webhook's outcome, keeping keys the backorder drainer already added."""
+        await asyncio.to_thread(self._finish, order_number, status, license_keys)
+
+    async def add_keys(self, order_number: str, license_keys: Dict[str, List[str]], status: str) -> None:
+        """Record keys issued to an order after the webhook finished (backorders)."""
+        await asyncio.to_thread(self._add_keys, order_number, license_keys, status)
+
+    async def remove_keys(self, order_number: str, license_keys: Dict[str, List[str]]) -> None:
+        """Take keys that were returned to stock off the order (undelivered)."""
+        await asyncio.to_thread(self._remove_keys, order_number, license_keys)
+
+    async def release(self, order_number: str) -> None:
+        """Drop an in-progress claim so a Shopify retry can process the order again."""
+        await asyncio.to_thread(self._release, order_number)
+
+    async def lookup(self, order_number: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._lookup, order_number)
+
+    async def by_status(self, status: str, limit: int = 100) -> List[Dict]:
+        """Most recently updated orders in `status` (e.g. UNDELIVERED ones to follow up)."""
+        return await asyncio.to_thread(self._by_status, status, limit)
+
+    async def webhook_status(self, webhook_id: str) -> Optional[str]:
+        """Status of the order a webhook id was received for, None if never seen."""
+        return await asyncio.to_thread(self._webhook_status, webhook_id)
+
+    async def import_delivered(self, order_numbers: Iterable[str]) -> int:
+        return await asyncio.to_thread(self._import_delivered, list(order_numbers))
+
+    async def compact(self, max_age_seconds: float) -> int:
+        """Delete finished orders and webhook ids older than `max_age_seconds`."""
+        return await asyncio.to_thread(self._compact, max_age_seconds)
+
+
+POSTGRES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_orders (
+    order_number TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    license_keys TEXT NOT NULL DEFAULT '{}',
+    created_at DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_processed_orders_updated ON processed_orders (updated_at);
+CREATE INDEX IF NOT EXISTS idx_processed_orders_status ON processed_orders (status, updated_at);
+CREATE TABLE IF NOT EXISTS processed_webhooks (
+    webhook_id TEXT PRIMARY KEY,
+    order_number TEXT NOT NULL,
+    received_at DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_processed_webhooks_received ON processed_webhooks (received_at);
+"""
+
+_ORDER_COLUMNS = "order_number, status, license_keys, created_at, updated_at"
+
+
+class PostgresIdempotencyStore(PostgresBase):
+    """Postgres variant of SQLiteIdempotencyStore, shared by every worker and pod.
+
+    `begin` claims an order with INSERT ... ON CONFLICT DO NOTHING, so
+    exactly one of several concurrent deliveries creates the marker; the
+    rest see the existing row (locked FOR UPDATE to judge staleness).
+    """
+
+    schema = POSTGRES_SCHEMA
+
+    def __init__(self, dsn: str, in_progress_ttl: float = 300, **pool_options):
+        super().__init__(dsn, **pool_options)
+        self.in_progress_ttl = in_progress_ttl
+
+    async def begin(self, order_number: str, webhook_id: Optional[str] = None) -> Optional[Dict]:
+        now = time.time()
+        async with self._transaction() as conn:
+            if webhook_id:
+                seen = await conn.fetchval(
+                    "SELECT order_number FROM processed_webhooks WHERE webhook_id = $1", webhook_id
+                )
+                if seen is not None:
+                    row = await conn.fetchrow(
+                        f"SELECT {_ORDER_COLUMNS} FROM processed_orders WHERE order_number = $1", seen
+                    )
+                    return _record(row) if row else {"order_number": seen, "status": IN_PROGRESS}
+            inserted = await conn.fetchval(
+                "INSERT INTO processed_orders (order_number, status, license_keys, created_at, updated_at) "
+                "VALUES ($1, $2, '{}', $3, $3) ON CONFLICT (order_number) DO NOTHING RETURNING order_number",
+                order_number, IN_PROGRESS, now
+            )
+            if inserted is None:
+                row = await conn.fetchrow(
+                    f"SELECT {_ORDER_COLUMNS} FROM processed_orders WHERE order_number = $1 FOR UPDATE",
+                    order_number
+                )
+                existing = _record(row)
+                if not (existing["status"] == IN_PROGRESS and now - existing["updated_at"] > self.in_progress_ttl):
+                    return existing
+                await conn.execute(
+                    "UPDATE processed_orders SET license_keys = '{}', created_at = $2, updated_at = $2 "
+                    "WHERE order_number = $1",
+                    order_number, now
+                )
+            if webhook_id:
+                await conn.execute(
+                    "INSERT INTO processed_webhooks (webhook_id, order_number, received_at) VALUES ($1, $2, $3) "
+                    "ON CONFLICT (webhook_id) DO NOTHING",
+                    webhook_id, order_number, now
+                )
+        return None
+
+    async def finish(self, order_number: str, status: str, license_keys: Dict[str, List[str]]) -> None:
+        async with self._transaction() as conn:
+            row = await conn.fetchrow(
+                f"SELECT {_ORDER_COLUMNS} FROM processed_orders WHERE order_number = $1 FOR UPDATE", order_number
+            )
+            license_keys, status = _finished(_record(row) if row else None, status, license_keys)
+            await conn.execute(
+                "UPDATE processed_orders SET status = $1, license_keys = $2, updated_at = $3 WHERE order_number = $4",
+                status, json.dumps(license_keys), time.time(), order_number
+            )
+
+    async def add_keys(self, order_number: str, license_keys: Dict[str, List[str]], status: str) -> None:
+        async with self._transaction() as conn:
+            row = await conn.fetchrow(
+                f"SELECT {_ORDER_COLUMNS} FROM processed_orders WHERE order_number = $1 FOR UPDATE", order_number
+            )
+            if row is None:
+                return
+            merged = _record(row)["license_keys"]
+            for category, keys in license_keys.items():
+                merged[category] = merged.get(category, []) + keys
+            await conn.execute(
+                "UPDATE processed_orders SET status = $1, license_keys = $2, updated_at = $3 WHERE order_number = $4",
+                status, json.dumps(merged), time.time(), order_number
+            )
+
+    async def remove_keys(self, order_number: str, license_keys: Dict[str, List[str]]) -> None:
+        async with self._transaction() as conn:
+            row = await conn.fetchrow(
+                f"SELECT {_ORDER_COLUMNS} FROM processed_orders WHERE order_number = $1 FOR UPDATE", order_number
+            )
+            if row is None:
+                return
+            existing = _record(row)
+            remaining, status = _without(existing, license_keys)
+            if remaining == existing["license_keys"]:
+                return
+            await conn.execute(
+                "UPDATE processed_orders SET status = $1, license_keys = $2, updated_at = $3 WHERE order_number = $4",
+                status, json.dumps(remaining), time.time(), order_number
+            )
+
+    async def release(self, order_number: str) -> None:
+        async with self._transaction() as conn:
+            await conn.execute(
+                "DELETE FROM processed_orders WHERE order_number = $1 AND status = $2", order_number, IN_PROGRESS
+            )
+            await conn.execute("DELETE FROM processed_webhooks WHERE order_number = $1", order_number)
+
+    async def lookup(self, order_number: str) -> Optional[Dict]:
+        row = await self._fetchrow(f"SELECT {_ORDER_COLUMNS} FROM processed_orders WHERE order_number = $1", order_number)
+        return _record(row) if row else None
+
+    async def by_status(self, status: str, limit: int = 100) -> List[Dict]:
+        rows = await self._fetch(
+            f"SELECT {_ORDER_COLUMNS} FROM processed_orders WHERE status = $1 ORDER BY updated_at DESC LIMIT $2",
+            status, limit
+        )
+        return [_record(row) for row in rows]
+
+    async def webhook_status(self, webhook_id: str) -> Optional[str]:
+        row = await self._fetchrow(
+            "SELECT o.status FROM processed_webhooks w "
+            "LEFT JOIN processed_orders o ON o.order_number = w.order_number WHERE w.webhook_id = $1",
+            webhook_id
+        )
+        return (row["status"] or IN_PROGRESS) if row else None
+
+    async def import_delivered(self, order_numbers: Iterable[str]) -> int:
+        now = time.time()
+        async with self._transaction() as conn:
+            return await conn.fetchval(
+                "WITH inserted AS ("
+                "INSERT INTO processed_orders (order_number, status, license_keys, created_at, updated_at) "
+                "SELECT order_number, $1, '{}', $2, $2 FROM unnest($3::text[]) AS order_number "
+                "ON CONFLICT (order_number) DO NOTHING RETURNING 1"
+                ") SELECT COUNT(*) FROM inserted",
+                DELIVERED, now, [str(order_number) for order_number in order_numbers]
+            )
+
+    async def compact(self, max_age_seconds: float) -> int:
+        cutoff = time.time() - max_age_seconds
+        async with self._transaction() as conn:
+            orders = await conn.execute(
+                "DELETE FROM processed_orders WHERE updated_at < $1 AND status != $2", cutoff, IN_PROGRESS
+            )
+            webhooks = await conn.execute("DELETE FROM processed_webhooks WHERE received_at < $1", cutoff)
+        return int(orders.split()[-1]) + int(webhooks.split()[-1])
+
+
+_store: Optional[Union[SQLiteIdempotencyStore, PostgresIdempotencyStore]] = None
+
+
+def get_idempotency_store() -> Union[SQLiteIdempotencyStore, PostgresIdempotencyStore]:
+    global _store
+    if _store is None:
+        if is_postgres_url(settings.DATABASE_URL):
+            _store = PostgresIdempotencyStore(
+                settings.DATABASE_URL,
+                in_progress_ttl=settings.IDEMPOTENCY_IN_PROGRESS_TTL_SECONDS,
+                min_size=settings.DATABASE_POOL_MIN_SIZE,
+                max_size=settings.DATABASE_POOL_MAX_SIZE
+            )
+        else:
+            _store = SQLiteIdempotencyStore(
+                sqlite_path(settings.DATABASE_URL),
+                in_progress_ttl=settings.IDEMPOTENCY_IN_PROGRESS_TTL_SECONDS
+            )
+    return _store
@@ -0,0 +1,954 @@
+from typing import Optional, List, Dict, Iterable
+from abc import ABC, abstractmethod
+import asyncio
+import json
+import time
+from app.config import get_settings
+from app.storage.postgres_base import PostgresBase, is_postgres_url
+from app.storage.sqlite_base import SQLiteBase, sqlite_path
+
+settings = get_settings()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS license_keys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    category TEXT NOT NULL,
+    license_key TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'available',
+    order_number TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_license_keys_queue ON license_keys (category, status, id);
+
+-- Per-category stock counters and daily claim buckets, kept current by
+-- triggers so stock and consumption reads never scan license_keys.
+CREATE TABLE IF NOT EXISTS license_stock (
+    category TEXT PRIMARY KEY,
+    available INTEGER NOT NULL DEFAULT 0,
+    claimed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS license_consumption (
+    category TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    claimed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (category, day)
+);
+CREATE TABLE IF NOT EXISTS backorders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_number TEXT NOT NULL,
+    category TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    customer_email TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    license_keys TEXT,
+    created_at REAL NOT NULL,
+    fulfilled_at REAL,
+    UNIQUE (order_number, category)
+);
+CREATE INDEX IF NOT EXISTS idx_backorders_queue ON backorders (category, status, id);
+CREATE INDEX IF NOT EXISTS idx_backorders_status ON backorders (status, fulfilled_at);
+CREATE TABLE IF NOT EXISTS stock_alerts (
+    category TEXT PRIMARY KEY,
+    alerted_at REAL NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS trg_license_keys_insert AFTER INSERT ON license_keys BEGIN
+    INSERT INTO license_stock (category) VALUES (NEW.category) ON CONFLICT (category) DO NOTHING;
+    UPDATE license_stock SET
+        available = available + (NEW.status = 'available'),
+        claimed = claimed + (NEW.status = 'claimed')
+    WHERE category = NEW.category;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_license_keys_delete AFTER DELETE ON license_keys BEGIN
+    UPDATE license_stock SET
+        available = available - (OLD.status = 'available'),
+        claimed = claimed - (OLD.status = 'claimed')
+    WHERE category = OLD.category;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_license_keys_status AFTER UPDATE OF status ON license_keys
+WHEN OLD.status != NEW.status BEGIN
+    UPDATE license_stock SET
+        available = available - (OLD.status = 'available') + (NEW.status = 'available'),
+        claimed = claimed - (OLD.status = 'claimed') + (NEW.status = 'claimed')
+    WHERE category = NEW.category;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_license_keys_consumed_update AFTER UPDATE OF status ON license_keys
+WHEN NEW.status = 'claimed' AND OLD.status != 'claimed' BEGIN
+    INSERT INTO license_consumption (category, day, claimed)
+    VALUES (NEW.category, CAST(COALESCE(NEW.claimed_at, strftime('%s', 'now')) / 86400 AS INTEGER), 1)
+    ON CONFLICT (category, day) DO UPDATE SET claimed = claimed + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_license_keys_consumed_insert AFTER INSERT ON license_keys
+WHEN NEW.status = 'claimed' BEGIN
+    INSERT INTO license_consumption (category, day, claimed)
+    VALUES (NEW.category, CAST(COALESCE(NEW.claimed_at, strftime('%s', 'now')) / 86400 AS INTEGER), 1)
+    ON CONFLICT (category, day) DO UPDATE SET claimed = claimed + 1;
+END;
+"""
+
+
+def _backorder(row) -> Dict:
+    return {
+        "id": row[0],
+        "order_number": row[1],
+        "category": row[2],
+        "quantity": row[3],
+        "customer_email": row[4],
+        "product_name": row[5],
+        "license_keys": json.loads(row[6]) if row[6] else []
+    }
+
+
+class KeyStore(ABC):
+    """Storage backend interface for the license key inventory."""
+
+    async def pop(self, category: str, order_number: Optional[str] = None) -> str:
+        """Claim and immediately commit one key (the caller delivers it itself)."""
+        claimed = await self.claim(order_number, {category: 1})
+        if category not in claimed:
+            raise Exception(f"No license keys left for category: {category}")
+        await self.commit(claimed[category])
+        return claimed[category][0]
+
+    @abstractmethod
+    async def claim(self, order_number: Optional[str], quantities: Dict[str, int]) -> Dict[str, List[str]]:
+        """Reserve keys for an order; they stay 'reserved' until committed or released."""
+
+    @abstractmethod
+    async def commit(self, keys: Iterable[str]) -> int:
+        """Turn reserved keys into permanently claimed ones (delivery succeeded)."""
+
+    @abstractmethod
+    async def expired_reservations(self, limit: int) -> List[Dict]:
+        """Up to `limit` reserved keys whose lease has run out, oldest lease first,
+        except those of a filled backorder the drainer has yet to notify."""
+
+    @abstractmethod
+    async def extend_reservations(self, keys: Iterable[str], seconds: float) -> None:
+        ...
+
+    @abstractmethod
+    async def release(self, keys: Iterable[str]) -> int:
+        """Return reserved keys to the pool. Revoked ones are committed instead."""
+
+    @abstractmethod
+    async def requeue(
+        self, order_number: str, category: str, keys: Iterable[str], customer_email: str, product_name: str
+    ) -> bool:
+        """Release an undelivered order line's keys and backorder the line, in one
+        transaction. False (keys still released) if the line was backordered before."""
+
+    @abstractmethod
+    async def reservation_stats(self) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    async def add(self, category: str, keys: Iterable[str]) -> int:
+        ...
+
+    @abstractmethod
+    async def count(self, category: str) -> int:
+        ...
+
+    @abstractmethod
+    async def stock(self) -> Dict[str, Dict[str, int]]:
+        """Maintained {category: {"available": n, "claimed": n}} counters."""
+
+    @abstractmethod
+    async def consumption(self, days: int) -> Dict[str, int]:
+        """Keys claimed per category over the last `days` days (today included)."""
+
+    @abstractmethod
+    async def add_backorder(
+        self, order_number: str, category: str, quantity: int, customer_email: str, product_name: str
+    ) -> bool:
+        """Queue an unfulfilled order line. False if it is already queued."""
+
+    @abstractmethod
+    async def fulfil_backorders(self, category: str, limit: int) -> List[Dict]:
+        """Claim keys for up to `limit` of a category's oldest pending backorders.
+
+        Stops at the first backorder that cannot be filled, so the queue is
+        served strictly in arrival order. Fulfilled entries move to
+        'claimed' until `mark_backorder_notified` is called.
+        """
+
+    @abstractmethod
+    async def unnotified_backorders(self, older_than: float) -> List[Dict]:
+        """Backorders whose keys were claimed over `older_than` seconds ago but
+        whose email was never queued (the worker died in between). Each is
+        leased to the caller for another `older_than` seconds, so concurrent
+        drainers do not both re-send it."""
+
+    @abstractmethod
+    async def mark_backorder_notified(self, backorder_id: int) -> None:
+        ...
+
+    @abstractmethod
+    async def backordered_categories(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    async def pending_backorders(self, order_number: Optional[str] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    async def backorder_stats(self) -> Dict[str, Dict[str, int]]:
+        ...
+
+    @abstractmethod
+    async def mark_low(self, category: str) -> bool:
+        """Record that a category is below its low watermark.
+
+        Returns True only for the caller that flipped it, so each dip
+        raises one alert however many workers notice it.
+        """
+
+    @abstractmethod
+    async def clear_low(self, category: str) -> None:
+        ...
+
+    @abstractmethod
+    async def record_issued(self, category: str, keys: Iterable[str], order_number: Optional[str]) -> None:
+        """Store keys minted for an order (not taken from inventory) as claimed."""
+
+    @abstractmethod
+    async def revoked_keys(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    async def lookup(self, license_key: str) -> Optional[Dict]:
+        """Return the stored record for a key, or None if it was never added."""
+
+    @abstractmethod
+    async def revoke(self, license_key: str) -> bool:
+        """Mark an issued key revoked. Returns False if no such issued key."""
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteKeyStore(SQLiteBase, KeyStore):
+    """SQLite (WAL) key store; each category is an indexed FIFO queue."""
+
+    schema = SCHEMA
+    added_columns = {"license_keys": {"revoked_at": "REAL", "reserved_until": "REAL"}}
+
+    def __init__(self, path: str, reservation_ttl: float = 1800):
+        super().__init__(path)
+        self.reservation_ttl = reservation_ttl
+        conn = self._connect()
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_license_keys_revoked ON license_keys (revoked_at) "
+            "WHERE revoked_at IS NOT NULL"
+        )
+        # Only leased keys are indexed, so the sweeper's scan is as big as
+        # the set of outstanding reservations, not the inventory.
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_license_keys_reserved ON license_keys (reserved_until) "
+            "WHERE status = 'reserved'"
+        )
+        self._backfill_counters()
+
+    def _backfill_counters(self) -> None:
+        # The triggers only see writes made after they were created; seed the
+        # counters once from a database that predates them.
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM license_stock LIMIT 1").fetchone():
+                return
+            conn.execute(
+                "INSERT INTO license_stock (category, available, claimed) "
+                "SELECT category, SUM(status = 'available'), SUM(status = 'claimed') "
+                "FROM license_keys GROUP BY category"
+            )
+            conn.execute("DELETE FROM license_consumption")
+            conn.execute(
+                "INSERT INTO license_consumption (category, day, claimed) "
+                "SELECT category, CAST(claimed_at / 86400 AS INTEGER), COUNT(*) "
+                "FROM license_keys WHERE status = 'claimed' AND claimed_at IS NOT NULL "
+                "GROUP BY category, CAST(claimed_at / 86400 AS INTEGER)"
+            )
+
+    def _take(self, conn, category: str, quantity: int, order_number: Optional[str], now: float) -> Optional[List[str]]:
+        rows = conn.execute(
+            "SELECT id, license_key FROM license_keys "
+            "WHERE category = ? AND status = 'available' ORDER BY id LIMIT ?",
+            (category, quantity)
+        ).fetchall()
+        if len(rows) < quantity:
+            return None
+        conn.executemany(
+            "UPDATE license_keys SET status = 'reserved', order_number = ?, claimed_at = ?, reserved_until = ? "
+            "WHERE id = ?",
+            ((order_number, now, now + self.reservation_ttl, row[0]) for row in rows)
+        )
+        return [row[1] for row in rows]
+
+    def _claim(self, order_number: Optional[str], quantities: Dict[str, int]) -> Dict[str, List[str]]:
+        # One write transaction for the whole order. Each category is claimed
+        # all-or-nothing; categories without enough stock are left out, as
+        # are categories with a backorder queue, so new orders cannot jump it.
+        claimed = {}
+        now = time.time()
+        with self._transaction() as conn:
+            for category, quantity in quantities.items():
+                if conn.execute(
+                    "SELECT 1 FROM backorders WHERE category = ? AND status = 'pending' LIMIT 1", (category,)
+                ).fetchone():
+                    continue
+                keys = self._take(conn, category, quantity, order_number, now)
+                if keys is not None:
+                    claimed[category] = keys
+        return claimed
+
+    def _add(self, category: str, keys: Iterable[str]) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            # rowcount, unlike total_changes, leaves out the counter triggers' writes.
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO license_keys (category, license_key, created_at) VALUES (?, ?, ?)",
+                ((category, key, now) for key in keys)
+            )
+            return cursor.rowcount
+
+    def _record_issued(self, category: str, keys: List[str], order_number: Optional[str]) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO license_keys (category, license_key, status, order_number, created_at, claimed_at) "
+                "VALUES (?, ?, 'claimed', ?, ?, ?)",
+                ((category, key, order_number, now, now) for key in keys)
+            )
+
+    def _commit(self, keys: List[str]) -> int:
+        with self._transaction() as conn:
+            cursor = conn.executemany(
+                "UPDATE license_keys SET status = 'claimed', reserved_until = NULL "
+                "WHERE license_key = ? AND status = 'reserved'",
+                ((key,) for key in keys)
+            )
+            return cursor.rowcount
+
+    def _expired_reservations(self, limit: int) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT k.license_key, k.category, k.order_number, k.reserved_until FROM license_keys k "
+            "WHERE k.status = 'reserved' AND k.reserved_until <= ? AND NOT EXISTS ("
+            "SELECT 1 FROM backorders b WHERE b.order_number = k.order_number AND b.category = k.category "
+            "AND b.status = 'claimed') ORDER BY k.reserved_until LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+        return [
+            {"license_key": row[0], "category": row[1], "order_number": row[2], "reserved_until": row[3]}
+            for row in rows
+        ]
+
+    def _extend_reservations(self, keys: List[str], seconds: float) -> None:
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE license_keys SET reserved_until = ? WHERE license_key = ? AND status = 'reserved'",
+                ((time.time() + seconds, key) for key in keys)
+            )
+
+    def _release_in(self, conn, keys: List[str]) -> int:
+        conn.executemany(
+            "UPDATE license_keys SET status = 'claimed', reserved_until = NULL "
+            "WHERE license_key = ? AND status = 'reserved' AND revoked_at IS NOT NULL",
+            ((key,) for key in keys)
+        )
+        cursor = conn.executemany(
+            "UPDATE license_keys SET status = 'available', order_number = NULL, claimed_at = NULL, "
+            "reserved_until = NULL WHERE license_key = ? AND status = 'reserved'",
+            ((key,) for key in keys)
+        )
+        return cursor.rowcount
+
+    def _release(self, keys: List[str]) -> int:
+        with self._transaction() as conn:
+            return self._release_in(conn, keys)
+
+    def _requeue(
+        self, order_number: str, category: str, keys: List[str], customer_email: str, product_name: str
+    ) -> bool:
+        with self._transaction() as conn:
+            self._release_in(conn, keys)
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO backorders (order_number, category, quantity, customer_email, product_name, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (order_number, category, len(keys), customer_email, product_name, time.time())
+            )
+            return cursor.rowcount > 0
+
+    def _reservation_stats(self) -> Dict[str, int]:
+        row = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(reserved_until <= ?), 0) FROM license_keys WHERE status = 'reserved'",
+            (time.time(),)
+        ).fetchone()
+        return {"reserved": row[0], "expired": row[1]}
+
+    def _revoked_keys(self) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT license_key FROM license_keys WHERE revoked_at IS NOT NULL"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _count(self, category: str) -> int:
+        row = self._connect().execute(
+            "SELECT available FROM license_stock WHERE category = ?",
+            (category,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _stock(self) -> Dict[str, Dict[str, int]]:
+        rows = self._connect().execute(
+            "SELECT category, available, claimed FROM license_stock"
+        ).fetchall()
+        return {row[0]: {"available": row[1], "claimed": row[2]} for row in rows}
+
+    def _consumption(self, days: int) -> Dict[str, int]:
+        first_day = int(time.time() // 86400) - days + 1
+        rows = self._connect().execute(
+            "SELECT category, SUM(claimed) FROM license_consumption WHERE day >= ? GROUP BY category",
+            (first_day,)
+        ).fetchall()
+        return {category: total for category, total in rows}
+
+    def _add_backorder(
+        self, order_number: str, category: str, quantity: int, customer_email: str, product_name: str
+    ) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO backorders (order_number, category, quantity, customer_email, product_name, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (order_number, category, quantity, customer_email, product_name, time.time())
+            )
+            return cursor.rowcount > 0
+
+    def _fulfil_backorders(self, category: str, limit: int) -> List[Dict]:
+        fulfilled = []
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, order_number, category, quantity, customer_email, product_name FROM backorders "
+                "WHERE category = ? AND status = 'pending' ORDER BY id LIMIT ?",
+                (category, limit)
+            ).fetchall()
+            for row in rows:
+                keys = self._take(conn, category, row[3], row[1], now)
+                if keys is None:
+                    break
+                conn.execute(
+                    "UPDATE backorders SET status = 'claimed', license_keys = ?, fulfilled_at = ? WHERE id = ?",
+                    (json.dumps(keys), now, row[0])
+                )
+                fulfilled.append(_backorder(row + (json.dumps(keys),)))
+        return fulfilled
+
+    def _unnotified_backorders(self, older_than: float) -> List[Dict]:
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, order_number, category, quantity, customer_email, product_name, license_keys "
+                "FROM backorders WHERE status = 'claimed' AND fulfilled_at < ? ORDER BY id",
+                (now - older_than,)
+            ).fetchall()
+            # Restart the lease inside the same write transaction.
+            conn.executemany("UPDATE backorders SET fulfilled_at = ? WHERE id = ?", ((now, row[0]) for row in rows))
+        return [_backorder(row) for row in rows]
+
+    def _mark_backorder_notified(self, backorder_id: int) -> None:
+        with self._transaction() as conn:
+            conn.execute("UPDATE backorders SET status = 'fulfilled' WHERE id = ?", (backorder_id,))
+
+    def _backordered_categories(self) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT DISTINCT category FROM backorders WHERE status = 'pending'"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _pending_backorders(self, order_number: Optional[str]) -> List[Dict]:
+        query = (
+            "SELECT id, order_number, category, quantity, customer_email, product_name, license_keys "
+            "FROM backorders WHERE status = 'pending'"
+        )
+        if order_number is None:
+            rows = self._connect().execute(query + " ORDER BY id").fetchall()
+        else:
+            rows = self._connect().execute(query + " AND order_number = ? ORDER BY id", (order_number,)).fetchall()
+        return [_backorder(row) for row in rows]
+
+    def _backorder_stats(self) -> Dict[str, Dict[str, int]]:
+        rows = self._connect().execute(
+            "SELECT category, status, COUNT(*) FROM backorders GROUP BY category, status"
+        ).fetchall()
+        stats = {}
+        for category, status, count in rows:
+            stats.setdefault(category, {})[status] = count
+        return stats
+
+    def _mark_low(self, category: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO stock_alerts (category, alerted_at) VALUES (?, ?)",
+                (category, time.time())
+            )
+            return cursor.rowcount > 0
+
+    def _clear_low(self, category: str) -> None:
+        # Checked outside a write transaction: almost always nothing to clear.
+        if not self._connect().execute("SELECT 1 FROM stock_alerts WHERE category = ?", (category,)).fetchone():
+            return
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM stock_alerts WHERE category = ?", (category,))
+
+    def _lookup(self, license_key: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT license_key, category, status, order_number, created_at, claimed_at, revoked_at "
+            "FROM license_keys WHERE license_key = ?",
+            (license_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "license_key": row[0],
+            "category": row[1],
+            "status": row[2],
+            "order_number": row[3],
+            "created_at": row[4],
+            "claimed_at": row[5],
+            "revoked_at": row[6]
+        }
+
+    def _revoke(self, license_key: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE license_keys SET revoked_at = ? "
+                "WHERE license_key = ? AND status IN ('claimed', 'reserved') AND revoked_at IS NULL",
+                (time.time(), license_key)
+            )
+            return cursor.rowcount > 0
+
+    async def record_issued(self, category: str, keys: Iterable[str], order_number: Optional[str]) -> None:
+        await asyncio.to_thread(self._record_issued, category, list(keys), order_number)
+
+    async def commit(self, keys: Iterable[str]) -> int:
+        return await asyncio.to_thread(self._commit, list(keys))
+
+    async def expired_reservations(self, limit: int) -> List[Dict]:
+        return await asyncio.to_thread(self._expired_reservations, limit)
+
+    async def extend_reservations(self, keys: Iterable[str], seconds: float) -> None:
+        await asyncio.to_thread(self._extend_reservations, list(keys), seconds)
+
+    async def release(self, keys: Iterable[str]) -> int:
+        return await asyncio.to_thread(self._release, list(keys))
+
+    async def requeue(
+        self, order_number: str, category: str, keys: Iterable[str], customer_email: str, product_name: str
+    ) -> bool:
+        return await asyncio.to_thread(self._requeue, order_number, category, list(keys), customer_email, product_name)
+
+    async def reservation_stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._reservation_stats)
+
+    async def revoked_keys(self) -> List[str]:
+        return await asyncio.to_thread(self._revoked_keys)
+
+    async def lookup(self, license_key: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._lookup, license_key)
+
+    async def revoke(self, license_key: str) -> bool:
+        return await asyncio.to_thread(self._revoke, license_key)
+
+    async def claim(self, order_number: Optional[str], quantities: Dict[str, int]) -> Dict[str, List[str]]:
+        return await asyncio.to_thread(self._claim, order_number, dict(quantities))
+
+    async def add(self, category: str, keys: Iterable[str]) -> int:
+        return await asyncio.to_thread(self._add, category, list(keys))
+
+    async def count(self, category: str) -> int:
+        return await asyncio.to_thread(self._count, category)
+
+    async def stock(self) -> Dict[str, Dict[str, int]]:
+        return await asyncio.to_thread(self._stock)
+
+    async def consumption(self, days: int) -> Dict[str, int]:
+        return await asyncio.to_thread(self._consumption, days)
+
+    async def add_backorder(
+        self, order_number: str, category: str, quantity: int, customer_email: str, product_name: str
+    ) -> bool:
+        return await asyncio.to_thread(self._add_backorder, order_number, category, quantity, customer_email, product_name)
+
+    async def fulfil_backorders(self, category: str, limit: int) -> List[Dict]:
+        return await asyncio.to_thread(self._fulfil_backorders, category, limit)
+
+    async def unnotified_backorders(self, older_than: float) -> List[Dict]:
+        return await asyncio.to_thread(self._unnotified_backorders, older_than)
+
+    async def mark_backorder_notified(self, backorder_id: int) -> None:
+        await asyncio.to_thread(self._mark_backorder_notified, backorder_id)
+
+    async def backordered_categories(self) -> List[str]:
+        return await asyncio.to_thread(self._backordered_categories)
+
+    async def pending_backorders(self, order_number: Optional[str] = None) -> List[Dict]:
+        return await asyncio.to_thread(self._pending_backorders, order_number)
+
+    async def backorder_stats(self) -> Dict[str, Dict[str, int]]:
+        return await asyncio.to_thread(self._backorder_stats)
+
+    async def mark_low(self, category: str) -> bool:
+        return await asyncio.to_thread(self._mark_low, category)
+
+    async def clear_low(self, category: str) -> None:
+        await asyncio.to_thread(self._clear_low, category)
+
+
+POSTGRES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS license_keys (
+    id BIGSERIAL PRIMARY KEY,
+    category TEXT NOT NULL,
+    license_key TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'available',
+    order_number TEXT,
+    created_at DOUBLE PRECISION NOT NULL,
+    claimed_at DOUBLE PRECISION,
+    revoked_at DOUBLE PRECISION,
+    reserved_until DOUBLE PRECISION
+);
+ALTER TABLE license_keys ADD COLUMN IF NOT EXISTS reserved_until DOUBLE PRECISION;
+CREATE INDEX IF NOT EXISTS idx_license_keys_queue ON license_keys (category, status, id);
+CREATE INDEX IF NOT EXISTS idx_license_keys_revoked ON license_keys (revoked_at) WHERE revoked_at IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_license_keys_reserved ON license_keys (reserved_until) WHERE status = 'reserved';
+CREATE TABLE IF NOT EXISTS license_stock (
+    category TEXT PRIMARY KEY,
+    available BIGINT NOT NULL DEFAULT 0,
+    claimed BIGINT NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS license_consumption (
+    category TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    claimed BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (category, day)
+);
+CREATE TABLE IF NOT EXISTS backorders (
+    id BIGSERIAL PRIMARY KEY,
+    order_number TEXT NOT NULL,
+    category TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    customer_email TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    license_keys TEXT,
+    created_at DOUBLE PRECISION NOT NULL,
+    fulfilled_at DOUBLE PRECISION,
+    UNIQUE (order_number, category)
+);
+CREATE INDEX IF NOT EXISTS idx_backorders_queue ON backorders (category, status, id);
+CREATE INDEX IF NOT EXISTS idx_backorders_status ON backorders (status, fulfilled_at);
+CREATE TABLE IF NOT EXISTS stock_alerts (
+    category TEXT PRIMARY KEY,
+    alerted_at DOUBLE PRECISION NOT NULL
+);
+CREATE OR REPLACE FUNCTION license_keys_counters() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE license_stock SET
+            available = available - (OLD.status = 'available')::int,
+            claimed = claimed - (OLD.status = 'claimed')::int
+        WHERE category = OLD.category;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO license_stock (category, available, claimed)
+        VALUES (NEW.category, (NEW.status = 'available')::int, (NEW.status = 'claimed')::int)
+        ON CONFLICT (category) DO UPDATE SET
+            available = license_stock.available + EXCLUDED.available,
+            claimed = license_stock.claimed + EXCLUDED.claimed;
+        IF NEW.status = 'claimed' AND (TG_OP = 'INSERT' OR OLD.status <> 'claimed') THEN
+            INSERT INTO license_consumption (category, day, claimed)
+            VALUES (NEW.category, floor(COALESCE(NEW.claimed_at, extract(epoch FROM now())) / 86400)::int, 1)
+            ON CONFLICT (category, day) DO UPDATE SET claimed = license_consumption.claimed + 1;
+        END IF;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_license_keys_counters ON license_keys;
+CREATE TRIGGER trg_license_keys_counters AFTER INSERT OR DELETE OR UPDATE OF status ON license_keys
+    FOR EACH ROW EXECUTE FUNCTION license_keys_counters();
+"""
+
+_BACKORDER_COLUMNS = "id, order_number, category, quantity, customer_email, product_name, license_keys"
+
+
+class PostgresKeyStore(PostgresBase, KeyStore):
+    """Postgres key store for running several workers or pods on one inventory.
+
+    Claims lock the rows they take (FOR UPDATE SKIP LOCKED), so concurrent
+    orders never receive the same key and do not queue behind each other.
+    A row held by an in-flight claim is skipped rather than waited for, so
+    a category with only locked rows left reads as out of stock (and is
+    backordered) for that moment. Backorder fulfilment takes a per-category
+    advisory lock to stay strictly FIFO.
+    """
+
+    schema = POSTGRES_SCHEMA
+
+    def __init__(self, dsn: str, reservation_ttl: float = 1800, **pool_options):
+        super().__init__(dsn, **pool_options)
+        self.reservation_ttl = reservation_ttl
+
+    async def _take(self, conn, category: str, quantity: int, order_number: Optional[str], now: float) -> Optional[List[str]]:
+        rows = await conn.fetch(
+            "SELECT id, license_key FROM license_keys WHERE category = $1 AND status = 'available' "
+            "ORDER BY id LIMIT $2 FOR UPDATE SKIP LOCKED",
+            category, quantity
+        )
+        if len(rows) < quantity:
+            return None
+        await conn.execute(
+            "UPDATE license_keys SET status = 'reserved', order_number = $1, claimed_at = $2, reserved_until = $3 "
+            "WHERE id = ANY($4::bigint[])",
+            order_number, now, now + self.reservation_ttl, [row[0] for row in rows]
+        )
+        return [row[1] for row in rows]
+
+    async def claim(self, order_number: Optional[str], quantities: Dict[str, int]) -> Dict[str, List[str]]:
+        claimed = {}
+        now = time.time()
+        async with self._transaction() as conn:
+            for category, quantity in quantities.items():
+                if await conn.fetchval(
+                    "SELECT 1 FROM backorders WHERE category = $1 AND status = 'pending' LIMIT 1", category
+                ):
+                    continue
+                keys = await self._take(conn, category, quantity, order_number, now)
+                if keys is not None:
+                    claimed[category] = keys
+        return claimed
+
+    async def add(self, category: str, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        async with self._transaction() as conn:
+            inserted = await conn.fetchval(
+                "WITH inserted AS ("
+                "INSERT INTO license_keys (category, license_key, created_at) "
+                "SELECT $1, key, $2 FROM unnest($3::text[]) AS key "
+                "ON CONFLICT (license_key) DO NOTHING RETURNING 1"
+                ") SELECT COUNT(*) FROM inserted",
+                category, time.time(), keys
+            )
+        return inserted
+
+    async def record_issued(self, category: str, keys: Iterable[str], order_number: Optional[str]) -> None:
+        now = time.time()
+        async with self._transaction() as conn:
+            await conn.execute(
+                "INSERT INTO license_keys (category, license_key, status, order_number, created_at, claimed_at) "
+                "SELECT $1, key, 'claimed', $2, $3, $3 FROM unnest($4::text[]) AS key",
+                category, order_number, now, list(keys)
+            )
+
+    async def commit(self, keys: Iterable[str]) -> int:
+        async with self._transaction() as conn:
+            result = await conn.execute(
+                "UPDATE license_keys SET status = 'claimed', reserved_until = NULL "
+                "WHERE license_key = ANY($1::text[]) AND status = 'reserved'",
+                list(keys)
+            )
+        return int(result.split()[-1])
+
+    async def expired_reservations(self, limit: int) -> List[Dict]:
+        rows = await self._fetch(
+            "SELECT k.license_key, k.category, k.order_number, k.reserved_until FROM license_keys k "
+            "WHERE k.status = 'reserved' AND k.reserved_until <= $1 AND NOT EXISTS ("
+            "SELECT 1 FROM backorders b WHERE b.order_number = k.order_number AND b.category = k.category "
+            "AND b.status = 'claimed') ORDER BY k.reserved_until LIMIT $2",
+            time.time(), limit
+        )
+        return [dict(row) for row in rows]
+
+    async def extend_reservations(self, keys: Iterable[str], seconds: float) -> None:
+        async with self._transaction() as conn:
+            await conn.execute(
+                "UPDATE license_keys SET reserved_until = $1 WHERE license_key = ANY($2::text[]) AND status = 'reserved'",
+                time.time() + seconds, list(keys)
+            )
+
+    async def _release_in(self, conn, keys: List[str]) -> int:
+        await conn.execute(
+            "UPDATE license_keys SET status = 'claimed', reserved_until = NULL "
+            "WHERE license_key = ANY($1::text[]) AND status = 'reserved' AND revoked_at IS NOT NULL",
+            keys
+        )
+        result = await conn.execute(
+            "UPDATE license_keys SET status = 'available', order_number = NULL, claimed_at = NULL, "
+            "reserved_until = NULL WHERE license_key = ANY($1::text[]) AND status = 'reserved'",
+            keys
+        )
+        return int(result.split()[-1])
+
+    async def release(self, keys: Iterable[str]) -> int:
+        async with self._transaction() as conn:
+            return await self._release_in(conn, list(keys))
+
+    async def requeue(
+        self, order_number: str, category: str, keys: Iterable[str], customer_email: str, product_name: str
+    ) -> bool:
+        keys = list(keys)
+        async with self._transaction() as conn:
+            await self._release_in(conn, keys)
+            inserted = await conn.fetchval(
+                "INSERT INTO backorders (order_number, category, quantity, customer_email, product_name, created_at) "
+                "VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (order_number, category) DO NOTHING RETURNING id",
+                order_number, category, len(keys), customer_email, product_name, time.time()
+            )
+        return inserted is not None
+
+    async def reservation_stats(self) -> Dict[str, int]:
+        row = await self._fetchrow(
+            "SELECT COUNT(*), COUNT(*) FILTER (WHERE reserved_until <= $1) FROM license_keys WHERE status = 'reserved'",
+            time.time()
+        )
+        return {"reserved": row[0], "expired": row[1]}
+
+    async def revoked_keys(self) -> List[str]:
+        rows = await self._fetch("SELECT license_key FROM license_keys WHERE revoked_at IS NOT NULL")
+        return [row[0] for row in rows]
+
+    async def lookup(self, license_key: str) -> Optional[Dict]:
+        row = await self._fetchrow(
+            "SELECT license_key, category, status, order_number, created_at, claimed_at, revoked_at "
+            "FROM license_keys WHERE license_key = $1",
+            license_key
+        )
+        return dict(row) if row else None
+
+    async def revoke(self, license_key: str) -> bool:
+        async with self._transaction() as conn:
+            result = await conn.execute(
+                "UPDATE license_keys SET revoked_at = $1 "
+                "WHERE license_key = $2 AND status IN ('claimed', 'reserved') AND revoked_at IS NULL",
+                time.time(), license_key
+            )
+        return result != "UPDATE 0"
+
+    async def count(self, category: str) -> int:
+        row = await self._fetchrow("SELECT available FROM license_stock WHERE category = $1", category)
+        return row[0] if row else 0
+
+    async def stock(self) -> Dict[str, Dict[str, int]]:
+        rows = await self._fetch("SELECT category, available, claimed FROM license_stock")
+        return {row[0]: {"available": row[1], "claimed": row[2]} for row in rows}
+
+    async def consumption(self, days: int) -> Dict[str, int]:
+        first_day = int(time.time() // 86400) - days + 1
+        rows = await self._fetch(
+            "SELECT category, SUM(claimed) FROM license_consumption WHERE day >= $1 GROUP BY category",
+            first_day
+        )
+        return {row[0]: int(row[1]) for row in rows}
+
+    async def add_backorder(
+        self, order_number: str, category: str, quantity: int, customer_email: str, product_name: str
+    ) -> bool:
+        async with self._transaction() as conn:
+            result = await conn.execute(
+                "INSERT INTO backorders (order_number, category, quantity, customer_email, product_name, created_at) "
+                "VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (order_number, category) DO NOTHING",
+                order_number, category, quantity, customer_email, product_name, time.time()
+            )
+        return result != "INSERT 0 0"
+
+    async def fulfil_backorders(self, category: str, limit: int) -> List[Dict]:
+        fulfilled = []
+        now = time.time()
+        async with self._transaction() as conn:
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('backorders:' || $1))", category)
+            rows = await conn.fetch(
+                f"SELECT {_BACKORDER_COLUMNS} FROM backorders "
+                "WHERE category = $1 AND status = 'pending' ORDER BY id LIMIT $2",
+                category, limit
+            )
+            for row in rows:
+                keys = await self._take(conn, category, row[3], row[1], now)
+                if keys is None:
+                    break
+                await conn.execute(
+                    "UPDATE backorders SET status = 'claimed', license_keys = $1, fulfilled_at = $2 WHERE id = $3",
+                    json.dumps(keys), now, row[0]
+                )
+                fulfilled.append(_backorder(tuple(row)[:6] + (json.dumps(keys),)))
+        return fulfilled
+
+    async def unnotified_backorders(self, older_than: float) -> List[Dict]:
+        now = time.time()
+        rows = await self._fetch(
+            "UPDATE backorders SET fulfilled_at = $1 WHERE id IN ("
+            "SELECT id FROM backorders WHERE status = 'claimed' AND fulfilled_at < $2 FOR UPDATE SKIP LOCKED"
+            f") RETURNING {_BACKORDER_COLUMNS}",
+            now, now - older_than
+        )
+        return sorted((_backorder(row) for row in rows), key=lambda backorder: backorder["id"])
+
+    async def mark_backorder_notified(self, backorder_id: int) -> None:
+        async with self._transaction() as conn:
+            await conn.execute("UPDATE backorders SET status = 'fulfilled' WHERE id = $1", backorder_id)
+
+    async def backordered_categories(self) -> List[str]:
+        rows = await self._fetch("SELECT DISTINCT category FROM backorders WHERE status = 'pending'")
+        return [row[0] for row in rows]
+
+    async def pending_backorders(self, order_number: Optional[str] = None) -> List[Dict]:
+        if order_number is None:
+            rows = await self._fetch(
+                f"SELECT {_BACKORDER_COLUMNS} FROM backorders WHERE status = 'pending' ORDER BY id"
+            )
+        else:
+            rows = await self._fetch(
+                f"SELECT {_BACKORDER_COLUMNS} FROM backorders "
+                "WHERE status = 'pending' AND order_number = $1 ORDER BY id",
+                order_number
+            )
+        return [_backorder(row) for row in rows]
+
+    async def backorder_stats(self) -> Dict[str, Dict[str, int]]:
+        rows = await self._fetch("SELECT category, status, COUNT(*) FROM backorders GROUP BY category, status")
+        stats = {}
+        for category, status, count in rows:
+            stats.setdefault(category, {})[status] = count
+        return stats
+
+    async def mark_low(self, category: str) -> bool:
+        async with self._transaction() as conn:
+            result = await conn.execute(
+                "INSERT INTO stock_alerts (category, alerted_at) VALUES ($1, $2) ON CONFLICT (category) DO NOTHING",
+                category, time.time()
+            )
+        return result != "INSERT 0 0"
+
+    async def clear_low(self, category: str) -> None:
+        async with self._transaction() as conn:
+            await conn.execute("DELETE FROM stock_alerts WHERE category = $1", category)
+
+
+_store: Optional[KeyStore] = None
+
+
+def get_key_store() -> KeyStore:
+    """Return the process-wide key store selected by DATABASE_URL."""
+    global _store
+    if _store is None:
+        if is_postgres_url(settings.DATABASE_URL):
+            _store = PostgresKeyStore(
+                settings.DATABASE_URL,
+                reservation_ttl=settings.KEY_RESERVATION_TTL_SECONDS,
+                min_size=settings.DATABASE_POOL_MIN_SIZE,
+                max_size=settings.DATABASE_POOL_MAX_SIZE
+            )
+        else:
+            _store = SQLiteKeyStore(
+                sqlite_path(settings.DATABASE_URL), reservation_ttl=settings.KEY_RESERVATION_TTL_SECONDS
+            )
+    return _store
@@ -0,0 +1,358 @@
+from typing import Optional, List, Dict, Tuple, Union
+import asyncio
+import json
+import time
+from app.config import get_settings
+from app.storage import outbox_store
+from app.storage.postgres_base import PostgresBase, is_postgres_url
+from app.storage.sqlite_base import SQLiteBase, sqlite_path
+
+settings = get_settings()
+
+# Email statuses a scan can filter on: the outbox row states, 'unknown' for
+# an issuance whose outbox row is gone, and 'failed' for dead letters plus
+# messages still being retried after an error.
+EMAIL_STATUSES = ("pending", "sending", "sent", "dead", "unknown", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS license_issuances (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_number TEXT NOT NULL,
+    category TEXT NOT NULL,
+    customer_email TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    license_keys TEXT NOT NULL,
+    outbox_id INTEGER,
+    resends INTEGER NOT NULL DEFAULT 0,
+    issued_at REAL NOT NULL,
+    resent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_license_issuances_order ON license_issuances (order_number);
+CREATE INDEX IF NOT EXISTS idx_license_issuances_issued ON license_issuances (issued_at);
+CREATE INDEX IF NOT EXISTS idx_license_issuances_outbox ON license_issuances (outbox_id);
+"""
+
+_COLUMNS = (
+    "i.id, i.order_number, i.category, i.customer_email, i.product_name, i.license_keys, i.outbox_id, "
+    "i.resends, i.issued_at, i.resent_at, COALESCE(o.status, 'unknown'), o.last_error, i.released_at"
+)
+_FROM = "license_issuances i LEFT JOIN email_outbox o ON o.id = i.outbox_id"
+
+
+def _issuance(row) -> Dict:
+    return {
+        "id": row[0],
+        "order_number": row[1],
+        "category": row[2],
+        "customer_email": row[3],
+        "product_name": row[4],
+        "license_keys": json.loads(row[5]),
+        "outbox_id": row[6],
+        "resends": row[7],
+        "issued_at": row[8],
+        "resent_at": row[9],
+        "email_status": row[10],
+        "last_error": row[11],
+        "released_at": row[12]
+    }
+
+
+def _scan_query(
+    after_id: int,
+    limit: int,
+    since: Optional[float],
+    until: Optional[float],
+    category: Optional[str],
+    statuses: Optional[List[str]],
+    placeholder
+) -> Tuple[str, list]:
+    """SELECT for one page of a filtered ledger scan; `placeholder(n)` spells
+    the n-th (1-based) bind parameter for the backend."""
+    args = [after_id]
+    clauses = [f"i.id > {placeholder(1)}", "i.released_at IS NULL"]
+
+    def bind(value) -> str:
+        args.append(value)
+        return placeholder(len(args))
+
+    if since is not None:
+        clauses.append(f"i.issued_at >= {bind(since)}")
+    if until is not None:
+        clauses.append(f"i.issued_at < {bind(until)}")
+    if category is not None:
+        clauses.append(f"i.category = {bind(category)}")
+    if statuses:
+        alternatives = []
+        for status in statuses:
+            if status == "failed":
+                alternatives.append("o.status = 'dead' OR (o.status = 'pending' AND o.last_error IS NOT NULL)")
+            else:
+                alternatives.append(f"COALESCE(o.status, 'unknown') = {bind(status)}")
+        clauses.append("(" + " OR ".join(alternatives) + ")")
+    query = f"SELECT {_COLUMNS} FROM {_FROM} WHERE {' AND '.join(clauses)} ORDER BY i.id LIMIT {bind(limit)}"
+    return query, args
+
+
+class SQLiteLedgerStore(SQLiteBase):
+    """Which keys went to which customer for which order, and the outbox row
+    of the latest email carrying them.
+
+    One row per order category that got keys (webhook or backorder fill).
+    The email status is read from the outbox, so it is never stale. Scans
+    page by id (keyset), so a resend over the whole ledger streams it in
+    constant memory. Issuances released back to stock are skipped.
+    """
+
+    # The email_outbox table is joined for email status.
+    schema = outbox_store.SCHEMA + SCHEMA
+    added_columns = {"license_issuances": {"released_at": "REAL"}}
+
+    def _enqueue(
+        self, order_number: str, category: str, customer_email: str, product_name: str,
+        license_keys: List[str], kind: str, message: str
+    ) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            outbox_id = conn.execute(
+                "INSERT INTO email_outbox (kind, recipient, message, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, customer_email, message, now, now, now)
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO license_issuances "
+                "(order_number, category, customer_email, product_name, license_keys, outbox_id, issued_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (order_number, category, customer_email, product_name, json.dumps(license_keys), outbox_id, now)
+            )
+            return outbox_id
+
+    def _scan(self, after_id: int, limit: int, since, until, category, statuses) -> List[Dict]:
+        query, args = _scan_query(after_id, limit, since, until, category, statuses, lambda n: "?")
+        return [_issuance(row) for row in self._connect().execute(query, args).fetchall()]
+
+    def _for_order(self, order_number: str) -> List[Dict]:
+        rows = self._connect().execute(
+            f"SELECT {_COLUMNS} FROM {_FROM} WHERE i.order_number = ? ORDER BY i.id", (order_number,)
+        ).fetchall()
+        return [_issuance(row) for row in rows]
+
+    def _for_orders(self, order_numbers: List[str]) -> List[Dict]:
+        if not order_numbers:
+            return []
+        rows = self._connect().execute(
+            f"SELECT {_COLUMNS} FROM {_FROM} WHERE i.released_at IS NULL "
+            f"AND i.order_number IN ({', '.join('?' * len(order_numbers))}) ORDER BY i.id",
+            order_numbers
+        ).fetchall()
+        return [_issuance(row) for row in rows]
+
+    def _for_outbox(self, outbox_id: int) -> List[Dict]:
+        rows = self._connect().execute(
+            f"SELECT {_COLUMNS} FROM {_FROM} WHERE i.outbox_id = ? AND i.released_at IS NULL", (outbox_id,)
+        ).fetchall()
+        return [_issuance(row) for row in rows]
+
+    def _mark_released(self, outbox_ids: Dict[int, int]) -> List[int]:
+        now = time.time()
+        with self._transaction() as conn:
+            return [
+                issuance_id for issuance_id, outbox_id in outbox_ids.items()
+                if conn.execute(
+                    "UPDATE license_issuances SET released_at = ? "
+                    "WHERE id = ? AND outbox_id = ? AND released_at IS NULL",
+                    (now, issuance_id, outbox_id)
+                ).rowcount
+            ]
+
+    def _enqueue_resends(self, kind: str, messages: List[Tuple[int, str, str]]) -> Dict[int, int]:
+        now = time.time()
+        outbox_ids = {}
+        with self._transaction() as conn:
+            for issuance_id, recipient, message in messages:
+                if not conn.execute(
+                    "UPDATE license_issuances SET resends = resends + 1, resent_at = ? "
+                    "WHERE id = ? AND released_at IS NULL",
+                    (now, issuance_id)
+                ).rowcount:
+                    continue
+                outbox_ids[issuance_id] = conn.execute(
+                    "INSERT INTO email_outbox (kind, recipient, message, next_attempt_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, recipient, message, now, now, now)
+                ).lastrowid
+                conn.execute(
+                    "UPDATE license_issuances SET outbox_id = ? WHERE id = ?", (outbox_ids[issuance_id], issuance_id)
+                )
+        return outbox_ids
+
+    async def enqueue(
+        self, order_number: str, category: str, customer_email: str, product_name: str,
+        license_keys: List[str], kind: str, message: str
+    ) -> int:
+        """Queue a license email and record its issuance in one transaction; returns the outbox id."""
+        return await asyncio.to_thread(
+            self._enqueue, order_number, category, customer_email, product_name, list(license_keys), kind, message
+        )
+
+    async def scan(
+        self,
+        after_id: int = 0,
+        limit: int = 100,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        category: Optional[str] = None,
+        statuses: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """The next `limit` issuances with id > `after_id` matching the filters, by id."""
+        return await asyncio.to_thread(self._scan, after_id, limit, since, until, category, statuses)
+
+    async def for_order(self, order_number: str) -> List[Dict]:
+        return await asyncio.to_thread(self._for_order, order_number)
+
+    async def for_orders(self, order_numbers: List[str]) -> List[Dict]:
+        """Unreleased issuances of any of `order_numbers`."""
+        return await asyncio.to_thread(self._for_orders, list(order_numbers))
+
+    async def for_outbox(self, outbox_id: int) -> List[Dict]:
+        """Unreleased issuances whose latest email is outbox row `outbox_id`."""
+        return await asyncio.to_thread(self._for_outbox, outbox_id)
+
+    async def mark_released(self, outbox_ids: Dict[int, int]) -> List[int]:
+        """Mark issuances released whose latest email is still the given
+        {issuance id: outbox id}; returns the ids marked. One re-sent in the
+        meantime keeps its keys."""
+        return await asyncio.to_thread(self._mark_released, dict(outbox_ids))
+
+    async def enqueue_resends(self, kind: str, messages: List[Tuple[int, str, str]]) -> Dict[int, int]:
+        """Queue (issuance id, recipient, message) emails and point each issuance
+        at its new outbox row, in one transaction. Released issuances are
+        skipped. Returns {issuance id: outbox id}."""
+        return await asyncio.to_thread(self._enqueue_resends, kind, list(messages))
+
+
+POSTGRES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS license_issuances (
+    id BIGSERIAL PRIMARY KEY,
+    order_number TEXT NOT NULL,
+    category TEXT NOT NULL,
+    customer_email TEXT NOT NULL,
+    product_name TEXT NOT NULL,
+    license_keys TEXT NOT NULL,
+    outbox_id BIGINT,
+    resends INTEGER NOT NULL DEFAULT 0,
+    issued_at DOUBLE PRECISION NOT NULL,
+    resent_at DOUBLE PRECISION,
+    released_at DOUBLE PRECISION
+);
+ALTER TABLE license_issuances ADD COLUMN IF NOT EXISTS released_at DOUBLE PRECISION;
+CREATE INDEX IF NOT EXISTS idx_license_issuances_order ON license_issuances (order_number);
+CREATE INDEX IF NOT EXISTS idx_license_issuances_issued ON license_issuances (issued_at);
+CREATE INDEX IF NOT EXISTS idx_license_issuances_outbox ON license_issuances (outbox_id);
+"""
+
+
+class PostgresLedgerStore(PostgresBase):
+    """Postgres variant of SQLiteLedgerStore."""
+
+    schema = outbox_store.POSTGRES_SCHEMA + POSTGRES_SCHEMA
+
+    async def enqueue(
+        self, order_number: str, category: str, customer_email: str, product_name: str,
+        license_keys: List[str], kind: str, message: str
+    ) -> int:
+        now = time.time()
+        async with self._transaction() as conn:
+            outbox_id = await conn.fetchval(
+                "INSERT INTO email_outbox (kind, recipient, message, next_attempt_at, created_at, updated_at) "
+                "VALUES ($1, $2, $3, $4, $4, $4) RETURNING id",
+                kind, customer_email, message, now
+            )
+            await conn.execute(
+                "INSERT INTO license_issuances "
+                "(order_number, category, customer_email, product_name, license_keys, outbox_id, issued_at) "
+                "VALUES ($1, $2, $3, $4, $5, $6, $7)",
+                order_number, category, customer_email, product_name, json.dumps(list(license_keys)), outbox_id, now
+            )
+        return outbox_id
+
+    async def scan(
+        self,
+        after_id: int = 0,
+        limit: int = 100,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        category: Optional[str] = None,
+        statuses: Optional[List[str]] = None
+    ) -> List[Dict]:
+        query, args = _scan_query(after_id, limit, since, until, category, statuses, lambda n: f"${n}")
+        return [_issuance(row) for row in await self._fetch(query, *args)]
+
+    async def for_order(self, order_number: str) -> List[Dict]:
+        rows = await self._fetch(
+            f"SELECT {_COLUMNS} FROM {_FROM} WHERE i.order_number = $1 ORDER BY i.id", order_number
+        )
+        return [_issuance(row) for row in rows]
+
+    async def for_orders(self, order_numbers: List[str]) -> List[Dict]:
+        rows = await self._fetch(
+            f"SELECT {_COLUMNS} FROM {_FROM} WHERE i.released_at IS NULL "
+            f"AND i.order_number = ANY($1::text[]) ORDER BY i.id",
+            list(order_numbers)
+        )
+        return [_issuance(row) for row in rows]
+
+    async def for_outbox(self, outbox_id: int) -> List[Dict]:
+        rows = await self._fetch(
+            f"SELECT {_COLUMNS} FROM {_FROM} WHERE i.outbox_id = $1 AND i.released_at IS NULL", outbox_id
+        )
+        return [_issuance(row) for row in rows]
+
+    async def mark_released(self, outbox_ids: Dict[int, int]) -> List[int]:
+        async with self._transaction() as conn:
+            rows = await conn.fetch(
+                "UPDATE license_issuances i SET released_at = $1 "
+                "FROM unnest($2::bigint[], $3::bigint[]) AS expected (id, outbox_id) "
+                "WHERE i.id = expected.id AND i.outbox_id = expected.outbox_id AND i.released_at IS NULL "
+                "RETURNING i.id",
+                time.time(), list(outbox_ids), list(outbox_ids.values())
+            )
+        return [row[0] for row in rows]
+
+    async def enqueue_resends(self, kind: str, messages: List[Tuple[int, str, str]]) -> Dict[int, int]:
+        now = time.time()
+        outbox_ids = {}
+        async with self._transaction() as conn:
+            for issuance_id, recipient, message in messages:
+                updated = await conn.fetchval(
+                    "UPDATE license_issuances SET resends = resends + 1, resent_at = $1 "
+                    "WHERE id = $2 AND released_at IS NULL RETURNING id",
+                    now, issuance_id
+                )
+                if updated is None:
+                    continue
+                outbox_ids[issuance_id] = await conn.fetchval(
+                    "INSERT INTO email_outbox (kind, recipient, message, next_attempt_at, created_at, updated_at) "
+                    "VALUES ($1, $2, $3, $4, $4, $4) RETURNING id",
+                    kind, recipient, message, now
+                )
+                await conn.execute(
+                    "UPDATE license_issuances SET outbox_id = $1 WHERE id = $2", outbox_ids[issuance_id], issuance_id
+                )
+        return outbox_ids
+
+
+_store: Optional[Union[SQLiteLedgerStore, PostgresLedgerStore]] = None
+
+
+def get_ledger_store() -> Union[SQLiteLedgerStore, PostgresLedgerStore]:
+    global _store
+    if _store is None:
+        if is_postgres_url(settings.DATABASE_URL):
+            _store = PostgresLedgerStore(
+                settings.DATABASE_URL,
+                min_size=settings.DATABASE_POOL_MIN_SIZE,
+                max_size=settings.DATABASE_POOL_MAX_SIZE
+            )
+        else:
+            _store = SQLiteLedgerStore(sqlite_path(settings.DATABASE_URL))
+    return _store
@@ -0,0 +1,34 @@
+from typing import Dict
+import asyncio
+import json
+import os
+from app.storage.idempotency_store import get_idempotency_store
+from app.storage.key_store import get_key_store
+
+LICENSES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), '../licenses.json')
+
+
+async def migrate_licenses_json(path: str = LICENSES_FILE) -> Dict[str, int]:
+    """Import a legacy licenses.json: key lists into the key store and
+    delivered_orders into the idempotency store.
+
+    Safe to re-run: keys and orders already present are skipped.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    imported = {}
+    for category, keys in data.items():
+        if category == "delivered_orders" or not isinstance(keys, list):
+            continue
+        imported[category] = await get_key_store().add(category, keys)
+    imported["delivered_orders"] = await get_idempotency_store().import_delivered(data.get("delivered_orders", []))
+    return imported
+
+
+if __name__ == "__main__":
+    import sys
+    result = asyncio.run(migrate_licenses_json(*sys.argv[1:2]))
+    for name, count in result.items():
+        print(f"{name}: imported {count}")
@@ -0,0 +1,299 @@
+from typing import Optional, List, Dict, Union
+import asyncio
+import time
+from app.config import get_settings
+from app.storage.postgres_base import PostgresBase, is_postgres_url
+from app.storage.sqlite_base import SQLiteBase, sqlite_path
+
+settings = get_settings()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at);
+"""
+
+
+class SQLiteOutboxStore(SQLiteBase):
+    """Persistent email outbox.
+
+    Rows move pending -> sending -> sent, or back to pending with a later
+    next_attempt_at on failure, and to dead once attempts run out. A row
+    left in 'sending' by a crashed worker becomes due again when its lease
+    (next_attempt_at) lapses, which gives at-least-once delivery.
+    """
+
+    schema = SCHEMA
+
+    def _enqueue(self, kind: str, recipient: str, message: str) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO email_outbox (kind, recipient, message, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, recipient, message, now, now, now)
+            )
+            return cursor.lastrowid
+
+    def _claim_due(self, limit: int, lease_seconds: float) -> List[Dict]:
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, kind, recipient, message, attempts FROM email_outbox "
+                "WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE email_outbox SET status = 'sending', attempts = attempts + 1, "
+                "next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                ((now + lease_seconds, now, row[0]) for row in rows)
+            )
+        return [
+            {"id": row[0], "kind": row[1], "recipient": row[2], "message": row[3], "attempts": row[4] + 1}
+            for row in rows
+        ]
+
+    def _mark_sent(self, message_id: int) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE email_outbox SET status = 'sent', last_error = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), message_id)
+            )
+
+    def _mark_failed(self, message_id: int, error: str, retry_at: Optional[float]) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            if retry_at is None:
+                conn.execute(
+                    "UPDATE email_outbox SET status = 'dead', last_error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, message_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE email_outbox SET status = 'pending', last_error = ?, next_attempt_at = ?, "
+                    "updated_at = ? WHERE id = ?",
+                    (error, retry_at, now, message_id)
+                )
+
+    def _cancel_dead(self, ids: List[int]) -> List[int]:
+        now = time.time()
+        with self._transaction() as conn:
+            return [
+                message_id for message_id in ids
+                if conn.execute(
+                    "UPDATE email_outbox SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'dead'",
+                    (now, message_id)
+                ).rowcount
+            ]
+
+    def _stats(self) -> Dict[str, int]:
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM email_outbox GROUP BY status"
+        ).fetchall()
+        return {status: count for status, count in rows}
+
+    def _depth(self) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM email_outbox WHERE status IN ('pending', 'sending')"
+        ).fetchone()[0]
+
+    def _list_dead(self, limit: int) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT id, kind, recipient, attempts, last_error, updated_at FROM email_outbox "
+            "WHERE status = 'dead' ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [
+            {"id": row[0], "kind": row[1], "recipient": row[2], "attempts": row[3],
+             "last_error": row[4], "updated_at": row[5]}
+            for row in rows
+        ]
+
+    def _requeue_dead(self, ids: Optional[List[int]]) -> int:
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            if ids is None:
+                conn.execute(
+                    "UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, "
+                    "updated_at = ? WHERE status = 'dead'",
+                    (now, now)
+                )
+            else:
+                conn.executemany(
+                    "UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, "
+                    "updated_at = ? WHERE id = ? AND status = 'dead'",
+                    ((now, now, message_id) for message_id in ids)
+                )
+            return conn.total_changes - before
+
+    async def enqueue(self, kind: str, recipient: str, message: str) -> int:
+        return await asyncio.to_thread(self._enqueue, kind, recipient, message)
+
+    async def cancel_dead(self, ids: List[int]) -> List[int]:
+        """Retire dead letters so they can no longer be requeued; returns the ids cancelled."""
+        return await asyncio.to_thread(self._cancel_dead, list(ids))
+
+    async def claim_due(self, limit: int, lease_seconds: float) -> List[Dict]:
+        return await asyncio.to_thread(self._claim_due, limit, lease_seconds)
+
+    async def mark_sent(self, message_id: int) -> None:
+        await asyncio.to_thread(self._mark_sent, message_id)
+
+    async def mark_failed(self, message_id: int, error: str, retry_at: Optional[float]) -> None:
+        await asyncio.to_thread(self._mark_failed, message_id, error, retry_at)
+
+    async def stats(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._stats)
+
+    async def depth(self) -> int:
+        """Messages waiting to be sent (pending or sending)."""
+        return await asyncio.to_thread(self._depth)
+
+    async def list_dead(self, limit: int = 100) -> List[Dict]:
+        return await asyncio.to_thread(self._list_dead, limit)
+
+    async def requeue_dead(self, ids: Optional[List[int]] = None) -> int:
+        return await asyncio.to_thread(self._requeue_dead, ids)
+
+
+POSTGRES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DOUBLE PRECISION NOT NULL,
+    last_error TEXT,
+    created_at DOUBLE PRECISION NOT NULL,
+    updated_at DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at);
+"""
+
+
+class PostgresOutboxStore(PostgresBase):
+    """Postgres variant of SQLiteOutboxStore.
+
+    Dispatchers in different pods lease rows with FOR UPDATE SKIP LOCKED,
+    so each due message is handed to exactly one of them at a time.
+    """
+
+    schema = POSTGRES_SCHEMA
+
+    async def enqueue(self, kind: str, recipient: str, message: str) -> int:
+        now = time.time()
+        async with self._transaction() as conn:
+            return await conn.fetchval(
+                "INSERT INTO email_outbox (kind, recipient, message, next_attempt_at, created_at, updated_at) "
+                "VALUES ($1, $2, $3, $4, $4, $4) RETURNING id",
+                kind, recipient, message, now
+            )
+
+    async def claim_due(self, limit: int, lease_seconds: float) -> List[Dict]:
+        now = time.time()
+        async with self._transaction() as conn:
+            rows = await conn.fetch(
+                "UPDATE email_outbox SET status = 'sending', attempts = attempts + 1, "
+                "next_attempt_at = $1, updated_at = $2 "
+                "WHERE id IN ("
+                "SELECT id FROM email_outbox WHERE status IN ('pending', 'sending') AND next_attempt_at <= $2 "
+                "ORDER BY next_attempt_at LIMIT $3 FOR UPDATE SKIP LOCKED"
+                ") RETURNING id, kind, recipient, message, attempts",
+                now + lease_seconds, now, limit
+            )
+        return [dict(row) for row in rows]
+
+    async def mark_sent(self, message_id: int) -> None:
+        async with self._transaction() as conn:
+            await conn.execute(
+                "UPDATE email_outbox SET status = 'sent', last_error = NULL, updated_at = $1 WHERE id = $2",
+                time.time(), message_id
+            )
+
+    async def mark_failed(self, message_id: int, error: str, retry_at: Optional[float]) -> None:
+        now = time.time()
+        async with self._transaction() as conn:
+            if retry_at is None:
+                await conn.execute(
+                    "UPDATE email_outbox SET status = 'dead', last_error = $1, updated_at = $2 WHERE id = $3",
+                    error, now, message_id
+                )
+            else:
+                await conn.execute(
+                    "UPDATE email_outbox SET status = 'pending', last_error = $1, next_attempt_at = $2, "
+                    "updated_at = $3 WHERE id = $4",
+                    error, retry_at, now, message_id
+                )
+
+    async def cancel_dead(self, ids: List[int]) -> List[int]:
+        async with self._transaction() as conn:
+            rows = await conn.fetch(
+                "UPDATE email_outbox SET status = 'cancelled', updated_at = $1 "
+                "WHERE id = ANY($2::bigint[]) AND status = 'dead' RETURNING id",
+                time.time(), list(ids)
+            )
+        return [row[0] for row in rows]
+
+    async def stats(self) -> Dict[str, int]:
+        rows = await self._fetch("SELECT status, COUNT(*) FROM email_outbox GROUP BY status")
+        return {row[0]: row[1] for row in rows}
+
+    async def depth(self) -> int:
+        row = await self._fetchrow("SELECT COUNT(*) FROM email_outbox WHERE status IN ('pending', 'sending')")
+        return row[0]
+
+    async def list_dead(self, limit: int = 100) -> List[Dict]:
+        rows = await self._fetch(
+            "SELECT id, kind, recipient, attempts, last_error, updated_at FROM email_outbox "
+            "WHERE status = 'dead' ORDER BY id LIMIT $1",
+            limit
+        )
+        return [dict(row) for row in rows]
+
+    async def requeue_dead(self, ids: Optional[List[int]] = None) -> int:
+        now = time.time()
+        async with self._transaction() as conn:
+            if ids is None:
+                result = await conn.execute(
+                    "UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = $1, "
+                    "updated_at = $1 WHERE status = 'dead'",
+                    now
+                )
+            else:
+                result = await conn.execute(
+                    "UPDATE email_outbox SET status = 'pending', attempts = 0, next_attempt_at = $1, "
+                    "updated_at = $1 WHERE id = ANY($2::bigint[]) AND status = 'dead'",
+                    now, ids
+                )
+        return int(result.split()[-1])
+
+
+_store: Optional[Union[SQLiteOutboxStore, PostgresOutboxStore]] = None
+
+
+def get_outbox_store() -> Union[SQLiteOutboxStore, PostgresOutboxStore]:
+    global _store
+    if _store is None:
+        if is_postgres_url(settings.DATABASE_URL):
+            _store = PostgresOutboxStore(
+                settings.DATABASE_URL,
+                min_size=settings.DATABASE_POOL_MIN_SIZE,
+                max_size=settings.DATABASE_POOL_MAX_SIZE
+            )
+        else:
+            _store = SQLiteOutboxStore(sqlite_path(settings.DATABASE_URL))
+    return _store
@@ -0,0 +1,71 @@
+from typing import Dict
+import asyncio
+from contextlib import asynccontextmanager
+
+_pools: Dict[str, object] = {}
+_pools_lock = asyncio.Lock()
+
+
+def is_postgres_url(database_url: str) -> bool:
+    return database_url.startswith(("postgres://", "postgresql://"))
+
+
+async def get_pool(dsn: str, min_size: int = 1, max_size: int = 10):
+    """Return the process-wide asyncpg pool for `dsn`, creating it on first use."""
+    async with _pools_lock:
+        if dsn not in _pools:
+            try:
+                import asyncpg
+            except ImportError:
+                raise Exception("A postgres DATABASE_URL requires the asyncpg package")
+            _pools[dsn] = await asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size)
+        return _pools[dsn]
+
+
+async def close_pools() -> None:
+    async with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        await pool.close()
+
+
+class PostgresBase:
+    """Shared asyncpg pool plus a transaction helper, for cluster deployments.
+
+    Subclasses set `schema`, applied on first use. Workers and pods starting
+    together serialise the DDL on an advisory lock.
+    """
+
+    schema = ""
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._ready = False
+
+    async def _pool(self):
+        pool = await get_pool(self.dsn, self.min_size, self.max_size)
+        if not self._ready:
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("SELECT pg_advisory_xact_lock(hashtext('license-system-schema'))")
+                    await conn.execute(self.schema)
+            self._ready = True
+        return pool
+
+    @asynccontextmanager
+    async def _transaction(self):
+        pool = await self._pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                yield conn
+
+    async def _fetch(self, query: str, *args):
+        pool = await self._pool()
+        return await pool.fetch(query, *args)
+
+    async def _fetchrow(self, query: str, *args):
+        pool = await self._pool()
+        return await pool.fetchrow(query, *args)
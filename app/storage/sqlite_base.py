@@ -0,0 +1,64 @@
+from typing import Dict
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+def sqlite_path(database_url: str) -> str:
+    """Turn a sqlite:/// URL into a filesystem path."""
+    if database_url.startswith("sqlite:///"):
+        return database_url[len("sqlite:///"):]
+    if database_url.startswith("sqlite://"):
+        return database_url[len("sqlite://"):] or ":memory:"
+    raise Exception(f"Unsupported DATABASE_URL: {database_url}")
+
+
+class SQLiteBase:
+    """Per-thread WAL connections plus an IMMEDIATE write transaction helper.
+
+    Subclasses set `schema`, which is applied on construction, and may list
+    columns added after a table first shipped in `added_columns` as
+    {table: {column: declaration}}; missing ones are added with ALTER TABLE.
+    """
+
+    schema = ""
+    added_columns: Dict[str, Dict[str, str]] = {}
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        if self.schema:
+            self._connect().executescript(self.schema)
+        self._add_missing_columns()
+
+    def _add_missing_columns(self) -> None:
+        conn = self._connect()
+        for table, columns in self.added_columns.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, declaration in columns.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two writers
+        # (threads or processes) can never select and claim the same row.
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
@@ -0,0 +1,54 @@
+from typing import Awaitable, Callable, Iterable, List, Union, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+
+async def gather_bounded(
+    operations: Iterable[Callable[[], Awaitable[T]]],
+    limit: int
+) -> List[Union[T, Exception]]:
+    """Run `operations` in a task group with at most `limit` in flight.
+
+    Results come back in input order. A failing operation's exception is
+    returned in its slot rather than raised, so it does not cancel its
+    siblings half-way through their writes.
+    """
+    operations = list(operations)
+    results: List[Union[T, Exception]] = [None] * len(operations)
+    slots = asyncio.Semaphore(max(1, limit))
+
+    async def run(index: int, operation: Callable[[], Awaitable[T]]) -> None:
+        async with slots:
+            try:
+                results[index] = await operation()
+            except Exception as e:
+                results[index] = e
+
+    async with asyncio.TaskGroup() as group:
+        for index, operation in enumerate(operations):
+            group.create_task(run(index, operation))
+    return results
+
+
+class RateLimiter:
+    """Paces work to `rate` units per second on average.
+
+    `wait(n)` books n units on a virtual clock and sleeps until the booking
+    starts, so concurrent callers share one budget and a batch may go out
+    in one burst as long as the long-run rate holds.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = 0.0
+
+    async def wait(self, units: int = 1) -> None:
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._next)
+        self._next = start + units / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
@@ -0,0 +1,165 @@
+"""Incremental parsing of bulk license key uploads.
+
+Accepts newline-delimited text (``lines``), ``csv`` or ``ndjson``, optionally
+gzip-compressed, as an async stream of byte chunks. Only the current chunk
+and at most one partial line are held in memory, so uploads of any size
+parse in bounded memory.
+"""
+from typing import AsyncIterator, Optional, Tuple
+import codecs
+import csv
+import json
+import zlib
+
+FORMATS = ("lines", "csv", "ndjson")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_MAX_INFLATE = 1 << 20  # Inflate at most 1 MiB of output per step
+
+
+class ImportFormatError(Exception):
+    """The upload cannot be parsed at all (bad format, encoding or gzip stream)."""
+
+
+class ImportTooLarge(Exception):
+    """The upload, once inflated, is larger than the configured limit."""
+
+
+def _counted(data: bytes, size: int, max_bytes: Optional[int]) -> int:
+    size += len(data)
+    if max_bytes is not None and size > max_bytes:
+        raise ImportTooLarge(f"Upload larger than {max_bytes} bytes")
+    return size
+
+
+async def _inflate(
+    chunks: AsyncIterator[bytes], gzipped: Optional[bool], max_bytes: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    # gzipped=None sniffs the magic bytes of the first chunk. The limit counts
+    # inflated bytes, so a small gzip bomb is cut off as early as a large body.
+    decompressor = None
+    size = 0
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if gzipped is None:
+            gzipped = chunk.startswith(_GZIP_MAGIC)
+        if not gzipped:
+            size = _counted(chunk, size, max_bytes)
+            yield chunk
+            continue
+        if decompressor is None:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            data = decompressor.decompress(chunk, _MAX_INFLATE)
+            while data:
+                size = _counted(data, size, max_bytes)
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail, _MAX_INFLATE)
+        except zlib.error as e:
+            raise ImportFormatError(f"Invalid gzip stream: {str(e)}")
+    if decompressor is not None and not decompressor.eof:
+        raise ImportFormatError("Truncated gzip stream")
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes],
+    gzipped: Optional[bool] = None,
+    max_line_length: int = 4096,
+    max_bytes: Optional[int] = None
+) -> AsyncIterator[Tuple[int, Optional[str]]]:
+    """Yield (line number, text) for each line of a UTF-8 upload.
+
+    A line longer than `max_line_length` is skipped and yielded as
+    (line number, None) rather than buffered. More than `max_bytes` of
+    (inflated) input raises ImportTooLarge.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    partial = ""
+    overlong = False
+    line_no = 0
+    try:
+        async for data in _inflate(chunks, gzipped, max_bytes):
+            lines = (partial + decoder.decode(data)).split("\n")
+            partial = lines.pop()
+            for line in lines:
+                line_no += 1
+                if overlong:
+                    overlong = False
+                    yield line_no, None
+                else:
+                    yield line_no, line.rstrip("\r")
+            if len(partial) > max_line_length:
+                partial = ""
+                overlong = True
+        partial += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f"Upload is not valid UTF-8 (line {line_no + 1}): {str(e)}")
+    if overlong:
+        yield line_no + 1, None
+    elif partial:
+        yield line_no + 1, partial.rstrip("\r")
+
+
+class KeyParser:
+    """Turns upload lines into license keys for one format.
+
+    `parse` returns the key, None for a line to skip silently (blank lines,
+    a CSV header), or raises ValueError with the reason a line is rejected.
+    """
+
+    def __init__(self, fmt: str = "lines", column: str = "0", max_key_length: int = 256):
+        if fmt not in FORMATS:
+            raise ImportFormatError(f"Unsupported format: {fmt} (expected one of {', '.join(FORMATS)})")
+        self.fmt = fmt
+        self.max_key_length = max_key_length
+        # CSV column by index, or by header name (the first row is then a header).
+        self._column_name = None if column.isdigit() else column
+        self._column = int(column) if column.isdigit() else None
+
+    def _validate(self, key: str) -> str:
+        key = key.strip()
+        if not key:
+            raise ValueError("empty key")
+        if len(key) > self.max_key_length:
+            raise ValueError(f"key longer than {self.max_key_length} characters")
+        if any(c.isspace() or not c.isprintable() for c in key):
+            raise ValueError("key contains whitespace or control characters")
+        return key
+
+    def _csv_field(self, line: str) -> Optional[str]:
+        row = next(csv.reader([line]))
+        if self._column is None:
+            names = [name.strip() for name in row]
+            if self._column_name not in names:
+                raise ImportFormatError(f"CSV header has no column named {self._column_name!r}")
+            self._column = names.index(self._column_name)
+            return None
+        if self._column >= len(row):
+            raise ValueError(f"row has no column {self._column}")
+        return row[self._column]
+
+    def _ndjson_field(self, line: str) -> str:
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON: {e.msg}")
+        if isinstance(value, dict):
+            value = value.get("license_key", value.get("key"))
+        if not isinstance(value, str):
+            raise ValueError("expected a string or an object with a 'license_key' field")
+        return value
+
+    def parse(self, line: Optional[str]) -> Optional[str]:
+        if line is None:
+            raise ValueError("line too long")
+        if not line.strip():
+            return None
+        if self.fmt == "csv":
+            line = self._csv_field(line)
+            if line is None:
+                return None
+        elif self.fmt == "ndjson":
+            line = self._ndjson_field(line)
+        return self._validate(line)
+
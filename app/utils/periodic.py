@@ -0,0 +1,13 @@
+from typing import Awaitable, Callable
+import asyncio
+import logging
+
+
+async def run_periodically(name: str, func: Callable[[], Awaitable], interval_seconds: float) -> None:
+    """Call `func` every `interval_seconds` until cancelled, logging failures."""
+    while True:
+        try:
+            await func()
+        except Exception as e:
+            logging.error(f"{name} failed: {str(e)}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,111 @@
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import random
+import time
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the operation while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+
+    While open every call fails fast; after `reset_seconds` a single trial
+    call is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 60):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Free the half-open trial slot of a call that ended with no outcome (cancelled)."""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff for the given 1-based attempt."""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+
+
+async def retry_async(
+    operation: Callable[[], Awaitable[T]],
+    max_attempts: int,
+    base_delay: float,
+    max_delay: float,
+    attempt_timeout: Optional[float] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    stats: Optional[dict] = None
+) -> T:
+    """Run `operation` until it succeeds or `max_attempts` is exhausted.
+
+    Sleeps with asyncio between attempts so the event loop keeps serving
+    other requests. `stats`, when given, is a counter dict updated in place.
+    """
+    stats = stats if stats is not None else {}
+    last_error: Optional[Exception] = None
+    for attempt in range(1, max_attempts + 1):
+        if breaker is not None and not breaker.allow():
+            stats["circuit_rejected"] = stats.get("circuit_rejected", 0) + 1
+            raise CircuitOpenError("Circuit open; skipping call") from last_error
+        stats["attempts"] = stats.get("attempts", 0) + 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(operation(), attempt_timeout)
+        except Exception as e:
+            last_error = e
+            stats["attempt_seconds"] = stats.get("attempt_seconds", 0.0) + time.perf_counter() - started
+            stats["failures"] = stats.get("failures", 0) + 1
+            if isinstance(e, asyncio.TimeoutError):
+                stats["timeouts"] = stats.get("timeouts", 0) + 1
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt < max_attempts:
+                stats["retries"] = stats.get("retries", 0) + 1
+                await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
+            continue
+        except BaseException:
+            # Cancelled mid-call: neither hook ran, so the trial must not stay claimed.
+            if breaker is not None:
+                breaker.release_trial()
+            raise
+        stats["attempt_seconds"] = stats.get("attempt_seconds", 0.0) + time.perf_counter() - started
+        stats["successes"] = stats.get("successes", 0) + 1
+        if breaker is not None:
+            breaker.record_success()
+        return result
+    raise last_error
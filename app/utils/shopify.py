@@ -1,22 +1,101 @@
+from typing import Dict
 import hmac
 import hashlib
 import base64
+import binascii
+import json
 from fastapi import Request
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Line item fields read by category resolution and order processing.
+LINE_ITEM_FIELDS = ("product_id", "variant_id", "sku", "title", "quantity")
+
+
+class WebhookRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sign_webhook(body: bytes, webhook_secret: str) -> str:
+    """X-Shopify-Hmac-SHA256 value for a body (for tests and load generators)"""
+    digest = hmac.new(webhook_secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+
+class WebhookVerifier:
+    """Reads a Shopify webhook body and checks its signature as it streams.
+
+    The keyed HMAC state is built once and copied per request. Requests
+    are rejected before the body is read when the signature header is
+    missing or malformed or Content-Length is over `max_body_bytes`, and
+    mid-stream once the body grows past it. The digest is compared as raw
+    bytes against the decoded header.
+    """
+
+    def __init__(self, webhook_secret: str, max_body_bytes: int = 1048576):
+        self._mac = hmac.new(webhook_secret.encode('utf-8'), digestmod=hashlib.sha256)
+        self.max_body_bytes = max_body_bytes
+
+    async def read_verified(self, request: Request) -> bytes:
+        """The raw body, or WebhookRejected (401 bad signature, 413 too large)."""
+        hmac_header = request.headers.get('X-Shopify-Hmac-SHA256')
+        if not hmac_header:
+            raise WebhookRejected(401, "Missing webhook signature")
+        try:
+            expected = base64.b64decode(hmac_header, validate=True)
+        except (binascii.Error, ValueError):
+            raise WebhookRejected(401, "Invalid webhook signature")
+        if len(expected) != self._mac.digest_size:
+            raise WebhookRejected(401, "Invalid webhook signature")
+        content_length = request.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            raise WebhookRejected(413, "Webhook payload too large")
+
+        mac = self._mac.copy()
+        chunks = []
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                raise WebhookRejected(413, "Webhook payload too large")
+            mac.update(chunk)
+            chunks.append(chunk)
+        if not hmac.compare_digest(mac.digest(), expected):
+            raise WebhookRejected(401, "Invalid webhook signature")
+        body = b"".join(chunks)
+        request._body = body  # Allow re-reading if needed
+        return body
+
+
 async def verify_webhook(request: Request, webhook_secret: str) -> bool:
     """Verify Shopify webhook signature (raw body, no re-encoding)"""
-    hmac_header = request.headers.get('X-Shopify-Hmac-SHA256')
-    if not hmac_header:
+    try:
+        await WebhookVerifier(webhook_secret, max_body_bytes=2 ** 63).read_verified(request)
+    except WebhookRejected:
         return False
+    return True
 
-    body = await request.body()
-    request._body = body  # Allow re-reading if needed
 
-    digest = hmac.new(
-        webhook_secret.encode('utf-8'),
-        body,
-        hashlib.sha256
-    ).digest()
-    computed_hmac = base64.b64encode(digest).decode('utf-8')
+def parse_order(body: bytes) -> Dict:
+    """order_number and the line item fields we use, from an orders/paid payload.
 
-    return hmac.compare_digest(computed_hmac, hmac_header)
+    Decoded with orjson when installed; everything else in the payload
+    (addresses, tax lines, ...) is dropped right away.
+    """
+    data = _loads(body)
+    if not isinstance(data, dict) or "order_number" not in data:
+        raise ValueError("Webhook payload has no order_number")
+    return {
+        "order_number": data["order_number"],
+        "line_items": [
+            {field: item[field] for field in LINE_ITEM_FIELDS if field in item}
+            for item in data.get("line_items") or ()
+        ]
+    }
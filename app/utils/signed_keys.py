@@ -0,0 +1,138 @@
+"""Offline-verifiable, Ed25519-signed license keys.
+
+Key text is ``<PREFIX>-<BASE32>``, where PREFIX is the category prefix from
+Settings.LICENSE_CATEGORIES and BASE32 encodes ``payload || signature``.
+The payload is::
+
+    version  (1 byte)
+    serial   (8 bytes, random; what the revocation list stores)
+    expiry   (4 bytes, unix seconds, big endian; 0 = no expiry)
+    order_len(1 byte) + order id (utf-8)
+
+The signature covers ``PREFIX || "-" || payload``, so the category cannot be
+swapped. Clients only need the public key, `verify_signed_key` and
+`is_revoked` to check a key without calling the server.
+
+Requires the optional `cryptography` package.
+"""
+from typing import Optional, List, Dict, Iterable
+import base64
+import bisect
+import os
+import struct
+
+VERSION = 1
+SERIAL_SIZE = 8
+SIGNATURE_SIZE = 64
+_HEADER = struct.Struct(">B8sIB")
+
+
+def _b32encode(data: bytes) -> str:
+    return base64.b32encode(data).decode("ascii").rstrip("=")
+
+
+def _b32decode(text: str) -> bytes:
+    return base64.b32decode(text + "=" * (-len(text) % 8))
+
+
+def _ed25519():
+    try:
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+    except ImportError:
+        raise Exception("Signed license keys require the 'cryptography' package")
+    return ed25519
+
+
+def generate_signing_key() -> str:
+    """Return a new base64-encoded Ed25519 private key seed for LICENSE_SIGNING_KEY."""
+    return base64.b64encode(os.urandom(32)).decode("ascii")
+
+
+class LicenseSigner:
+    def __init__(self, signing_key: str):
+        ed25519 = _ed25519()
+        from cryptography.hazmat.primitives import serialization
+        self._private_key = ed25519.Ed25519PrivateKey.from_private_bytes(base64.b64decode(signing_key))
+        self.public_key = self._private_key.public_key().public_bytes(
+            serialization.Encoding.Raw, serialization.PublicFormat.Raw
+        )
+
+    def sign(self, prefix: str, order_number: Optional[str] = None, expires_at: Optional[float] = None) -> str:
+        return self.sign_batch(prefix, 1, order_number, expires_at)[0]
+
+    def sign_batch(
+        self,
+        prefix: str,
+        count: int,
+        order_number: Optional[str] = None,
+        expires_at: Optional[float] = None
+    ) -> List[str]:
+        """Mint `count` keys sharing a prefix, order id and expiry."""
+        order = (order_number or "").encode("utf-8")
+        if len(order) > 255:
+            raise ValueError("Order id too long for a signed key")
+        expiry = int(expires_at or 0)
+        signed_prefix = prefix.encode("ascii") + b"-"
+        sign = self._private_key.sign
+        serials = os.urandom(SERIAL_SIZE * count)
+        keys = []
+        for i in range(count):
+            payload = _HEADER.pack(VERSION, serials[i * SERIAL_SIZE:(i + 1) * SERIAL_SIZE], expiry, len(order)) + order
+            keys.append(f"{prefix}-{_b32encode(payload + sign(signed_prefix + payload))}")
+        return keys
+
+
+def decode_signed_key(license_key: str) -> Optional[Dict]:
+    """Parse a signed key without checking its signature. None if it is not one."""
+    prefix, sep, body = license_key.partition("-")
+    if not sep or not body or not prefix.isascii():
+        return None
+    try:
+        raw = _b32decode(body)
+    except Exception:
+        return None
+    if len(raw) < _HEADER.size + SIGNATURE_SIZE:
+        return None
+    payload, signature = raw[:-SIGNATURE_SIZE], raw[-SIGNATURE_SIZE:]
+    version, serial, expiry, order_len = _HEADER.unpack_from(payload)
+    if version != VERSION or len(payload) != _HEADER.size + order_len:
+        return None
+    return {
+        "prefix": prefix,
+        "serial": serial,
+        "expires_at": expiry or None,
+        "order_number": payload[_HEADER.size:].decode("utf-8") or None,
+        "payload": payload,
+        "signature": signature
+    }
+
+
+def verify_signed_key(license_key: str, public_key: bytes) -> Optional[Dict]:
+    """Return the decoded key if its signature is valid, else None.
+
+    Expiry and revocation are left to the caller (see `is_revoked`).
+    """
+    decoded = decode_signed_key(license_key)
+    if decoded is None:
+        return None
+    from cryptography.exceptions import InvalidSignature
+    verifier = _ed25519().Ed25519PublicKey.from_public_bytes(public_key)
+    try:
+        verifier.verify(decoded["signature"], decoded["prefix"].encode("ascii") + b"-" + decoded["payload"])
+    except InvalidSignature:
+        return None
+    return decoded
+
+
+def build_revocation_list(serials: Iterable[bytes]) -> bytes:
+    """Pack revoked serials into one sorted, fixed-width blob."""
+    return b"".join(sorted(set(serials)))
+
+
+def is_revoked(serial: bytes, revocation_list: bytes) -> bool:
+    """Binary search a blob from `build_revocation_list`."""
+    count = len(revocation_list) // SERIAL_SIZE
+    index = bisect.bisect_left(
+        range(count), serial, key=lambda i: revocation_list[i * SERIAL_SIZE:(i + 1) * SERIAL_SIZE]
+    )
+    return index < count and revocation_list[index * SERIAL_SIZE:(index + 1) * SERIAL_SIZE] == serial
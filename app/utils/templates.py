@@ -0,0 +1,32 @@
+import os
+from app.config import get_settings
+
+settings = get_settings()
+
+TEMPLATES_DIR = settings.TEMPLATES_DIR or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
+
+_env = None
+
+
+def get_env():
+    """The shared Jinja2 Environment, built (and jinja2 imported) on first use.
+
+    One shared Environment: each template is compiled once and kept in the
+    Environment's cache. The bytecode cache lets fresh workers skip
+    compilation too, and auto_reload (dev only) re-checks template mtimes
+    on every lookup.
+    """
+    global _env
+    if _env is None:
+        from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+        _env = Environment(
+            loader=FileSystemLoader(TEMPLATES_DIR),
+            autoescape=select_autoescape(["html"]),
+            bytecode_cache=FileSystemBytecodeCache(settings.TEMPLATE_BYTECODE_CACHE_DIR or None),
+            auto_reload=settings.TEMPLATE_AUTO_RELOAD
+        )
+    return _env
+
+
+def render(template_name: str, **context) -> str:
+    return get_env().get_template(template_name).render(**context)
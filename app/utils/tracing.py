@@ -0,0 +1,176 @@
+"""Correlation ids, timing spans and latency histograms.
+
+Every request gets a correlation id (X-Shopify-Webhook-Id, else
+X-Request-Id, else a random one) that is attached to all log records
+emitted while handling it. `span("name")` times a block: the duration goes
+into a process-wide histogram (exported by `prometheus_histograms`) and
+into the request's span list, which is logged as one structured line when
+the request finishes. A span costs two perf_counter calls and a bisect.
+"""
+from typing import Dict, List, Optional, Tuple
+import bisect
+import contextvars
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+_fields: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("trace_fields", default=None)
+_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("trace_spans", default=None)
+
+logger = logging.getLogger("app.trace")
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+histograms: Dict[str, Histogram] = {}
+
+
+def observe(name: str, seconds: float) -> None:
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms.setdefault(name, Histogram())
+    histogram.observe(seconds)
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block (sync or async code) as `name`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+def bind(**fields) -> None:
+    """Attach fields (e.g. order_number) to the current request's log records."""
+    current = _fields.get()
+    if current is not None:
+        current.update(fields)
+
+
+class CorrelationFilter(logging.Filter):
+    """Adds correlation_id and bound fields to every record logged in a request."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = _correlation_id.get()
+        fields = _fields.get()
+        if fields:
+            for key, value in fields.items():
+                setattr(record, key, value)
+        return True
+
+
+def configure_logging(fmt: str = "json", level: str = "INFO") -> None:
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        try:
+            from pythonjsonlogger import jsonlogger
+            handler.setFormatter(jsonlogger.JsonFormatter(
+                "%(asctime)s %(levelname)s %(name)s %(message)s %(correlation_id)s",
+                rename_fields={"levelname": "level", "asctime": "time"}
+            ))
+        except ImportError:
+            fmt = "text"
+    if fmt != "json":
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s"
+        ))
+    handler.addFilter(CorrelationFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware: sets up the request's trace context, times the
+    whole request per endpoint, echoes the correlation id as X-Request-Id
+    and logs the span breakdown of requests slower than `log_min_seconds`."""
+
+    def __init__(self, app, log_min_seconds: float = 0.25):
+        self.app = app
+        self.log_min_seconds = log_min_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or ())
+        request_id = (
+            headers.get(b"x-shopify-webhook-id") or headers.get(b"x-request-id") or b""
+        ).decode("latin-1") or uuid.uuid4().hex
+        tokens = (_correlation_id.set(request_id), _fields.set({}), _spans.set([]))
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            endpoint = scope.get("endpoint")
+            name = f"http.{endpoint.__name__}" if endpoint is not None else "http.unmatched"
+            if elapsed >= self.log_min_seconds and logger.isEnabledFor(logging.INFO):
+                spans = {}
+                for span_name, seconds in _spans.get():
+                    spans[span_name] = spans.get(span_name, 0.0) + seconds
+                logger.info("request", extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "endpoint": name,
+                    "status": status,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "spans_ms": {span_name: round(seconds * 1000, 3) for span_name, seconds in spans.items()}
+                })
+            for var, token in zip((_correlation_id, _fields, _spans), tokens):
+                var.reset(token)
+            observe(name, elapsed)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_histograms(metric: str = "app_duration_seconds") -> str:
+    """All span and request histograms in the Prometheus text format."""
+    lines = [f"# HELP {metric} Time spent per request endpoint and hot-path span", f"# TYPE {metric} histogram"]
+    for name, histogram in sorted(histograms.items()):
+        label = _label(name)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{span="{label}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{metric}_sum{{span="{label}"}} {histogram.total}')
+        lines.append(f'{metric}_count{{span="{label}"}} {histogram.count}')
+    return "\n".join(lines) + "\n"
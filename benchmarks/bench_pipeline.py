@@ -0,0 +1,216 @@
+"""Latency and throughput of the license pipeline, end to end.
+
+    python -m benchmarks.bench_pipeline [--orders 500] [--concurrency 16] [--inventory 20000] [--json]
+
+Runs the FastAPI app in-process (httpx ASGI transport) against a throwaway
+SQLite database and a local SMTP sink (benchmarks.smtp_sink), with signed
+synthetic Shopify payloads. Reports p50/p95/p99 latency and requests/s for
+email rendering, bulk import, the order webhook (first delivery and
+replay), outbox delivery and /verify-license (cold and warm cache). --json
+prints the same numbers in a form that can be diffed between runs. Logging
+keeps the service's settings (LOG_LEVEL, LOG_FORMAT, REQUEST_LOG_MIN_SECONDS
+from the environment or .env), so its cost is part of what is measured;
+log lines go to stderr.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from benchmarks.smtp_sink import SMTPSink
+
+WEBHOOK_SECRET = "bench-secret"
+ADMIN_KEY = "bench-admin"
+CATEGORIES = {"1": "basic", "2": "pro", "3": "enterprise"}  # product id suffix -> fallback category
+
+
+def summarize(name: str, latencies: list, elapsed: float, units: int = None) -> dict:
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000 if ordered else 0.0
+
+    return {
+        "scenario": name,
+        "requests": len(latencies) or units or 0,
+        "per_second": (units if units is not None else len(latencies)) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "seconds": elapsed
+    }
+
+
+async def run_concurrently(calls, concurrency: int) -> tuple:
+    """Await each zero-argument coroutine function in `calls`, `concurrency` at a time."""
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed(call):
+        async with slots:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(call) for call in calls))
+    return latencies, time.perf_counter() - started
+
+
+def synthetic_order(order_number: int) -> dict:
+    items = []
+    for suffix in random.sample(sorted(CATEGORIES), random.randint(1, 3)):
+        items.append({
+            "product_id": int(f"{random.randint(1000, 9999)}{suffix}"),
+            "title": f"{CATEGORIES[suffix].title()} License",
+            "quantity": random.randint(1, 2)
+        })
+    return {"order_number": order_number, "email": "customer@example.com", "line_items": items}
+
+
+async def bench(args) -> list:
+    sink = SMTPSink()
+    os.environ.update({
+        "DATABASE_URL": "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"),
+        "SHOPIFY_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "ADMIN_API_KEY": ADMIN_KEY,
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(await sink.start()),
+        "SMTP_USERNAME": "",
+        "PRODUCT_CATEGORY_MAP": "{}",
+        "PRODUCT_CATEGORY_FILE": "",
+        "OUTBOX_POLL_SECONDS": "0.05"
+    })
+    # Settings are read at import time, so the app is imported only now.
+    import httpx
+    import main
+    from app.services import email_service
+    from app.services.verification import get_verifier
+    from app.storage.idempotency_store import get_idempotency_store
+    from app.storage.outbox_store import get_outbox_store
+    from app.utils.shopify import sign_webhook
+
+    results = []
+    await main.startup_event()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Email rendering (synchronous, per message).
+        latencies = []
+        started = time.perf_counter()
+        for i in range(args.renders):
+            t = time.perf_counter()
+            email_service.build_license_email("c@example.com", str(i), "Pro License", [f"PRO-{i}-{j}" for j in range(3)])
+            latencies.append(time.perf_counter() - t)
+        results.append(summarize("render license email", latencies, time.perf_counter() - started))
+
+        # Bulk import: the inventory, split across several streamed requests.
+        per_request = max(1, args.inventory // args.import_requests)
+
+        def import_call(category: str, start: int):
+            async def body():
+                for chunk_start in range(start, start + per_request, 1000):
+                    end = min(chunk_start + 1000, start + per_request)
+                    yield "".join(f"{category.upper()}-{n:09d}\n" for n in range(chunk_start, end)).encode()
+
+            async def call():
+                response = await client.post(
+                    f"/licenses/import/{category}", content=body(), headers={"X-API-Key": ADMIN_KEY}
+                )
+                assert response.status_code == 200, response.text
+            return call
+
+        calls = [
+            import_call(category, n * per_request)
+            for category in CATEGORIES.values()
+            for n in range(args.import_requests)
+        ]
+        latencies, elapsed = await run_concurrently(calls, 1)
+        results.append(summarize("bulk import (keys/s)", latencies, elapsed, units=len(calls) * per_request))
+
+        # Order webhook.
+        def webhook_call(order_number: int):
+            body = json.dumps(synthetic_order(order_number)).encode()
+            headers = {
+                "X-Shopify-Hmac-SHA256": sign_webhook(body, WEBHOOK_SECRET),
+                "X-Shopify-Webhook-Id": f"bench-{order_number}",
+                "Content-Type": "application/json"
+            }
+
+            async def call():
+                response = await client.post("/webhook/order/paid", content=body, headers=headers)
+                assert response.status_code == 200, response.text
+            return call
+
+        sent_before = sink.received
+        latencies, elapsed = await run_concurrently(
+            [webhook_call(1_000_000 + n) for n in range(args.orders)], args.concurrency
+        )
+        results.append(summarize("POST /webhook/order/paid", latencies, elapsed))
+        webhook_elapsed = elapsed
+
+        # Shopify retries of the same deliveries, answered before parsing.
+        latencies, elapsed = await run_concurrently(
+            [webhook_call(1_000_000 + n) for n in range(args.orders)], args.concurrency
+        )
+        results.append(summarize("POST /webhook/order/paid (replay)", latencies, elapsed))
+
+        # Outbox delivery to the SMTP sink, from the first webhook until empty.
+        started = time.perf_counter() - webhook_elapsed - elapsed
+        while True:
+            counts = await get_outbox_store().stats()
+            if counts.get("pending", 0) + counts.get("sending", 0) == 0:
+                break
+            await asyncio.sleep(0.05)
+        delivered = sink.received - sent_before
+        results.append(summarize("outbox -> SMTP (messages/s)", [], time.perf_counter() - started, units=delivered))
+
+        # License verification over the keys the webhook issued.
+        issued = []
+        for n in range(args.orders):
+            record = await get_idempotency_store().lookup(str(1_000_000 + n))
+            for keys in (record or {}).get("license_keys", {}).values():
+                issued.extend(keys)
+        lookups = [random.choice(issued) for _ in range(args.verifications)] if issued else []
+
+        def verify_call(key: str):
+            async def call():
+                response = await client.get(f"/verify-license/{key}")
+                assert response.status_code == 200, response.text
+            return call
+
+        for label in ("cold", "warm"):
+            if label == "cold":
+                get_verifier().cache.clear()
+            latencies, elapsed = await run_concurrently([verify_call(key) for key in lookups], args.concurrency)
+            results.append(summarize(f"GET /verify-license ({label} cache)", latencies, elapsed))
+    await main.shutdown_event()
+    await sink.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--inventory", type=int, default=20000, help="keys imported per category")
+    parser.add_argument("--import-requests", type=int, default=4, help="import requests per category")
+    parser.add_argument("--verifications", type=int, default=5000)
+    parser.add_argument("--renders", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    results = asyncio.run(bench(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'scenario':36} {'count':>7} {'per sec':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['scenario']:36} {r['requests']:>7} {r['per_second']:>10,.0f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
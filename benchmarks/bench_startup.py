@@ -0,0 +1,59 @@
+"""Cold-start cost of a worker: importing the app and running its startup.
+
+    python -m benchmarks.bench_startup [runs] [--startup]
+
+Each run is a fresh interpreter (as a new uvicorn worker or a scaled-out
+pod would be) that times `import main`, and with --startup also
+`main.startup_event()`, against a throwaway SQLite database. Reports the
+median and worst time and peak RSS over the runs.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = """
+import asyncio, json, resource, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter() - started
+startup = 0.0
+if sys.argv[1] == "1":
+    started = time.perf_counter()
+    asyncio.run(main.startup_event())
+    startup = time.perf_counter() - started
+print(json.dumps({
+    "import_ms": imported * 1000,
+    "startup_ms": startup * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+}))
+"""
+
+
+def main(runs: int = 10, with_startup: bool = False) -> None:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(
+        os.environ,
+        PYTHONPATH=root,
+        LOG_LEVEL="ERROR",
+        PRODUCT_CATEGORY_FILE="",
+        DATABASE_URL="sqlite:///" + os.path.join(tempfile.mkdtemp(), "startup.db")
+    )
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, "1" if with_startup else "0"],
+            env=env, cwd=root, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    for field in ("import_ms", "startup_ms", "max_rss_mb") if with_startup else ("import_ms", "max_rss_mb"):
+        values = [sample[field] for sample in samples]
+        print(f"{field:12} median {statistics.median(values):8.1f}  max {max(values):8.1f}")
+
+
+if __name__ == "__main__":
+    arguments = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    main(*(int(arg) for arg in arguments[:1]), with_startup="--startup" in sys.argv)
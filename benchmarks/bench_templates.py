@@ -0,0 +1,34 @@
+"""Per-render cost of the license email: compile-per-send vs the shared Environment.
+
+    python -m benchmarks.bench_templates [iterations]
+"""
+import sys
+import timeit
+from jinja2 import Template
+from app.utils import templates
+
+CONTEXT = {
+    "order_number": "1001",
+    "product_name": "Pro",
+    "license_keys": [f"PRO-{i:04d}-XXXX-YYYY" for i in range(5)],
+    "shop_domain": "example.myshopify.com",
+    "current_year": 2025,
+}
+
+
+def main(iterations: int = 2000) -> None:
+    env = templates.get_env()
+    with open(env.loader.get_source(env, "license_email.html")[1], encoding="utf-8") as f:
+        source = f.read()
+    templates.render("license_email.html", **CONTEXT)  # warm the Environment cache
+
+    per_send = timeit.timeit(lambda: Template(source, autoescape=True).render(**CONTEXT), number=iterations)
+    cached = timeit.timeit(lambda: templates.render("license_email.html", **CONTEXT), number=iterations)
+
+    print(f"Template(source).render per send: {per_send / iterations * 1e6:9.1f} us/render")
+    print(f"shared Environment render:        {cached / iterations * 1e6:9.1f} us/render")
+    print(f"speedup:                          {per_send / cached:9.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,81 @@
+"""Minimal local SMTP server that accepts and counts messages.
+
+    python -m benchmarks.smtp_sink [port]
+
+Speaks just enough plain SMTP (no TLS, no AUTH) for aiosmtplib: run the
+app with SMTP_PORT set to the sink's port and SMTP_USERNAME empty.
+"""
+import asyncio
+import sys
+import time
+
+
+class SMTPSink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.received = 0
+        self.first_at = None
+        self.last_at = None
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._session, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        def reply(line: str) -> None:
+            writer.write(line.encode("ascii") + b"\r\n")
+
+        reply("220 smtp-sink ready")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode("ascii", "replace").strip().upper()
+                if command.startswith("EHLO"):
+                    reply("250-smtp-sink")
+                    reply("250-8BITMIME")
+                    reply("250 SIZE 52428800")
+                elif command.startswith("DATA"):
+                    reply("354 end data with <CR><LF>.<CR><LF>")
+                    while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        pass
+                    self.received += 1
+                    self.last_at = time.perf_counter()
+                    self.first_at = self.first_at or self.last_at
+                    reply("250 queued")
+                elif command.startswith("QUIT"):
+                    reply("221 bye")
+                    await writer.drain()
+                    break
+                else:
+                    # HELO, MAIL, RCPT, RSET and NOOP all just succeed.
+                    reply("250 ok")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve(port: int) -> None:
+    sink = SMTPSink(port=port)
+    print(f"SMTP sink listening on 127.0.0.1:{await sink.start()}")
+    try:
+        while True:
+            await asyncio.sleep(5)
+            print(f"received {sink.received} messages")
+    finally:
+        await sink.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(_serve(int(sys.argv[1]) if len(sys.argv) > 1 else 2525))
@@ -0,0 +1,98 @@
+"""Claim throughput under contention: N worker processes drain one category
+and race on the same orders.
+
+    python -m benchmarks.stress_claims [workers] [keys] [keys_per_order]
+
+Uses DATABASE_URL when set (point it at a scratch Postgres database to test
+a cluster setup); otherwise a throwaway SQLite file. The correctness side
+(no key issued twice, every order claimed once, counters matching rows) is
+checked by tests/test_claim_concurrency.py, which calls `run_claims`.
+"""
+from typing import Dict
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+
+def _worker(category: str, keys_per_order: int, orders: int, max_claims: int, start, results) -> None:
+    from app.storage.idempotency_store import get_idempotency_store
+    from app.storage.key_store import get_key_store
+    from app.storage.postgres_base import close_pools
+
+    async def run():
+        store = get_key_store()
+        begun = []
+        for order in range(orders):
+            if await get_idempotency_store().begin(f"{category}-order-{order}") is None:
+                begun.append(order)
+        issued = []
+        # Bounded by what the seeded stock can satisfy, so a store that
+        # issues keys twice ends the race instead of claiming forever.
+        for _ in range(max_claims):
+            claimed = await store.claim(f"{category}-{os.getpid()}-{len(issued)}", {category: keys_per_order})
+            if category not in claimed:
+                break
+            issued.extend(claimed[category])
+        await close_pools()
+        return begun, issued
+
+    start.wait()
+    results.put(asyncio.run(run()))
+
+
+def run_claims(workers: int, keys: int, keys_per_order: int, orders: int = 500) -> Dict:
+    """Seed a fresh category with `keys` keys and let `workers` processes race
+    to claim them all and to begin the same `orders` orders.
+
+    Returns the category, the order numbers each `begin` won (across all
+    workers), every key issued, and the wall time of the race.
+    """
+    from app.storage.key_store import get_key_store
+    from app.storage.postgres_base import close_pools
+
+    category = f"stress-{uuid.uuid4().hex[:8]}"
+    seeded = [f"{category}-{i:08d}" for i in range(keys)]
+
+    async def seed():
+        await get_key_store().add(category, seeded)
+        await close_pools()  # asyncpg pools are bound to this event loop
+
+    asyncio.run(seed())
+
+    context = multiprocessing.get_context("spawn")
+    start = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(category, keys_per_order, orders, keys // keys_per_order + 1, start, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    started = time.perf_counter()
+    start.set()
+    outcomes = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return {
+        "category": category,
+        "begun": [order for worker_orders, _ in outcomes for order in worker_orders],
+        "issued": [key for _, worker_keys in outcomes for key in worker_keys],
+        "elapsed": elapsed
+    }
+
+
+def main(workers: int = 8, keys: int = 20000, keys_per_order: int = 3) -> None:
+    if "DATABASE_URL" not in os.environ:
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "stress.db")
+    result = run_claims(workers, keys, keys_per_order)
+    issued, elapsed = len(result["issued"]), result["elapsed"]
+    print(f"{workers} workers claimed {issued} keys in {elapsed:.2f}s ({issued / elapsed:,.0f} keys/s)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:4]))
@@ -1,102 +1,228 @@
 from fastapi import FastAPI, Request, HTTPException, Header
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+import asyncio
+import base64
 import logging
 import os
-from app.config import Settings
-from app.services import email_service, license_service
-from app.utils.shopify import verify_webhook
-from pathlib import Path
+from app.config import get_settings
+from app.services import backorders, email_service, inventory, license_service, outbox, reservations, resend
+from app.services.category_resolver import get_category_resolver
+from app.services.verification import TTLCache
+from app.services.smtp_pool import close_smtp_pool
+from app.storage.idempotency_store import (
+    get_idempotency_store, IN_PROGRESS, DELIVERED, PARTIAL, OUT_OF_STOCK, BACKORDERED, UNDELIVERED
+)
+from app.storage.key_store import get_key_store
+from app.storage.ledger_store import get_ledger_store
+from app.storage.migrate import migrate_licenses_json
+from app.storage.postgres_base import close_pools
+from app.storage.outbox_store import get_outbox_store
+from app.utils.concurrency import gather_bounded
+from app.utils.periodic import run_periodically
+from app.utils.shopify import WebhookRejected, WebhookVerifier, parse_order
+from app.utils import tracing
+from app.utils.tracing import span
 
 API_KEY = os.environ.get("ADMIN_API_KEY", "changeme")
 
+settings = get_settings()
+tracing.configure_logging(settings.LOG_FORMAT, settings.LOG_LEVEL)
 app = FastAPI(title="License Key Delivery System")
-settings = Settings()
+app.add_middleware(tracing.TracingMiddleware, log_min_seconds=settings.REQUEST_LOG_MIN_SECONDS)
+background_tasks = []
+webhook_verifier = WebhookVerifier(settings.SHOPIFY_WEBHOOK_SECRET, settings.WEBHOOK_MAX_BODY_BYTES)
+recent_webhooks = TTLCache(settings.WEBHOOK_RECENT_IDS_CACHE_SIZE)  # Webhook id -> final order status, this worker
 
 @app.on_event("startup")
 async def startup_event():
-    print("Application started")
-    print(f"SMTP Settings: {settings.SMTP_HOST}:{settings.SMTP_PORT}")
+    await migrate_licenses_json()
+    await outbox.start_outbox()
+    await backorders.start_backorders()
+    background_tasks.append(asyncio.create_task(run_periodically(
+        "Idempotency compaction",
+        lambda: get_idempotency_store().compact(settings.IDEMPOTENCY_RETENTION_DAYS * 86400),
+        settings.IDEMPOTENCY_COMPACT_INTERVAL_SECONDS
+    )))
+    background_tasks.append(asyncio.create_task(run_periodically(
+        "Inventory check", inventory.check_stock, settings.INVENTORY_CHECK_INTERVAL_SECONDS
+    )))
+    background_tasks.append(asyncio.create_task(run_periodically(
+        "Reservation sweep", reservations.sweep, settings.RESERVATION_SWEEP_INTERVAL_SECONDS
+    )))
+    resolver = get_category_resolver()
+    if resolver.path:
+        background_tasks.append(asyncio.create_task(run_periodically(
+            "Category mapping reload",
+            lambda: asyncio.to_thread(resolver.reload),
+            settings.PRODUCT_CATEGORY_RELOAD_SECONDS
+        )))
+    logging.info(f"Application started (SMTP {settings.SMTP_HOST}:{settings.SMTP_PORT})")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await resend.stop_resends()
+    await backorders.stop_backorders()
+    await outbox.stop_outbox()
+    await close_smtp_pool()
+    await close_pools()
+
+async def after_restock(categories) -> None:
+    backorders.get_drainer().notify()
+    await check_stock_quietly(categories)
+
+async def check_stock_quietly(categories) -> None:
+    # Low-stock alerting must never fail the request that triggered it.
+    try:
+        await inventory.check_stock(categories)
+    except Exception as e:
+        logging.error(f"Inventory check failed: {str(e)}")
+
+async def email_queued(order_number: str, category: str) -> bool:
+    """Whether a license email for the order line reached the ledger (and so the outbox)."""
+    issuances = await get_ledger_store().for_orders([order_number])
+    return any(issuance["category"] == category for issuance in issuances)
 
 @app.post("/webhook/order/paid")
 async def handle_order_paid(request: Request):
     try:
-        if not await verify_webhook(request, settings.SHOPIFY_WEBHOOK_SECRET):
-            raise HTTPException(status_code=401, detail="Invalid webhook signature")
-        order_data = await request.json()
+        try:
+            with span("webhook.verify_signature"):
+                body = await webhook_verifier.read_verified(request)
+        except WebhookRejected as e:
+            return JSONResponse(content={"status": "error", "detail": e.detail}, status_code=e.status_code)
+        webhook_id = request.headers.get("X-Shopify-Webhook-Id")
+        orders = get_idempotency_store()
+        if webhook_id:
+            # Replays of finished orders are answered before the payload is
+            # parsed. One still in progress goes through begin() below, as
+            # its first attempt may yet fail and release the order.
+            with span("webhook.duplicate_check"):
+                seen = recent_webhooks.get(webhook_id) or await orders.webhook_status(webhook_id)
+            if seen and seen != IN_PROGRESS:
+                recent_webhooks.set(webhook_id, seen, settings.WEBHOOK_RECENT_IDS_TTL_SECONDS)
+                return JSONResponse(
+                    content={"status": "success", "message": f"Webhook {webhook_id} already received."},
+                    status_code=200
+                )
+        try:
+            with span("webhook.parse"):
+                order_data = parse_order(body)
+        except ValueError as e:
+            return JSONResponse(content={"status": "error", "detail": f"Invalid order payload: {str(e)}"}, status_code=400)
         order_number = str(order_data["order_number"])
-        # Check if already delivered
-        import json
-        # Use correct path for licenses.json (relative to project root, always absolute)
-        licenses_path = Path(__file__).parent / "../licenses.json"
-        licenses_path = licenses_path.resolve()
-        # Fallback: try project root if not found
-        if not licenses_path.exists():
-            alt_path = Path.cwd() / "licenses.json"
-            if alt_path.exists():
-                licenses_path = alt_path
+        tracing.bind(order_number=order_number)
+        with span("webhook.idempotency_begin"):
+            existing = await orders.begin(order_number, webhook_id)
+        if existing is not None:
+            if existing["status"] == IN_PROGRESS:
+                message = f"Order {order_number} is already being processed."
             else:
-                raise Exception(f"licenses.json not found at {licenses_path} or {alt_path}")
-        with open(licenses_path, "r+", encoding="utf-8") as f:
-            data = json.load(f)
-            delivered_orders = set(data.get("delivered_orders", []))
-            if order_number in delivered_orders:
-                return JSONResponse(content={"status": "success", "message": f"Order {order_number} already delivered (digital tag present)."}, status_code=200)
-        summary = set()
-        out_of_stock_flag = False
-        from collections import defaultdict, Counter
-        category_items = defaultdict(list)
-        for item in order_data.get("line_items", []):
-            product_id = str(item["product_id"])
-            category = await license_service.get_product_category(product_id)
-            quantity = item.get("quantity", 1)
-            for _ in range(quantity):
-                category_items[category].append(item["title"])
-        for category, titles in category_items.items():
-            license_keys = []
-            failed = False
-            for _ in titles:
-                try:
-                    license_keys.append(await license_service.pop_license_key(category))
-                except Exception:
-                    failed = True
-                    break
-            if not failed:
-                await email_service.send_license_email(
-                    customer_email="taio201021@gmail.com",
-                    order_number=order_number,
-                    product_name=", ".join(set(titles)),
-                    license_key=license_keys if len(license_keys) > 1 else license_keys[0]
+                message = f"Order {order_number} already processed ({existing['status']})."
+            return JSONResponse(content={"status": "success", "message": message}, status_code=200)
+        claimed = {}
+        try:
+            summary = set()
+            out_of_stock_flag = False
+            from collections import defaultdict, Counter
+            category_items = defaultdict(list)
+            line_items = order_data.get("line_items", [])
+            with span("webhook.resolve_categories"):
+                categories = await license_service.resolve_order_categories(line_items)
+            for item, category in zip(line_items, categories):
+                quantity = item.get("quantity", 1)
+                for _ in range(quantity):
+                    category_items[category].append(item["title"])
+            with span("webhook.claim_keys"):
+                claimed = await license_service.claim_keys(
+                    order_number, {category: len(titles) for category, titles in category_items.items()}
                 )
-                summary.add((category, len(license_keys)))
-            else:
-                await email_service.send_out_of_stock_email(
+
+            async def notify(category: str, titles: list):
+                # Render and enqueue one category's email; categories run concurrently.
+                if category in claimed:
+                    license_keys = claimed[category]
+                    try:
+                        await email_service.queue_license_email(
+                            customer_email="taio201021@gmail.com",
+                            order_number=order_number,
+                            product_name=", ".join(set(titles)),
+                            license_key=license_keys if len(license_keys) > 1 else license_keys[0],
+                            category=category
+                        )
+                        return (category, len(license_keys))
+                    except Exception:
+                        if category in settings.SIGNED_KEY_CATEGORIES or await email_queued(order_number, category):
+                            raise
+                        # Return the stocked keys and treat the line as out of stock.
+                        logging.exception(f"Order {order_number}: license email for '{category}' failed; backordering")
+                        del claimed[category]
+                        await get_key_store().release(license_keys)
+                if settings.BACKORDERS_ENABLED:
+                    await license_service.add_backorder(
+                        order_number, category, len(titles), "taio201021@gmail.com", ", ".join(set(titles))
+                    )
+                await email_service.queue_out_of_stock_email(
                     customer_email="taio201021@gmail.com",
                     product_name=", ".join(set(titles)),
                     order_number=order_number,
                     quantity=len(titles)
                 )
-                summary.add((f"outofstock:{category}", len(titles)))
-                out_of_stock_flag = True
-        out_msgs = []
-        for key, count in summary:
-            if isinstance(key, str) and key.startswith("outofstock:"):
-                cat = key.split(":")[1]
-                out_msgs.append(f"No license available for category '{cat}' (notified taio201021@gmail.com) ({count}x)")
+                return (f"outofstock:{category}", len(titles))
+
+            with span("webhook.notify"):
+                results = await gather_bounded(
+                    (lambda c=category, t=titles: notify(c, t) for category, titles in category_items.items()),
+                    settings.ORDER_CATEGORY_CONCURRENCY
+                )
+            errors = [r for r in results if isinstance(r, Exception)]
+            summary.update(r for r in results if not isinstance(r, Exception))
+            out_of_stock_flag = any(category not in claimed for category in category_items)
+            if summary:
+                outbox.get_dispatcher().notify()
+            if errors:
+                # Every other category's email is already queued; record the
+                # order as partial (below) and surface the first failure.
+                raise errors[0]
+            out_msgs = []
+            for key, count in summary:
+                if isinstance(key, str) and key.startswith("outofstock:"):
+                    cat = key.split(":")[1]
+                    backordered = " and backordered" if settings.BACKORDERS_ENABLED else ""
+                    out_msgs.append(f"No license available for category '{cat}' (notified taio201021@gmail.com{backordered}) ({count}x)")
+                else:
+                    out_msgs.append(f"License sent to taio201021@gmail.com ({count}x)")
+            if not out_msgs:
+                out_msgs = ["No license keys were available for this order. All items are out of stock."] if out_of_stock_flag else ["No action taken."]
+            if out_of_stock_flag and settings.BACKORDERS_ENABLED:
+                status = BACKORDERED
+            elif not claimed:
+                status = OUT_OF_STOCK if out_of_stock_flag else DELIVERED
             else:
-                out_msgs.append(f"License sent to taio201021@gmail.com ({count}x)")
-        if not out_msgs:
-            out_msgs = ["No license keys were available for this order. All items are out of stock."] if out_of_stock_flag else ["No action taken."]
-        # Mark as delivered (add digital tag)
-        with open(licenses_path, "r+", encoding="utf-8") as f:
-            data = json.load(f)
-            delivered_orders = set(data.get("delivered_orders", []))
-            delivered_orders.add(order_number)
-            data["delivered_orders"] = list(delivered_orders)
-            f.seek(0)
-            f.truncate()
-            json.dump(data, f, indent=2)
+                status = PARTIAL if out_of_stock_flag else DELIVERED
+            with span("webhook.idempotency_finish"):
+                await orders.finish(order_number, status, claimed)
+            if status == BACKORDERED:
+                # Stock may already be waiting behind older backorders.
+                backorders.get_drainer().notify()
+            await check_stock_quietly(category_items)
+            if webhook_id:
+                recent_webhooks.set(webhook_id, status, settings.WEBHOOK_RECENT_IDS_TTL_SECONDS)
+        except Exception:
+            # Keys already claimed stay recorded against the order; with
+            # nothing claimed, let Shopify's retry process it from scratch.
+            if claimed:
+                await orders.finish(order_number, PARTIAL, claimed)
+            else:
+                await orders.release(order_number)
+                if webhook_id:
+                    recent_webhooks.invalidate(webhook_id)
+            raise
         return JSONResponse(content={"status": "success", "message": "\n".join(out_msgs)}, status_code=200)
     except Exception as e:
+        logging.exception("Order webhook failed")
         return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=500)
 
 @app.post("/licenses/add/{category}")
@@ -113,11 +239,195 @@ async def add_licenses(category: str, licenses: str = None, x_api_key: str = Hea
                 raise ValueError
         except Exception:
             keys = [k.strip() for k in licenses.splitlines() if k.strip()]
-        await license_service.add_licenses(category, keys)
-        return {"status": "success", "added": len(keys)}
+        added = await license_service.add_licenses(category, keys)
+        await after_restock([category])
+        return {"status": "success", "added": added, "duplicates": len(keys) - added}
     except Exception as e:
         return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=500)
 
+@app.post("/licenses/import/{category}")
+async def import_licenses(
+    category: str,
+    request: Request,
+    format: str = "lines",
+    column: str = "0",
+    x_api_key: str = Header(None)
+):
+    """Stream keys from the request body: newline-delimited text, CSV or
+    NDJSON, gzip-compressed if sent with Content-Encoding: gzip or gzip magic.
+
+    For CSV, `column` is a 0-based index, or a header name when the first
+    row is a header.
+    """
+    from app.utils.key_import import ImportFormatError, ImportTooLarge
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    gzipped = True if request.headers.get("Content-Encoding", "").lower() == "gzip" else None
+    try:
+        result = await license_service.import_licenses(category, request.stream(), format, column, gzipped)
+    except ImportFormatError as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=400)
+    except ImportTooLarge as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=413)
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=500)
+    finally:
+        await after_restock([category])
+    return {"status": "success", **result}
+
+@app.get("/licenses/stats")
+async def license_stats(x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    return {
+        "status": "success",
+        "categories": await inventory.stock_report(),
+        "reservations": await get_key_store().reservation_stats()
+    }
+
+@app.get("/metrics")
+async def metrics(x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    body = await inventory.prometheus_metrics() + tracing.prometheus_histograms()
+    return Response(content=body, media_type="text/plain; version=0.0.4")
+
+@app.get("/backorders")
+async def list_backorders(order_number: str = None, x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    store = get_key_store()
+    return {
+        "status": "success",
+        "counts": await store.backorder_stats(),
+        "pending": await store.pending_backorders(order_number)
+    }
+
+@app.get("/email/stats")
+async def email_stats(x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    return {"status": "success", "stats": email_service.get_send_stats()}
+
+@app.get("/categories/stats")
+async def category_stats(x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    return {"status": "success", "stats": get_category_resolver().get_stats()}
+
+@app.post("/categories/reload")
+async def category_reload(x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    resolver = get_category_resolver()
+    errors = resolver.stats["reload_errors"]
+    reloaded = await asyncio.to_thread(resolver.reload, True)
+    if resolver.stats["reload_errors"] > errors:
+        return JSONResponse(content={"status": "error", "detail": "Mapping file failed to load; see logs"}, status_code=500)
+    return {"status": "success", "reloaded": reloaded, "stats": resolver.get_stats()}
+
+@app.get("/orders")
+async def list_orders(status: str = UNDELIVERED, limit: int = 100, x_api_key: str = Header(None)):
+    """Orders in one status, most recently updated first (default: undelivered ones to follow up)."""
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    return {"status": "success", "orders": await get_idempotency_store().by_status(status, limit)}
+
+@app.get("/orders/{order_number}")
+async def order_status(order_number: str, x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    record = await get_idempotency_store().lookup(order_number)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return {"status": "success", "order": record, "issuances": await get_ledger_store().for_order(order_number)}
+
+def parse_time(value: str) -> float:
+    """Unix timestamp from a number or an ISO 8601 date/time (UTC unless it has an offset)."""
+    from datetime import datetime, timezone
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+@app.post("/orders/resend")
+async def start_resend(
+    since: str = None,
+    until: str = None,
+    category: str = None,
+    status: str = None,
+    dry_run: bool = False,
+    x_api_key: str = Header(None)
+):
+    """Start re-sending license emails for past orders in the background.
+
+    Selects ledger entries issued in [since, until) (ISO 8601 or unix time),
+    optionally of one `category` and with one of the comma-separated email
+    `status`es (pending, sending, sent, dead, unknown, or failed for dead or
+    retrying). With dry_run, only counts the matches.
+    """
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    try:
+        job = resend.get_resend_engine().start(
+            since=parse_time(since) if since else None,
+            until=parse_time(until) if until else None,
+            category=category,
+            statuses=[s.strip() for s in status.split(",") if s.strip()] if status else None,
+            dry_run=dry_run
+        )
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=400)
+    return JSONResponse(content={"status": "success", "job": job.to_dict()}, status_code=202)
+
+@app.get("/orders/resend/{job_id}")
+async def resend_status(job_id: str, x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    job = resend.get_resend_engine().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Resend job not found")
+    return {"status": "success", "job": job.to_dict()}
+
+@app.post("/orders/resend/{job_id}/cancel")
+async def resend_cancel(job_id: str, x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    if not resend.get_resend_engine().cancel(job_id):
+        raise HTTPException(status_code=404, detail="No running resend job with that id")
+    return {"status": "success", "cancelled": job_id}
+
+@app.get("/outbox/stats")
+async def outbox_stats(x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    counts = await get_outbox_store().stats()
+    depth = counts.get("pending", 0) + counts.get("sending", 0)
+    return {"status": "success", "depth": depth, "counts": counts}
+
+@app.get("/outbox/dead")
+async def outbox_dead(limit: int = 100, x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    return {"status": "success", "messages": await get_outbox_store().list_dead(limit)}
+
+@app.post("/outbox/requeue")
+async def outbox_requeue(ids: str = None, x_api_key: str = Header(None)):
+    """Requeue dead letters: all of them, or only the comma-separated `ids`."""
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    try:
+        id_list = [int(i) for i in ids.split(",") if i.strip()] if ids else None
+    except ValueError:
+        return JSONResponse(content={"status": "error", "detail": "ids must be comma-separated integers"}, status_code=400)
+    requeued = await get_outbox_store().requeue_dead(id_list)
+    outbox.get_dispatcher().notify()
+    return {"status": "success", "requeued": requeued}
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
@@ -132,10 +442,49 @@ async def verify_license(license_key: str):
         "details": result["data"]
     }
 
+@app.post("/licenses/revoke/{license_key}")
+async def revoke_license(license_key: str, x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    if not await license_service.revoke_license_key(license_key):
+        raise HTTPException(status_code=404, detail="Issued license key not found")
+    return {"status": "success", "revoked": license_key}
+
+@app.post("/licenses/generate/{category}")
+async def generate_licenses(category: str, count: int, x_api_key: str = Header(None)):
+    if x_api_key != API_KEY:
+        return JSONResponse(content={"status": "error", "detail": "Unauthorized"}, status_code=401)
+    try:
+        added = await license_service.generate_signed_licenses(category, count)
+        await after_restock([category])
+        return {"status": "success", "added": added}
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "detail": str(e)}, status_code=500)
+
+@app.get("/licenses/public-key")
+async def license_public_key():
+    if not settings.LICENSE_SIGNING_KEY:
+        return JSONResponse(content={"status": "error", "detail": "License signing is not configured"}, status_code=503)
+    return {"algorithm": "Ed25519", "public_key": base64.b64encode(license_service.get_signer().public_key).decode()}
+
+@app.get("/licenses/revocations")
+async def license_revocations(if_none_match: str = Header(None)):
+    """Revoked signed-key serials as one sorted blob of 8-byte entries."""
+    revocations = await license_service.get_revocation_list()
+    headers = {
+        "ETag": f'"{revocations["etag"]}"',
+        "Cache-Control": f"public, max-age={settings.REVOCATION_LIST_MAX_AGE_SECONDS}"
+    }
+    if if_none_match == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=revocations["blob"], media_type="application/octet-stream", headers=headers)
+
 @app.get("/")
 async def root():
     return {"message": "License Key Delivery API is running"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000)
+    # Several workers are safe: claims and order markers are atomic in the
+    # shared store (SQLite WAL on one host, Postgres across hosts).
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=int(os.environ.get("WEB_CONCURRENCY", "1")))
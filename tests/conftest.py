@@ -0,0 +1,34 @@
+import json
+import os
+import tempfile
+import pytest
+
+# Before any app module reads its settings: keep tests off the database and
+# credentials configured in .env.
+os.environ.update({
+    "DATABASE_URL": "sqlite:///" + os.path.join(tempfile.mkdtemp(), "tests.db"),
+    "SHOPIFY_WEBHOOK_SECRET": "test-webhook-secret",
+    "ADMIN_API_KEY": "test-admin-key",
+    "ADMIN_ALERT_EMAIL": "",
+    "PRODUCT_CATEGORY_MAP": json.dumps({"101": "basic", "102": "pro", "103": "enterprise"}),
+    "PRODUCT_CATEGORY_FILE": "",
+    "LICENSE_SIGNING_KEY": "",
+    "LOG_LEVEL": "ERROR"
+})
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh SQLite database behind every store singleton, for one test."""
+    from app.config import get_settings
+    from app.services import backorders, license_service, outbox, verification
+    from app.storage import idempotency_store, key_store, ledger_store, outbox_store
+
+    monkeypatch.setattr(get_settings(), "DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    for module in (idempotency_store, key_store, ledger_store, outbox_store):
+        monkeypatch.setattr(module, "_store", None)
+    monkeypatch.setattr(verification, "_verifier", None)
+    monkeypatch.setattr(license_service, "_revocation_list", None)
+    monkeypatch.setattr(backorders, "_drainer", None)
+    monkeypatch.setattr(outbox, "_dispatcher", None)
+    return tmp_path / "test.db"
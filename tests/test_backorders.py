@@ -0,0 +1,52 @@
+"""Backorder fills whose email was never queued are re-sent by exactly one drainer."""
+import asyncio
+import sqlite3
+from app.services.backorders import BackorderDrainer
+from app.storage.idempotency_store import get_idempotency_store
+from app.storage.key_store import get_key_store
+from app.storage.outbox_store import get_outbox_store
+
+
+def _fill_unnotified(db) -> None:
+    """Fill a backorder, then age its fill as if the worker died before queuing the email."""
+    async def run():
+        store = get_key_store()
+        await get_idempotency_store().begin("1")
+        await get_idempotency_store().finish("1", "backordered", {})
+        await store.add_backorder("1", "basic", 1, "customer@example.com", "Basic")
+        await store.add("basic", ["k1"])
+        return await store.fulfil_backorders("basic", 10)
+
+    assert len(asyncio.run(run())) == 1
+    with sqlite3.connect(db) as conn:
+        conn.execute("UPDATE backorders SET fulfilled_at = 0")
+
+
+def test_unnotified_backorder_is_leased_to_one_caller(db):
+    _fill_unnotified(db)
+
+    async def run():
+        store = get_key_store()
+        return await asyncio.gather(store.unnotified_backorders(60), store.unnotified_backorders(60))
+
+    first, second = asyncio.run(run())
+    assert sorted([len(first), len(second)]) == [0, 1]
+
+
+def test_drainers_resend_an_unnotified_fill_once(db):
+    _fill_unnotified(db)
+
+    async def run():
+        drainers = [BackorderDrainer(batch_size=10, poll_seconds=60, notify_lease_seconds=60) for _ in range(2)]
+        await asyncio.gather(*(drainer.drain() for drainer in drainers))
+        return (
+            await get_outbox_store().stats(),
+            await get_key_store().backorder_stats(),
+            await get_idempotency_store().lookup("1")
+        )
+
+    outbox, backorders, order = asyncio.run(run())
+    assert outbox == {"pending": 1}
+    assert backorders == {"basic": {"fulfilled": 1}}
+    assert order["status"] == "delivered"
+    assert order["license_keys"] == {"basic": ["k1"]}
@@ -0,0 +1,77 @@
+"""Worker processes racing on one inventory: every key is issued at most once,
+every order is begun by exactly one worker, and the trigger-kept stock
+counters match the rows they summarise.
+
+Runs against SQLite, and also against Postgres when TEST_POSTGRES_URL points
+at a scratch database."""
+import asyncio
+import os
+import sqlite3
+import pytest
+from app.config import get_settings
+from app.storage import idempotency_store, key_store
+from app.storage.key_store import get_key_store
+from app.storage.postgres_base import close_pools, is_postgres_url
+from app.storage.sqlite_base import sqlite_path
+from benchmarks.stress_claims import run_claims
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def database_url(request, monkeypatch):
+    if request.param == "postgres":
+        url = os.environ.get("TEST_POSTGRES_URL")
+        if not url:
+            pytest.skip("TEST_POSTGRES_URL is not set")
+        # The worker processes read DATABASE_URL from the environment.
+        monkeypatch.setenv("DATABASE_URL", url)
+        monkeypatch.setattr(get_settings(), "DATABASE_URL", url)
+        for module in (idempotency_store, key_store):
+            monkeypatch.setattr(module, "_store", None)
+    return os.environ["DATABASE_URL"]
+
+
+async def _rows_by_status(database_url: str, category: str) -> dict:
+    query = "SELECT status, COUNT(*) FROM license_keys WHERE category = {} GROUP BY status"
+    if is_postgres_url(database_url):
+        import asyncpg
+        conn = await asyncpg.connect(database_url)
+        try:
+            return {row[0]: row[1] for row in await conn.fetch(query.format("$1"), category)}
+        finally:
+            await conn.close()
+    with sqlite3.connect(sqlite_path(database_url)) as conn:
+        return dict(conn.execute(query.format("?"), (category,)).fetchall())
+
+
+async def _assert_counters_match_rows(database_url: str, category: str) -> None:
+    counters = (await get_key_store().stock())[category]
+    rows = await _rows_by_status(database_url, category)
+    assert counters == {"available": rows.get("available", 0), "claimed": rows.get("claimed", 0)}
+
+
+@pytest.mark.parametrize("workers,keys,keys_per_order", [(2, 200, 1), (4, 600, 3)])
+def test_concurrent_claims_issue_each_key_once(database_url, workers, keys, keys_per_order):
+    orders = 50
+    result = run_claims(workers, keys, keys_per_order, orders=orders)
+    category, issued = result["category"], result["issued"]
+
+    assert len(issued) == len(set(issued)), "a key was issued more than once"
+    assert len(issued) == keys - keys % keys_per_order
+    assert sorted(result["begun"]) == list(range(orders)), "an order was begun by zero or several workers"
+
+    async def check():
+        try:
+            assert await _rows_by_status(database_url, category) == {
+                status: count
+                for status, count in (("reserved", len(issued)), ("available", keys % keys_per_order))
+                if count
+            }
+            await _assert_counters_match_rows(database_url, category)
+
+            assert await get_key_store().commit(issued) == len(issued)
+            await _assert_counters_match_rows(database_url, category)
+            assert (await get_key_store().consumption(1))[category] == len(issued)
+        finally:
+            await close_pools()  # asyncpg pools are bound to this event loop
+
+    asyncio.run(check())
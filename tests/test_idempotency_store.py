@@ -0,0 +1,39 @@
+"""The processed-orders record when the backorder drainer and the webhook that
+queued the backorder both write it."""
+import asyncio
+from app.storage.idempotency_store import BACKORDERED, DELIVERED, get_idempotency_store
+
+
+def _finish_after_drainer(drainer_status: str) -> dict:
+    async def run():
+        orders = get_idempotency_store()
+        assert await orders.begin("7") is None
+        # The drainer fills the pro backorder before the webhook finishes.
+        await orders.add_keys("7", {"pro": ["p1"]}, drainer_status)
+        await orders.finish("7", BACKORDERED, {"basic": ["b1"]})
+        return await orders.lookup("7")
+
+    return asyncio.run(run())
+
+
+def test_finish_keeps_keys_and_delivery_recorded_by_drainer(db):
+    order = _finish_after_drainer(DELIVERED)
+    assert order["status"] == DELIVERED
+    assert order["license_keys"] == {"pro": ["p1"], "basic": ["b1"]}
+
+
+def test_finish_keeps_backordered_while_lines_are_waiting(db):
+    order = _finish_after_drainer(BACKORDERED)
+    assert order["status"] == BACKORDERED
+    assert order["license_keys"] == {"pro": ["p1"], "basic": ["b1"]}
+
+
+def test_finish_records_keys_once(db):
+    async def run():
+        orders = get_idempotency_store()
+        await orders.begin("8")
+        await orders.add_keys("8", {"basic": ["b1"]}, DELIVERED)
+        await orders.finish("8", DELIVERED, {"basic": ["b1", "b2"]})
+        return await orders.lookup("8")
+
+    assert asyncio.run(run())["license_keys"] == {"basic": ["b1", "b2"]}
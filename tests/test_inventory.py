@@ -0,0 +1,41 @@
+"""Low-stock alerts and the stock report's projections."""
+import asyncio
+import pytest
+from app.config import get_settings
+from app.services import inventory
+from app.storage.key_store import get_key_store
+
+
+@pytest.fixture
+def inventory_settings(db, monkeypatch):
+    monkeypatch.setattr(get_settings(), "SIGNED_KEY_CATEGORIES", ["enterprise"])
+    monkeypatch.setattr(get_settings(), "LICENSE_LOW_WATERMARK", 2)
+
+
+def test_alerts_once_when_stock_drops_to_watermark(inventory_settings):
+    async def run():
+        store = get_key_store()
+        await store.add("basic", ["b1", "b2", "b3"])
+        before = await inventory.check_stock()
+        await store.commit((await store.claim("1", {"basic": 1}))["basic"])
+        return before, await inventory.check_stock(), await inventory.check_stock()
+
+    before, first, again = asyncio.run(run())
+    assert before == []
+    assert first == ["basic"]
+    assert again == []
+
+
+def test_signed_and_never_stocked_categories_are_not_watermarked(inventory_settings):
+    async def run():
+        await get_key_store().record_issued("enterprise", ["ENT-1"], "1")  # Minted at delivery
+        return await inventory.check_stock(), await inventory.stock_report()
+
+    alerted, report = asyncio.run(run())
+    assert alerted == []
+    for category in ("enterprise", "pro"):  # pro is configured but was never stocked
+        assert report[category]["low"] is False
+        assert report[category]["low_watermark"] is None
+        assert report[category]["days_until_empty"] is None
+    assert report["enterprise"]["claimed"] == 1
+    assert 'license_keys_low_watermark{category="enterprise"}' not in asyncio.run(inventory.prometheus_metrics())
@@ -0,0 +1,143 @@
+"""Streaming key upload parsing, and the import endpoint's error responses."""
+import asyncio
+import gzip
+import httpx
+import pytest
+import main
+from app.config import get_settings
+from app.storage.key_store import get_key_store
+from app.utils.key_import import ImportFormatError, ImportTooLarge, KeyParser, iter_lines
+
+
+async def _chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _lines(data: bytes, size: int = 4, **options) -> list:
+    async def run():
+        return [line async for line in iter_lines(_chunks(data, size), **options)]
+
+    return asyncio.run(run())
+
+
+def _keys(fmt: str, text: str, column: str = "0") -> list:
+    parser = KeyParser(fmt, column)
+    keys = []
+    for _, line in _lines(text.encode()):
+        try:
+            key = parser.parse(line)
+        except ValueError as e:
+            key = f"rejected: {e}"
+        if key is not None:
+            keys.append(key)
+    return keys
+
+
+def test_lines_are_reassembled_across_chunks():
+    assert _lines(b"alpha\r\nbeta\n\ngamma", size=3) == [(1, "alpha"), (2, "beta"), (3, ""), (4, "gamma")]
+
+
+def test_gzip_is_sniffed_from_magic_bytes():
+    assert _lines(gzip.compress(b"k1\nk2\n"), size=5) == [(1, "k1"), (2, "k2")]
+
+
+def test_plain_upload_is_not_inflated_without_magic_bytes():
+    assert _lines(b"\x1f-not-gzip\n") == [(1, "\x1f-not-gzip")]
+
+
+def test_truncated_gzip_is_rejected():
+    with pytest.raises(ImportFormatError, match="Truncated"):
+        _lines(gzip.compress(b"k1\nk2\n" * 100)[:-10])
+
+
+def test_invalid_gzip_is_rejected():
+    with pytest.raises(ImportFormatError, match="Invalid gzip"):
+        _lines(b"\x1f\x8b" + b"\x00" * 30)
+
+
+def test_utf8_bom_is_stripped_even_when_split():
+    assert _lines("\ufeffk1\nk2".encode(), size=1) == [(1, "k1"), (2, "k2")]
+
+
+def test_invalid_utf8_is_rejected_with_its_line():
+    with pytest.raises(ImportFormatError, match="line 2"):
+        _lines(b"k1\nk\xff2\n")
+
+
+def test_overlong_lines_are_skipped_across_chunk_boundaries():
+    data = b"k1\n" + b"x" * 50 + b"\nk2\n" + b"y" * 50
+    assert _lines(data, size=7, max_line_length=10) == [(1, "k1"), (2, None), (3, "k2"), (4, None)]
+
+
+def test_upload_over_max_bytes_is_too_large():
+    with pytest.raises(ImportTooLarge):
+        _lines(b"k1\n" * 10, max_bytes=20)
+
+
+def test_inflated_size_counts_towards_max_bytes():
+    with pytest.raises(ImportTooLarge):
+        _lines(gzip.compress(b"k" * 1000), size=1000, max_bytes=100)
+
+
+def test_csv_column_by_index():
+    assert _keys("csv", "a,K1\nb,K2\nc\n", column="1") == ["K1", "K2", "rejected: row has no column 1"]
+
+
+def test_csv_column_by_header_name():
+    assert _keys("csv", "sku, key\nx,K1\ny,\"K2\"\n", column="key") == ["K1", "K2"]
+
+
+def test_csv_header_without_the_column_is_a_format_error():
+    with pytest.raises(ImportFormatError, match="no column named 'key'"):
+        _keys("csv", "sku,serial\nx,K1\n", column="key")
+
+
+def test_ndjson_strings_and_objects():
+    text = '"K1"\n{"license_key": "K2"}\n{"key": "K3"}\n{"other": 1}\n{bad\n'
+    assert _keys("ndjson", text) == [
+        "K1", "K2", "K3",
+        "rejected: expected a string or an object with a 'license_key' field",
+        "rejected: invalid JSON: Expecting property name enclosed in double quotes"
+    ]
+
+
+def test_keys_are_validated():
+    assert _keys("lines", " K1 \nK 2\n" + "x" * 300) == [
+        "K1", "rejected: key contains whitespace or control characters", "rejected: key longer than 256 characters"
+    ]
+
+
+async def _import(body: bytes, **params) -> httpx.Response:
+    headers = {"X-API-Key": main.API_KEY}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        return await client.post("/licenses/import/basic", content=body, params=params, headers=headers)
+
+
+def test_import_endpoint_adds_keys(db):
+    async def run():
+        return await _import(gzip.compress(b"k1\nk2\nk1\n")), await get_key_store().count("basic")
+
+    response, available = asyncio.run(run())
+    assert response.status_code == 200
+    assert (response.json()["added"], response.json()["duplicates"]) == (2, 1)
+    assert available == 2
+
+
+@pytest.mark.parametrize("body,params", [
+    (b"k1\n", {"format": "xml"}),
+    (b"\x1f\x8b\x00\x00", {}),
+    (b"k\xff\n", {}),
+    (b"serial\nk1\n", {"format": "csv", "column": "key"})
+])
+def test_import_endpoint_rejects_unparseable_uploads(db, body, params):
+    response = asyncio.run(_import(body, **params))
+    assert response.status_code == 400
+    assert response.json()["status"] == "error"
+
+
+def test_import_endpoint_rejects_oversized_uploads(db, monkeypatch):
+    monkeypatch.setattr(get_settings(), "LICENSE_IMPORT_MAX_BYTES", 100)
+    response = asyncio.run(_import(gzip.compress(b"k" * 10 + b"\n" * 200)))
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Upload larger than 100 bytes"
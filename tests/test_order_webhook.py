@@ -0,0 +1,98 @@
+"""POST /webhook/order/paid end to end against a fresh SQLite database (the
+outbox dispatcher is not started, so queued emails stay pending)."""
+import asyncio
+import json
+import httpx
+import pytest
+import main
+from app.services import email_service
+from app.storage.idempotency_store import get_idempotency_store
+from app.storage.key_store import get_key_store
+from app.storage.outbox_store import get_outbox_store
+from app.utils.shopify import sign_webhook
+
+BASIC, PRO = 101, 102  # Product ids mapped by tests/conftest.py
+
+
+@pytest.fixture(autouse=True)
+def fresh_app(db):
+    main.recent_webhooks.clear()
+
+
+def _order(order_number, *line_items) -> bytes:
+    return json.dumps({
+        "order_number": order_number,
+        "line_items": [
+            {"product_id": product_id, "title": f"Product {product_id}", "quantity": quantity}
+            for product_id, quantity in line_items
+        ]
+    }).encode()
+
+
+async def _post(body: bytes, webhook_id: str = None, signature: str = None, **headers) -> httpx.Response:
+    headers["X-Shopify-Hmac-SHA256"] = signature or sign_webhook(body, main.settings.SHOPIFY_WEBHOOK_SECRET)
+    if webhook_id:
+        headers["X-Shopify-Webhook-Id"] = webhook_id
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        return await client.post("/webhook/order/paid", content=body, headers=headers)
+
+
+def test_delivers_each_category_from_stock():
+    async def run():
+        store = get_key_store()
+        await store.add("basic", ["b1", "b2"])
+        await store.add("pro", ["p1"])
+        response = await _post(_order(1, (BASIC, 2), (PRO, 1)))
+        return response, await get_idempotency_store().lookup("1"), await store.stock()
+
+    response, order, stock = asyncio.run(run())
+    assert response.status_code == 200
+    assert order["status"] == "delivered"
+    assert order["license_keys"] == {"basic": ["b1", "b2"], "pro": ["p1"]}
+    assert stock["basic"]["available"] == 0 and stock["pro"]["available"] == 0
+
+
+def test_failed_license_email_returns_keys_and_backorders_the_line(monkeypatch):
+    queue_license_email = email_service.queue_license_email
+
+    async def fail_for_pro(**kwargs):
+        if kwargs["category"] == "pro":
+            raise RuntimeError("template error")
+        return await queue_license_email(**kwargs)
+
+    monkeypatch.setattr(email_service, "queue_license_email", fail_for_pro)
+
+    async def run():
+        store = get_key_store()
+        await store.add("basic", ["b1"])
+        await store.add("pro", ["p1"])
+        response = await _post(_order(2, (BASIC, 1), (PRO, 1)), webhook_id="w2")
+        return (
+            response,
+            await get_idempotency_store().lookup("2"),
+            await store.lookup("p1"),
+            await store.pending_backorders("2"),
+            await get_outbox_store().stats()
+        )
+
+    response, order, pro_key, pending, outbox = asyncio.run(run())
+    assert response.status_code == 200
+    assert order["status"] == "backordered"
+    assert order["license_keys"] == {"basic": ["b1"]}
+    assert pro_key["status"] == "available"
+    assert [(b["category"], b["quantity"]) for b in pending] == [("pro", 1)]
+    assert outbox == {"pending": 2}  # The basic license and the pro out-of-stock notice
+
+
+def test_unsigned_or_oversized_webhook_is_rejected_before_processing(monkeypatch):
+    monkeypatch.setattr(main, "webhook_verifier", main.WebhookVerifier(main.settings.SHOPIFY_WEBHOOK_SECRET, 100))
+
+    async def run():
+        bad_signature = await _post(_order(3, (BASIC, 1)), signature="aW52YWxpZA==")
+        too_large = await _post(_order(3, *[(BASIC, 1)] * 10))
+        return bad_signature, too_large, await get_idempotency_store().lookup("3")
+
+    bad_signature, too_large, order = asyncio.run(run())
+    assert bad_signature.status_code == 401
+    assert too_large.status_code == 413
+    assert order is None
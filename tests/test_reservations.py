@@ -0,0 +1,161 @@
+"""The reservation sweeper against a fresh SQLite database: each expired
+lease is settled by the state of the email carrying its keys."""
+import asyncio
+import pytest
+from app.services import reservations
+from app.storage.idempotency_store import get_idempotency_store
+from app.storage.key_store import get_key_store
+from app.storage.ledger_store import get_ledger_store
+from app.storage.outbox_store import get_outbox_store
+
+
+@pytest.fixture
+def store(db):
+    """The key store, with leases that have run out as soon as they are taken."""
+    store = get_key_store()
+    store.reservation_ttl = 0
+    return store
+
+
+async def _claim(order_number: str, quantity: int = 1):
+    """Stock one basic key per unit, claim them for the order and queue their email."""
+    store = get_key_store()
+    await store.add("basic", [f"{order_number}-{n}" for n in range(quantity)])
+    await get_idempotency_store().begin(order_number)
+    keys = (await store.claim(order_number, {"basic": quantity}))["basic"]
+    await get_idempotency_store().finish(order_number, "delivered", {"basic": keys})
+    outbox_id = await get_ledger_store().enqueue(
+        order_number, "basic", "customer@example.com", "Basic", keys, "license", "message"
+    )
+    return keys, outbox_id
+
+
+async def _status(key: str) -> str:
+    return (await get_key_store().lookup(key))["status"]
+
+
+def test_sent_email_commits_its_keys(store):
+    async def run():
+        keys, outbox_id = await _claim("1")
+        await get_outbox_store().mark_sent(outbox_id)
+        return await reservations.sweep(), await _status(keys[0])
+
+    totals, status = asyncio.run(run())
+    assert totals == {"committed": 1, "extended": 0, "released": 0}
+    assert status == "claimed"
+
+
+def test_pending_email_extends_the_lease(store):
+    async def run():
+        keys, _ = await _claim("2")
+        first = await reservations.sweep()
+        return first, await reservations.sweep(), await _status(keys[0])
+
+    first, second, status = asyncio.run(run())
+    assert first == {"committed": 0, "extended": 1, "released": 0}
+    assert second == {"committed": 0, "extended": 0, "released": 0}  # Leased for the configured TTL again
+    assert status == "reserved"
+
+
+def test_dead_email_is_cancelled_and_its_line_backordered(store):
+    async def run():
+        keys, outbox_id = await _claim("3", quantity=2)
+        await get_outbox_store().mark_failed(outbox_id, "550 mailbox unavailable", None)
+        totals = await reservations.sweep()
+        return (
+            totals,
+            [await _status(key) for key in keys],
+            await get_outbox_store().stats(),
+            await get_ledger_store().for_order("3"),
+            await store.pending_backorders("3"),
+            await get_idempotency_store().lookup("3")
+        )
+
+    totals, statuses, outbox, issuances, pending, order = asyncio.run(run())
+    assert totals == {"committed": 0, "extended": 0, "released": 2}
+    assert statuses == ["available", "available"]
+    assert outbox == {"cancelled": 1}
+    assert issuances[0]["released_at"] is not None
+    assert [(b["category"], b["quantity"]) for b in pending] == [("basic", 2)]
+    assert order["status"] == "backordered"
+    assert order["license_keys"] == {}
+
+
+def test_keys_never_queued_are_released(store):
+    async def run():
+        await store.add("basic", ["k1"])
+        await get_idempotency_store().begin("4")
+        keys = (await store.claim("4", {"basic": 1}))["basic"]  # The worker crashed before queuing the email
+        await get_idempotency_store().add_keys("4", {"basic": keys}, "delivered")
+        totals = await reservations.sweep()
+        order = await get_idempotency_store().lookup("4")
+        return totals, await _status("k1"), await store.pending_backorders("4"), order
+
+    totals, status, pending, order = asyncio.run(run())
+    assert totals == {"committed": 0, "extended": 0, "released": 1}
+    assert status == "available"
+    assert pending == []  # No ledger entry, so no address to send fresh keys to
+    assert order["license_keys"] == {}
+
+
+def test_keys_held_by_a_claimed_backorder_are_skipped(store):
+    async def run():
+        await store.add_backorder("5", "basic", 1, "customer@example.com", "Basic")
+        await store.add("basic", ["k1"])
+        filled = await store.fulfil_backorders("basic", 10)  # Not notified yet: the drainer re-sends these
+        return filled, await store.expired_reservations(10), await reservations.sweep(), await _status("k1")
+
+    filled, expired, totals, status = asyncio.run(run())
+    assert filled[0]["license_keys"] == ["k1"]
+    assert expired == []
+    assert totals == {"committed": 0, "extended": 0, "released": 0}
+    assert status == "reserved"
+
+
+def test_dead_email_requeued_in_between_keeps_its_keys(store, monkeypatch):
+    outbox = get_outbox_store()
+    cancel_dead = outbox.cancel_dead
+
+    async def requeue_then_cancel(ids):
+        await outbox.requeue_dead(ids)  # An operator requeues the dead letter first
+        return await cancel_dead(ids)
+
+    monkeypatch.setattr(outbox, "cancel_dead", requeue_then_cancel)
+
+    async def run():
+        keys, _ = await _claim("6")
+        await outbox.mark_failed((await get_ledger_store().for_order("6"))[0]["outbox_id"], "timeout", None)
+        return await reservations.sweep(), await _status(keys[0]), await outbox.stats()
+
+    totals, status, stats = asyncio.run(run())
+    assert totals == {"committed": 0, "extended": 1, "released": 0}
+    assert status == "reserved"
+    assert stats == {"pending": 1}
+
+
+def test_dead_email_resent_in_between_keeps_its_keys(store, monkeypatch):
+    ledger = get_ledger_store()
+    mark_released = ledger.mark_released
+
+    async def resend_then_mark(outbox_ids):
+        resends = [(issuance_id, "customer@example.com", "message") for issuance_id in outbox_ids]
+        await ledger.enqueue_resends("license_resend", resends)  # An admin resend lands first
+        return await mark_released(outbox_ids)
+
+    monkeypatch.setattr(ledger, "mark_released", resend_then_mark)
+
+    async def run():
+        keys, outbox_id = await _claim("7")
+        await get_outbox_store().mark_failed(outbox_id, "timeout", None)
+        return (
+            await reservations.sweep(),
+            await _status(keys[0]),
+            await ledger.for_order("7"),
+            await get_key_store().pending_backorders("7")
+        )
+
+    totals, status, issuances, pending = asyncio.run(run())
+    assert totals == {"committed": 0, "extended": 1, "released": 0}
+    assert status == "reserved"
+    assert issuances[0]["released_at"] is None
+    assert pending == []
@@ -0,0 +1,147 @@
+"""CircuitBreaker state transitions, backoff jitter bounds and retry_async."""
+import asyncio
+import pytest
+from app.utils import retry
+from app.utils.retry import CircuitBreaker, CircuitOpenError, backoff_delay, retry_async
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retry, "time", clock)
+    return clock
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # Resets the count: failures must be consecutive
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 9.9
+    assert breaker.state == "open"
+    clock.now += 0.1
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # The trial is still in flight
+
+
+def test_successful_trial_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_failed_trial_reopens_for_a_full_period(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()  # One failure is enough once the circuit has opened
+    assert breaker.state == "open"
+    clock.now += 10
+    assert breaker.state == "half-open" and breaker.allow()
+
+
+def test_released_trial_can_be_retried(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.release_trial()
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("attempt,cap", [(1, 0.5), (2, 1.0), (3, 2.0), (6, 5.0), (30, 5.0)])
+def test_backoff_is_full_jitter_below_the_capped_exponential(attempt, cap):
+    delays = [backoff_delay(attempt, base_delay=0.5, max_delay=5.0) for _ in range(500)]
+    assert all(0 <= delay <= cap for delay in delays)
+    assert max(delays) > cap * 0.8 and min(delays) < cap * 0.2
+
+
+def _flaky(failures: int):
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise ConnectionError("refused")
+        return "sent"
+
+    return operation, calls
+
+
+def test_retries_until_success():
+    operation, calls = _flaky(2)
+    stats = {}
+    result = asyncio.run(retry_async(operation, max_attempts=3, base_delay=0, max_delay=0, stats=stats))
+    assert result == "sent"
+    assert len(calls) == 3
+    assert (stats["attempts"], stats["failures"], stats["retries"], stats["successes"]) == (3, 2, 2, 1)
+
+
+def test_raises_the_last_error_when_attempts_run_out():
+    operation, calls = _flaky(5)
+    with pytest.raises(ConnectionError):
+        asyncio.run(retry_async(operation, max_attempts=2, base_delay=0, max_delay=0))
+    assert len(calls) == 2
+
+
+def test_open_circuit_fails_fast_without_calling(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    operation, calls = _flaky(10)
+    stats = {}
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(retry_async(operation, 5, 0, 0, breaker=breaker, stats=stats))
+    assert len(calls) == 2
+    assert stats["circuit_rejected"] == 1
+
+
+def test_cancelled_trial_frees_the_half_open_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+
+    async def run():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        task = asyncio.create_task(retry_async(hang, 1, 0, 0, breaker=breaker))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.state == "half-open"
+    assert breaker.allow()
@@ -0,0 +1,100 @@
+"""Webhook signature and size checks, and the order payload projection."""
+import asyncio
+import json
+import pytest
+from starlette.requests import Request
+from app.utils.shopify import WebhookRejected, WebhookVerifier, parse_order, sign_webhook
+
+SECRET = "test-secret"
+
+
+def _request(chunks, headers) -> Request:
+    """A request whose body arrives as `chunks`, recording how many were read."""
+    pending = list(chunks)
+
+    async def receive():
+        body = pending.pop(0) if pending else b""
+        return {"type": "http.request", "body": body, "more_body": bool(pending)}
+
+    request = Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/webhook/order/paid",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    }, receive)
+    request.unread = pending
+    return request
+
+
+def _read(chunks, headers, max_body_bytes: int = 1024) -> bytes:
+    return asyncio.run(WebhookVerifier(SECRET, max_body_bytes).read_verified(_request(chunks, headers)))
+
+
+def _rejection(chunks, headers, max_body_bytes: int = 1024) -> WebhookRejected:
+    with pytest.raises(WebhookRejected) as rejected:
+        _read(chunks, headers, max_body_bytes)
+    return rejected.value
+
+
+def test_signed_body_is_returned_whole():
+    body = b'{"order_number": 1}'
+    assert _read([body[:5], body[5:]], {"X-Shopify-Hmac-SHA256": sign_webhook(body, SECRET)}) == body
+
+
+@pytest.mark.parametrize("headers", [
+    {},
+    {"X-Shopify-Hmac-SHA256": "not base64!"},
+    {"X-Shopify-Hmac-SHA256": "c2hvcnQ="},  # Valid base64, wrong digest length
+    {"X-Shopify-Hmac-SHA256": sign_webhook(b"another body", SECRET)},
+    {"X-Shopify-Hmac-SHA256": sign_webhook(b"body", "wrong-secret")}
+])
+def test_bad_or_missing_signature_is_401(headers):
+    rejected = _rejection([b"body"], headers)
+    assert rejected.status_code == 401
+
+
+def test_content_length_over_limit_is_413_before_reading():
+    body = b"x" * 100
+    request = _request([body], {"X-Shopify-Hmac-SHA256": sign_webhook(body, SECRET), "Content-Length": "100"})
+    with pytest.raises(WebhookRejected) as rejected:
+        asyncio.run(WebhookVerifier(SECRET, max_body_bytes=50).read_verified(request))
+    assert rejected.value.status_code == 413
+    assert request.unread == [body]
+
+
+def test_chunked_body_growing_past_limit_is_413_mid_stream():
+    chunks = [b"x" * 30] * 5
+    request = _request(chunks, {"X-Shopify-Hmac-SHA256": sign_webhook(b"".join(chunks), SECRET)})
+    with pytest.raises(WebhookRejected) as rejected:
+        asyncio.run(WebhookVerifier(SECRET, max_body_bytes=50).read_verified(request))
+    assert rejected.value.status_code == 413
+    assert len(request.unread) == 3  # Stopped at the second chunk
+
+
+def test_parse_order_keeps_only_the_fields_used():
+    body = json.dumps({
+        "order_number": 1001,
+        "email": "customer@example.com",
+        "billing_address": {"city": "Berlin"},
+        "line_items": [
+            {"product_id": 7, "variant_id": 8, "sku": "PRO-1", "title": "Pro", "quantity": 2, "price": "9.00"},
+            {"title": "Gift card", "quantity": 1, "tax_lines": []}
+        ]
+    }).encode()
+    assert parse_order(body) == {
+        "order_number": 1001,
+        "line_items": [
+            {"product_id": 7, "variant_id": 8, "sku": "PRO-1", "title": "Pro", "quantity": 2},
+            {"title": "Gift card", "quantity": 1}
+        ]
+    }
+
+
+def test_parse_order_tolerates_missing_line_items():
+    assert parse_order(b'{"order_number": 5, "line_items": null}') == {"order_number": 5, "line_items": []}
+
+
+@pytest.mark.parametrize("body", [b'{"id": 1}', b"[1, 2]"])
+def test_parse_order_requires_an_order_number(body):
+    with pytest.raises(ValueError, match="no order_number"):
+        parse_order(body)
@@ -0,0 +1,110 @@
+"""Ed25519-signed keys: signing, offline verification and the revocation blob."""
+import asyncio
+import base64
+import httpx
+import pytest
+import main
+from app.config import get_settings
+from app.services import license_service
+from app.utils.signed_keys import (
+    SERIAL_SIZE, LicenseSigner, build_revocation_list, decode_signed_key, generate_signing_key,
+    is_revoked, verify_signed_key
+)
+
+
+@pytest.fixture(scope="module")
+def signer() -> LicenseSigner:
+    return LicenseSigner(generate_signing_key())
+
+
+def _tamper(key: str, index: int) -> str:
+    """Change one base32 character of the key body."""
+    prefix, body = key.split("-", 1)
+    body = body[:index] + ("A" if body[index] != "A" else "B") + body[index + 1:]
+    return f"{prefix}-{body}"
+
+
+def test_round_trip(signer):
+    key = signer.sign("PRO", order_number="1001", expires_at=2000000000.5)
+    decoded = verify_signed_key(key, signer.public_key)
+    assert key.startswith("PRO-")
+    assert decoded["prefix"] == "PRO"
+    assert decoded["order_number"] == "1001"
+    assert decoded["expires_at"] == 2000000000
+    assert len(decoded["serial"]) == SERIAL_SIZE
+
+
+def test_batch_keys_have_distinct_serials(signer):
+    keys = signer.sign_batch("BAS", 50)
+    serials = {verify_signed_key(key, signer.public_key)["serial"] for key in keys}
+    assert len(serials) == 50
+    assert decode_signed_key(keys[0])["order_number"] is None
+    assert decode_signed_key(keys[0])["expires_at"] is None
+
+
+@pytest.mark.parametrize("index", [0, 5, 20, 60, 120])  # Header, serial, order id and signature characters
+def test_tampered_key_fails_verification(signer, index):
+    key = signer.sign("PRO", order_number="1001")
+    assert verify_signed_key(_tamper(key, index), signer.public_key) is None
+
+
+def test_prefix_cannot_be_swapped(signer):
+    key = signer.sign("BAS")
+    assert verify_signed_key("ENT-" + key.split("-", 1)[1], signer.public_key) is None
+
+
+def test_other_public_key_rejects(signer):
+    key = signer.sign("PRO")
+    assert verify_signed_key(key, LicenseSigner(generate_signing_key()).public_key) is None
+
+
+@pytest.mark.parametrize("key", ["", "PRO", "PRO-", "PRO-not base32!", "PRO-MFRGG", "BASIC-0001-ABCD"])
+def test_non_signed_keys_decode_to_none(key):
+    assert decode_signed_key(key) is None
+
+
+def test_order_id_must_fit_its_length_byte(signer):
+    with pytest.raises(ValueError):
+        signer.sign("PRO", order_number="x" * 256)
+
+
+def test_revocation_blob_is_sorted_and_deduplicated():
+    serials = [bytes([n]) * SERIAL_SIZE for n in (9, 3, 7, 3)]
+    blob = build_revocation_list(serials)
+    assert blob == b"".join(sorted(set(serials)))
+    assert all(is_revoked(serial, blob) for serial in serials)
+    assert not is_revoked(bytes([5]) * SERIAL_SIZE, blob)
+    assert not is_revoked(bytes([10]) * SERIAL_SIZE, blob)
+    assert not is_revoked(bytes([3]) * SERIAL_SIZE, b"")
+
+
+async def _get(path: str, **headers) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        return await client.get(path, headers=headers)
+
+
+def test_public_key_endpoint_without_signing_key(db):
+    response = asyncio.run(_get("/licenses/public-key"))
+    assert response.status_code == 503
+
+
+def test_revoked_signed_key_is_listed(db, monkeypatch):
+    monkeypatch.setattr(get_settings(), "LICENSE_SIGNING_KEY", generate_signing_key())
+    monkeypatch.setattr(license_service, "_signer", None)
+
+    async def run():
+        keys = await license_service.issue_signed_keys("pro", "1001", 2)
+        before = await _get("/licenses/revocations")
+        assert await license_service.revoke_license_key(keys[0])
+        after = await _get("/licenses/revocations")
+        cached = await _get("/licenses/revocations", **{"If-None-Match": after.headers["ETag"]})
+        return keys, await _get("/licenses/public-key"), before, after, cached
+
+    keys, public_key, before, after, cached = asyncio.run(run())
+    public_key = base64.b64decode(public_key.json()["public_key"])
+    revoked, kept = (verify_signed_key(key, public_key)["serial"] for key in keys)
+    assert before.content == b""
+    assert is_revoked(revoked, after.content)
+    assert not is_revoked(kept, after.content)
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert cached.status_code == 304
@@ -0,0 +1,174 @@
+"""SMTPPool against a local aiosmtpd server: reuse, recycling, NOOP keepalive
+and recovery from dropped sessions."""
+import asyncio
+import socket
+from email.message import EmailMessage
+import pytest
+from aiosmtpd.controller import Controller
+from app.services.smtp_pool import SMTPPool
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.peers = []  # Client address of each accepted message
+        self.noops = 0
+        self.reject_next = False
+
+    async def handle_NOOP(self, server, session, envelope, arg):
+        self.noops += 1
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reject_next:
+            self.reject_next = False
+            return "421 Service shutting down"
+        self.peers.append(session.peer)
+        return "250 Message accepted"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """An aiosmtpd controller that can be restarted on the same port."""
+
+    def __init__(self):
+        self.handler = RecordingHandler()
+        self.hostname = "127.0.0.1"
+        self.port = _free_port()
+        self._controller = None
+
+    def start(self) -> None:
+        self._controller = Controller(self.handler, hostname=self.hostname, port=self.port)
+        self._controller.start()
+
+    def stop(self) -> None:
+        self._controller.stop()
+
+    def restart(self) -> None:
+        # Stopping the server drops every open session.
+        self.stop()
+        self.start()
+
+
+@pytest.fixture
+def smtp_server():
+    server = Server()
+    server.start()
+    yield server
+    server.stop()
+
+
+def _message(n: int = 0) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "licenses@example.com"
+    message["To"] = "customer@example.com"
+    message["Subject"] = f"License {n}"
+    message.set_content("key")
+    return message
+
+
+def _pool(server: Server, **options) -> SMTPPool:
+    return SMTPPool(server.hostname, server.port, username="", password="", **options)
+
+
+async def _send(pool: SMTPPool, count: int) -> None:
+    for n in range(count):
+        await pool.send_message(_message(n))
+
+
+def test_reuses_one_session_for_sequential_sends(smtp_server):
+    async def run():
+        pool = _pool(smtp_server)
+        await _send(pool, 5)
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(smtp_server.handler.peers) == 5
+    assert len(set(smtp_server.handler.peers)) == 1
+
+
+def test_recycles_session_after_max_messages(smtp_server):
+    async def run():
+        pool = _pool(smtp_server, max_messages=2)
+        await _send(pool, 5)
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(set(smtp_server.handler.peers)) == 3
+
+
+def test_noop_checks_idle_session_before_reuse(smtp_server):
+    async def run():
+        pool = _pool(smtp_server, keepalive_seconds=0)
+        await _send(pool, 3)
+        await pool.close()
+
+    asyncio.run(run())
+    assert smtp_server.handler.noops == 2
+    assert len(set(smtp_server.handler.peers)) == 1
+
+
+def test_no_noop_while_session_is_fresh(smtp_server):
+    async def run():
+        pool = _pool(smtp_server, keepalive_seconds=60)
+        await _send(pool, 3)
+        await pool.close()
+
+    asyncio.run(run())
+    assert smtp_server.handler.noops == 0
+
+
+def test_reconnects_when_keepalive_finds_session_dropped(smtp_server):
+    async def run():
+        pool = _pool(smtp_server, keepalive_seconds=0)
+        await _send(pool, 1)
+        await asyncio.to_thread(smtp_server.restart)
+        await _send(pool, 1)
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(smtp_server.handler.peers) == 2
+    assert len(set(smtp_server.handler.peers)) == 2
+
+
+def test_reconnects_when_server_closed_session(smtp_server):
+    async def run():
+        pool = _pool(smtp_server, keepalive_seconds=60)
+        await _send(pool, 1)
+        await asyncio.to_thread(smtp_server.restart)
+        await asyncio.sleep(0.1)  # Let the client read the server closing the session
+        await _send(pool, 1)
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(set(smtp_server.handler.peers)) == 2
+    assert smtp_server.handler.noops == 0
+
+
+def test_session_is_not_reused_after_failed_send(smtp_server):
+    async def run():
+        pool = _pool(smtp_server, keepalive_seconds=60)
+        await _send(pool, 1)
+        smtp_server.handler.reject_next = True
+        with pytest.raises(Exception):
+            await _send(pool, 1)
+        await _send(pool, 1)
+        await pool.close()
+
+    asyncio.run(run())
+    assert len(smtp_server.handler.peers) == 2
+    assert len(set(smtp_server.handler.peers)) == 2
+
+
+def test_closed_pool_refuses_sends(smtp_server):
+    async def run():
+        pool = _pool(smtp_server)
+        await pool.close()
+        with pytest.raises(Exception, match="closed"):
+            await _send(pool, 1)
+
+    asyncio.run(run())
@@ -0,0 +1,144 @@
+"""LicenseVerifier answers from a TTL cache, invalidated on revocation."""
+import asyncio
+import pytest
+from app.services import verification
+from app.services.verification import LicenseVerifier, TTLCache
+from app.storage.key_store import get_key_store
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(verification, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def lookups(db, monkeypatch):
+    """Store lookups made by the verifier, by key."""
+    store = get_key_store()
+    lookup = store.lookup
+    calls = []
+
+    async def counted(license_key):
+        calls.append(license_key)
+        return await lookup(license_key)
+
+    monkeypatch.setattr(store, "lookup", counted)
+    return calls
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = TTLCache(max_size=10)
+    cache.set("a", 1, ttl=5)
+    clock.now += 5
+    assert cache.get("a") == 1
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.get("a")
+    cache.set("c", 3, ttl=60)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def _issue(key: str) -> None:
+    async def run():
+        store = get_key_store()
+        await store.add("basic", [key])
+        await store.commit((await store.claim("1", {"basic": 1}))["basic"])
+
+    asyncio.run(run())
+
+
+def test_issued_key_is_cached_for_ttl(clock, lookups):
+    _issue("k1")
+    verifier = LicenseVerifier(max_size=10, ttl=30, negative_ttl=5)
+
+    async def run():
+        first = await verifier.verify("k1")
+        clock.now += 30
+        second = await verifier.verify("k1")
+        clock.now += 1
+        return first, second, await verifier.verify("k1")
+
+    results = asyncio.run(run())
+    assert all(result["is_valid"] for result in results)
+    assert lookups == ["k1", "k1"]  # Looked up again once the TTL ran out
+
+
+def test_unknown_key_is_cached_for_negative_ttl(clock, lookups):
+    verifier = LicenseVerifier(max_size=10, ttl=30, negative_ttl=5)
+
+    async def run():
+        first = await verifier.verify("missing")
+        await verifier.verify("missing")
+        clock.now += 6
+        return first, await verifier.verify("missing")
+
+    first, last = asyncio.run(run())
+    assert first["success"] is False and last["success"] is False
+    assert lookups == ["missing", "missing"]
+
+
+def test_key_in_inventory_is_unknown(lookups):
+    asyncio.run(get_key_store().add("basic", ["k1"]))
+    result = asyncio.run(LicenseVerifier(max_size=10, ttl=30, negative_ttl=5).verify("k1"))
+    assert result["success"] is False
+
+
+def test_revocation_invalidates_the_cached_record(clock, lookups):
+    _issue("k1")
+    verifier = LicenseVerifier(max_size=10, ttl=3600, negative_ttl=5)
+
+    async def run():
+        before = await verifier.verify("k1")
+        assert await verifier.revoke("k1")
+        return before, await verifier.verify("k1")
+
+    before, after = asyncio.run(run())
+    assert before["is_valid"] is True
+    assert after["is_valid"] is False and after["data"]["revoked"] is True
+    assert lookups == ["k1", "k1"]
+
+
+def test_cached_key_still_expires_on_time(clock, db, monkeypatch):
+    monkeypatch.setitem(verification.settings.LICENSE_CATEGORIES, "basic", {"prefix": "BAS", "validity_days": 1})
+    monkeypatch.setattr(get_key_store(), "lookup", _claimed_at(clock.now))
+    verifier = LicenseVerifier(max_size=10, ttl=7 * 86400, negative_ttl=5)
+
+    async def run():
+        fresh = await verifier.verify("k1")
+        clock.now += 86401
+        return fresh, await verifier.verify("k1")
+
+    fresh, stale = asyncio.run(run())
+    assert fresh["is_valid"] is True
+    assert stale["is_valid"] is False and stale["data"]["expired"] is True
+
+
+def _claimed_at(claimed_at: float):
+    async def lookup(license_key):
+        return {
+            "license_key": license_key, "category": "basic", "status": "claimed", "order_number": "1",
+            "created_at": claimed_at, "claimed_at": claimed_at, "revoked_at": None
+        }
+
+    return lookup